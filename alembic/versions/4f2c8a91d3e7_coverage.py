@@ -0,0 +1,65 @@
+"""coverage
+
+Revision ID: 4f2c8a91d3e7
+Revises: e38d19ff67a8
+Create Date: 2026-10-17 10:12:41.508213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f2c8a91d3e7'
+down_revision: Union[str, Sequence[str], None] = 'e38d19ff67a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (dataset, tf, table, step ms) indexed from the existing rows
+SOURCES = [
+    ("candles", "1m", "candles_1m", 60_000),
+    ("candles", "5m", "candles_5m", 300_000),
+    ("candles", "15m", "candles_15m", 900_000),
+    ("candles", "1h", "candles_1h", 3_600_000),
+    ("candles", "4h", "candles_4h", 14_400_000),
+    ("candles", "1d", "candles_1d", 86_400_000),
+    ("oi", "5m", "open_interest_5m", 300_000),
+    ("oi", "15m", "open_interest_15m", 900_000),
+    ("oi", "1h", "open_interest_1h", 3_600_000),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('coverage',
+    sa.Column('dataset', sa.String(length=20), nullable=False),
+    sa.Column('tf', sa.String(length=10), nullable=False),
+    sa.Column('symbol', sa.String(length=20), nullable=False),
+    sa.Column('start_time', sa.BigInteger(), nullable=False),
+    sa.Column('end_time', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('dataset', 'tf', 'symbol', 'start_time')
+    )
+
+    # one gaps-and-islands pass per table (same as coverage.rebuild)
+    for dataset, tf, table, step in SOURCES:
+        op.execute(f"""
+            INSERT INTO coverage (dataset, tf, symbol, start_time, end_time)
+            SELECT '{dataset}', '{tf}', symbol, MIN(open_time), MAX(open_time)
+            FROM (
+                SELECT
+                    symbol,
+                    open_time,
+                    open_time - ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY open_time) * {step} AS island
+                FROM {table}
+            ) t
+            GROUP BY symbol, island
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('coverage')
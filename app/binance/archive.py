@@ -0,0 +1,412 @@
+import os
+import json
+import argparse
+from datetime import datetime, timezone
+
+import pandas as pd
+from sqlalchemy import text
+
+from app.db import SessionLocal, engine
+from app.config import TIMEFRAMES
+from app.binance import coverage
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Parquet archive (research / backtests)
+# --------------------------------------------------
+# Closed candles, OI and funding are exported to
+#
+#   <ARCHIVE_DIR>/<dataset>/<tf>/<symbol>/<YYYY-MM>.parquet
+#
+# one zstd Parquet file per symbol and UTC month, sorted by time.
+# Readers open only the months of the requested range, memory
+# mapped, and never touch Postgres.
+#
+# Incremental runs, per (dataset, tf, symbol): each month has a
+# signature — the coverage ranges clipped to the month and to the
+# last closed bar (funding, without coverage: first / last / rows of
+# the month). _manifest.json next to the partitions keeps the
+# signature each month was exported with; a month is (re)written only
+# when its signature changed, i.e. bars were added inside it (the
+# open month, backfilled holes). Months inside coverage holes have no
+# signature and are never queried; empty exports are recorded too.
+#
+# Each file is written to a temp name and renamed, so readers never
+# see a partial month.
+#
+# pyarrow comes with the `archive` extra (pip install ".[archive]"):
+# only this module needs it, imported lazily.
+# --------------------------------------------------
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join("data", "archive"))
+ARCHIVE_COMPRESSION = "zstd"
+
+FUNDING_TF = "8h"
+
+MANIFEST_NAME = "_manifest.json"
+
+CANDLE_COLUMNS = [
+    "open_time",
+    "close_time",
+    "open_price",
+    "high_price",
+    "low_price",
+    "close_price",
+    "base_volume",
+    "quote_volume",
+    "taker_buy_base_volume",
+    "taker_buy_quote_volume",
+    "trade_count",
+]
+
+OI_COLUMNS = ["open_time", "open_interest", "oi_notional"]
+
+FUNDING_COLUMNS = ["funding_time", "funding_rate", "mark_price"]
+
+logger = get_logger("market_data.binance.archive")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError('The Parquet archive needs pyarrow (pip install ".[archive]")') from e
+    return pyarrow
+
+
+def sources():
+    """
+    (dataset, tf, table, time column, columns) of every archived table.
+    """
+    from app.binance.scripts.oi_sync import OI_TABLES
+
+    result = [
+        (coverage.DATASET_CANDLES, tf, config["table"], "open_time", CANDLE_COLUMNS)
+        for tf, config in TIMEFRAMES.items()
+    ]
+    result += [
+        (coverage.DATASET_OI, tf, table, "open_time", OI_COLUMNS)
+        for tf, table in OI_TABLES.items()
+    ]
+    result.append(("funding", FUNDING_TF, "funding_rate_8h", "funding_time", FUNDING_COLUMNS))
+
+    return result
+
+
+# --------------------------------------------------
+# Months
+# --------------------------------------------------
+def month_of(ms):
+    dt = datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+    return dt.year, dt.month
+
+
+def month_start(year, month):
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def months_between(first_ms, last_ms):
+    month, last = month_of(first_ms), month_of(last_ms)
+    while month <= last:
+        yield month
+        month = next_month(*month)
+
+
+def partition_dir(dataset, tf, symbol, root=ARCHIVE_DIR):
+    return os.path.join(root, dataset, tf, symbol)
+
+
+def partition_path(dataset, tf, symbol, month, root=ARCHIVE_DIR):
+    return os.path.join(partition_dir(dataset, tf, symbol, root), "%04d-%02d.parquet" % month)
+
+
+def archived_months(dataset, tf, symbol, root=ARCHIVE_DIR):
+    """
+    Sorted (year, month) of the archived partitions.
+    """
+    path = partition_dir(dataset, tf, symbol, root)
+    if not os.path.isdir(path):
+        return []
+
+    months = []
+    for name in os.listdir(path):
+        if name.endswith(".parquet"):
+            year, month = name[:-len(".parquet")].split("-")
+            months.append((int(year), int(month)))
+
+    return sorted(months)
+
+
+def month_key(month):
+    return "%04d-%02d" % month
+
+
+# --------------------------------------------------
+# Manifest (export watermarks)
+# --------------------------------------------------
+def manifest_path(dataset, tf, symbol, root=ARCHIVE_DIR):
+    return os.path.join(partition_dir(dataset, tf, symbol, root), MANIFEST_NAME)
+
+
+def load_manifest(dataset, tf, symbol, root=ARCHIVE_DIR):
+    """
+    {"YYYY-MM": {"signature": ..., "rows": n}} of exported months.
+    """
+    try:
+        with open(manifest_path(dataset, tf, symbol, root)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(dataset, tf, symbol, manifest, root=ARCHIVE_DIR):
+    path = manifest_path(dataset, tf, symbol, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# --------------------------------------------------
+# Export
+# --------------------------------------------------
+def month_signatures(ranges, until):
+    """
+    {month: [[start, end], ...]} of stored ranges clipped to each
+    month and to `until`. Months inside coverage holes are absent.
+    """
+    signatures = {}
+
+    for start, end in sorted(ranges):
+        end = min(end, until)
+        if end < start:
+            continue
+
+        for month in months_between(start, end):
+            lo = month_start(*month)
+            hi = month_start(*next_month(*month)) - 1
+            signatures.setdefault(month, []).append([max(start, lo), min(end, hi)])
+
+    return signatures
+
+
+def symbol_signatures(db, dataset, tf, table, time_column, until):
+    """
+    {symbol: {month: signature}} of stored data up to `until`.
+
+    Coverage datasets: the clipped coverage ranges, which only
+    change inside a month when bars are added there (merges rewrite
+    updated_at of the whole island, so it can't be used). Funding has
+    no coverage: [[first, last, rows]] per month.
+    """
+    if dataset == "funding":
+        rows = db.execute(text(f"""
+            SELECT symbol, MIN({time_column}), MAX({time_column}), COUNT(*)
+            FROM {table}
+            WHERE {time_column} <= :until
+            GROUP BY symbol, date_trunc('month', to_timestamp({time_column} / 1000.0) AT TIME ZONE 'UTC')
+        """), {"until": until}).fetchall()
+
+        signatures = {}
+        for symbol, first, last, count in rows:
+            signatures.setdefault(symbol, {})[month_of(first)] = [[int(first), int(last), int(count)]]
+
+        return signatures
+
+    rows = db.execute(text("""
+        SELECT symbol, start_time, end_time
+        FROM coverage
+        WHERE dataset = :dataset AND tf = :tf AND start_time <= :until
+    """), {"dataset": dataset, "tf": tf, "until": until}).fetchall()
+
+    ranges = {}
+    for symbol, start, end in rows:
+        ranges.setdefault(symbol, []).append((int(start), int(end)))
+
+    return {symbol: month_signatures(r, until) for symbol, r in ranges.items()}
+
+
+def months_to_write(signatures, manifest):
+    """
+    Months whose stored ranges changed since they were exported.
+    """
+    return [
+        month for month, signature in sorted(signatures.items())
+        if manifest.get(month_key(month), {}).get("signature") != signature
+    ]
+
+
+def write_month(pa, dataset, tf, symbol, table, time_column, columns, month, until, root=ARCHIVE_DIR):
+    """
+    Export one month; returns rows written (0: nothing to write).
+    """
+    lo = month_start(*month)
+    hi = min(month_start(*next_month(*month)) - 1, until)
+
+    closed = " AND is_closed IS NOT FALSE" if dataset == coverage.DATASET_CANDLES else ""
+
+    with engine.connect() as conn:
+        frame = pd.read_sql(
+            text(f"""
+                SELECT {", ".join(columns)}
+                FROM {table}
+                WHERE symbol = :symbol AND {time_column} BETWEEN :lo AND :hi{closed}
+                ORDER BY {time_column}
+            """),
+            conn,
+            params={"symbol": symbol, "lo": lo, "hi": hi},
+        )
+
+    if frame.empty:
+        return 0
+
+    path = partition_path(dataset, tf, symbol, month, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    pa.parquet.write_table(
+        pa.Table.from_pandas(frame, preserve_index=False),
+        tmp,
+        compression=ARCHIVE_COMPRESSION,
+    )
+    os.replace(tmp, path)
+
+    return len(frame)
+
+
+def archive_source(dataset, tf, table, time_column, columns, until, symbols=None, root=ARCHIVE_DIR):
+    """
+    Incrementally export one table. Returns (months, rows) written.
+    """
+    pa = _pyarrow()
+
+    db = SessionLocal()
+    try:
+        signatures = symbol_signatures(db, dataset, tf, table, time_column, until)
+    finally:
+        db.close()
+
+    months_written = rows_written = 0
+
+    for symbol, symbol_signatures_ in sorted(signatures.items()):
+        if symbols and symbol not in symbols:
+            continue
+
+        manifest = load_manifest(dataset, tf, symbol, root)
+        changed = months_to_write(symbol_signatures_, manifest)
+
+        for month in changed:
+            rows = write_month(pa, dataset, tf, symbol, table, time_column, columns, month, until, root)
+
+            # recorded even when empty, so the month isn't queried again
+            manifest[month_key(month)] = {"signature": symbol_signatures_[month], "rows": rows}
+
+            if rows:
+                months_written += 1
+                rows_written += rows
+
+        if changed:
+            save_manifest(dataset, tf, symbol, manifest, root)
+
+    logger.info("Archived %s %s | months=%d rows=%d", dataset, tf, months_written, rows_written)
+    return months_written, rows_written
+
+
+def run_archive(datasets=None, tfs=None, symbols=None, now_ms=None, root=ARCHIVE_DIR):
+    """
+    Incremental export of every source; only bars closed by now_ms.
+    """
+    now_ms = now_ms or int(datetime.now(timezone.utc).timestamp() * 1000)
+
+    for dataset, tf, table, time_column, columns in sources():
+        if datasets and dataset not in datasets:
+            continue
+        if tfs and tf not in tfs:
+            continue
+
+        tf_ms = TIMEFRAMES[tf]["tf_ms"] if dataset == coverage.DATASET_CANDLES else 0
+        until = (now_ms // tf_ms * tf_ms - tf_ms) if tf_ms else now_ms
+
+        archive_source(dataset, tf, table, time_column, columns, until, symbols, root)
+
+
+# --------------------------------------------------
+# Readers
+# --------------------------------------------------
+def read_table(dataset, tf, symbol, start=None, end=None, columns=None, root=ARCHIVE_DIR):
+    """
+    pyarrow Table of [start, end] (ms, inclusive) from the memory-
+    mapped monthly partitions.
+    """
+    pa = _pyarrow()
+    import pyarrow.compute as pc
+
+    archived = archived_months(dataset, tf, symbol, root)
+    if start is not None:
+        archived = [m for m in archived if m >= month_of(start)]
+    if end is not None:
+        archived = [m for m in archived if m <= month_of(end)]
+
+    time_column = "funding_time" if dataset == "funding" else "open_time"
+    if columns is not None and time_column not in columns:
+        columns = [time_column] + list(columns)
+
+    tables = [
+        pa.parquet.read_table(partition_path(dataset, tf, symbol, m, root), columns=columns, memory_map=True)
+        for m in archived
+    ]
+
+    if not tables:
+        return None
+
+    table = pa.concat_tables(tables)
+
+    if start is not None:
+        table = table.filter(pc.greater_equal(table[time_column], start))
+    if end is not None:
+        table = table.filter(pc.less_equal(table[time_column], end))
+
+    return table
+
+
+def read_frame(dataset, tf, symbol, start=None, end=None, columns=None, root=ARCHIVE_DIR):
+    """
+    pandas DataFrame of an archived range (empty if nothing archived).
+    """
+    table = read_table(dataset, tf, symbol, start, end, columns, root)
+    return pd.DataFrame() if table is None else table.to_pandas()
+
+
+def read_arrays(dataset, tf, symbol, start=None, end=None, columns=None, root=ARCHIVE_DIR):
+    """
+    {column: numpy array} of an archived range.
+    """
+    table = read_table(dataset, tf, symbol, start, end, columns, root)
+    if table is None:
+        return {}
+    return {name: table[name].to_numpy() for name in table.column_names}
+
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Export closed candles / OI / funding to Parquet")
+    parser.add_argument("--dataset", action="append", choices=[coverage.DATASET_CANDLES, coverage.DATASET_OI, "funding"])
+    parser.add_argument("--tf", action="append")
+    parser.add_argument("--symbol", action="append")
+    parser.add_argument("--root", default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    run_archive(args.dataset, args.tf, args.symbol, root=args.root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import struct
+from functools import lru_cache
+
+from app.binance.scripts.helpers import open_time_ms_to_ist
+
+
+# --------------------------------------------------
+# Compact candle record for the WS hot path
+# --------------------------------------------------
+# One object per closed kline, passed through the queue, the HTF
+# aggregator and the batch writer. It only becomes a DB row dict
+# (to_row) at flush time. All symbols close on the same minute, so
+# the IST timestamp is cached per open_time.
+# --------------------------------------------------
+
+lk_at_for = lru_cache(maxsize=4096)(open_time_ms_to_ist)
+
+# Fixed binary layout used by the candle journal (None → -1 / NaN):
+# candle fields + received / parsed / enqueued stage timestamps
+PACKED = struct.Struct("<20s4sqqqqqddddddddq?ddd")
+PACKED_V1 = struct.Struct("<20s4sqqqqqddddddddq?")
+
+# Column order accepted by CandleRecord.from_db_row
+DB_COLUMNS = [
+    "symbol",
+    "interval",
+    "open_time",
+    "close_time",
+    "event_time",
+    "first_trade_id",
+    "last_trade_id",
+    "open_price",
+    "high_price",
+    "low_price",
+    "close_price",
+    "base_volume",
+    "quote_volume",
+    "taker_buy_base_volume",
+    "taker_buy_quote_volume",
+    "trade_count",
+    "is_closed",
+]
+
+
+NAN = float("nan")
+
+
+class CandleRecord:
+
+    __slots__ = (
+        "symbol",
+        "interval",
+        "open_time",
+        "close_time",
+        "event_time",
+        "first_trade_id",
+        "last_trade_id",
+        "open_price",
+        "high_price",
+        "low_price",
+        "close_price",
+        "base_volume",
+        "quote_volume",
+        "taker_buy_base_volume",
+        "taker_buy_quote_volume",
+        "trade_count",
+        "is_closed",
+        # aggregation bookkeeping (source 1m bars folded in)
+        "bar_count",
+        "last_source_open",
+        # ingest stage timestamps, epoch ms (None → not measured)
+        "received_at",
+        "parsed_at",
+        "enqueued_at",
+        "dequeued_at",
+    )
+
+    TIMING = ("received_at", "parsed_at", "enqueued_at", "dequeued_at")
+
+    def __init__(
+        self,
+        symbol,
+        interval,
+        open_time,
+        close_time,
+        event_time,
+        first_trade_id,
+        last_trade_id,
+        open_price,
+        high_price,
+        low_price,
+        close_price,
+        base_volume,
+        quote_volume,
+        taker_buy_base_volume,
+        taker_buy_quote_volume,
+        trade_count,
+        is_closed=True,
+    ):
+        self.symbol = symbol
+        self.interval = interval
+        self.open_time = open_time
+        self.close_time = close_time
+        self.event_time = event_time
+        self.first_trade_id = first_trade_id
+        self.last_trade_id = last_trade_id
+        self.open_price = open_price
+        self.high_price = high_price
+        self.low_price = low_price
+        self.close_price = close_price
+        self.base_volume = base_volume
+        self.quote_volume = quote_volume
+        self.taker_buy_base_volume = taker_buy_base_volume
+        self.taker_buy_quote_volume = taker_buy_quote_volume
+        self.trade_count = trade_count
+        self.is_closed = is_closed
+        self.bar_count = 1
+        self.last_source_open = open_time
+        self.received_at = None
+        self.parsed_at = None
+        self.enqueued_at = None
+        self.dequeued_at = None
+
+    @classmethod
+    def from_kline(cls, k, event_time):
+        """
+        Build from the `k` object of a kline WS event.
+        """
+        return cls(
+            k["s"],
+            k["i"],
+            k["t"],
+            k["T"],
+            event_time,
+            k["f"],
+            k["L"],
+            float(k["o"]),
+            float(k["h"]),
+            float(k["l"]),
+            float(k["c"]),
+            float(k["v"]),
+            float(k["q"]),
+            float(k["V"]),
+            float(k["Q"]),
+            k["n"],
+            k["x"],
+        )
+
+    @classmethod
+    def from_db_row(cls, row):
+        """
+        Build from a candles_* row selected in DB_COLUMNS order.
+        """
+        record = cls(*row)
+        if record.is_closed is None:
+            record.is_closed = True
+        return record
+
+    # ------------------------------------------
+    # HTF aggregation
+    # ------------------------------------------
+    def start_bucket(self, interval, bucket_open, tf_ms):
+        """
+        New HTF bucket seeded from this (1m) record.
+        """
+        record = CandleRecord(
+            self.symbol,
+            interval,
+            bucket_open,
+            bucket_open + tf_ms - 1,
+            self.event_time,
+            self.first_trade_id,
+            self.last_trade_id,
+            self.open_price,
+            self.high_price,
+            self.low_price,
+            self.close_price,
+            self.base_volume,
+            self.quote_volume,
+            self.taker_buy_base_volume,
+            self.taker_buy_quote_volume,
+            self.trade_count,
+            self.is_closed,
+        )
+        record.last_source_open = self.open_time
+        return record
+
+    def merge(self, other):
+        """
+        Fold a later record of the same bucket into this one (in place).
+        """
+        if other.high_price > self.high_price:
+            self.high_price = other.high_price
+        if other.low_price < self.low_price:
+            self.low_price = other.low_price
+
+        self.close_price = other.close_price
+        self.base_volume += other.base_volume
+        self.quote_volume += other.quote_volume
+        self.taker_buy_base_volume += other.taker_buy_base_volume
+        self.taker_buy_quote_volume += other.taker_buy_quote_volume
+        self.trade_count += other.trade_count
+        self.event_time = other.event_time
+        self.last_trade_id = other.last_trade_id
+        self.bar_count += 1
+        self.last_source_open = other.open_time
+
+    # ------------------------------------------
+    # Checkpoint state
+    # ------------------------------------------
+    def to_state(self):
+        return [getattr(self, f) for f in STATE_FIELDS]
+
+    @classmethod
+    def from_state(cls, values):
+        record = cls.__new__(cls)
+        for f in cls.TIMING:
+            setattr(record, f, None)
+        for f, v in zip(STATE_FIELDS, values):
+            setattr(record, f, v)
+        return record
+
+    def copy_timing(self, other):
+        for f in self.TIMING:
+            setattr(self, f, getattr(other, f))
+
+    # ------------------------------------------
+    # Binary (journal)
+    # ------------------------------------------
+    def to_bytes(self):
+        return PACKED.pack(
+            self.symbol.encode(),
+            self.interval.encode(),
+            self.open_time,
+            self.close_time,
+            -1 if self.event_time is None else self.event_time,
+            -1 if self.first_trade_id is None else self.first_trade_id,
+            -1 if self.last_trade_id is None else self.last_trade_id,
+            self.open_price,
+            self.high_price,
+            self.low_price,
+            self.close_price,
+            self.base_volume,
+            self.quote_volume,
+            self.taker_buy_base_volume,
+            self.taker_buy_quote_volume,
+            self.trade_count,
+            bool(self.is_closed),
+            NAN if self.received_at is None else self.received_at,
+            NAN if self.parsed_at is None else self.parsed_at,
+            NAN if self.enqueued_at is None else self.enqueued_at,
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) == PACKED_V1.size:
+            fields = PACKED_V1.unpack(data) + (NAN, NAN, NAN)
+        else:
+            fields = PACKED.unpack(data)
+
+        (
+            symbol, interval, open_time, close_time, event_time,
+            first_trade_id, last_trade_id, *values, trade_count, is_closed,
+            received_at, parsed_at, enqueued_at,
+        ) = fields
+
+        record = cls(
+            symbol.rstrip(b"\0").decode(),
+            interval.rstrip(b"\0").decode(),
+            open_time,
+            close_time,
+            None if event_time == -1 else event_time,
+            None if first_trade_id == -1 else first_trade_id,
+            None if last_trade_id == -1 else last_trade_id,
+            *values,
+            trade_count,
+            is_closed,
+        )
+
+        record.received_at = None if received_at != received_at else received_at
+        record.parsed_at = None if parsed_at != parsed_at else parsed_at
+        record.enqueued_at = None if enqueued_at != enqueued_at else enqueued_at
+        return record
+
+    # ------------------------------------------
+    # DB row
+    # ------------------------------------------
+    def to_row(self):
+        return {
+            "event_time": self.event_time,
+            "symbol": self.symbol,
+            "open_time": self.open_time,
+            "lk_at": lk_at_for(self.open_time),
+            "interval": self.interval,
+            "close_time": self.close_time,
+            "first_trade_id": self.first_trade_id,
+            "last_trade_id": self.last_trade_id,
+            "open_price": self.open_price,
+            "high_price": self.high_price,
+            "low_price": self.low_price,
+            "close_price": self.close_price,
+            "base_volume": self.base_volume,
+            "quote_volume": self.quote_volume,
+            "taker_buy_base_volume": self.taker_buy_base_volume,
+            "taker_buy_quote_volume": self.taker_buy_quote_volume,
+            "trade_count": self.trade_count,
+            "is_closed": self.is_closed,
+        }
+
+    def __repr__(self):
+        return f"CandleRecord({self.symbol} {self.interval} {self.open_time})"
+
+
+# checkpointed fields (stage timestamps are per-process only)
+STATE_FIELDS = tuple(f for f in CandleRecord.__slots__ if f not in CandleRecord.TIMING)
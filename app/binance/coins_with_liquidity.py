@@ -1,7 +1,6 @@
-import requests
 import time
-import json
-from app.redis_client import redis_client
+from app.binance.universe import publish_universe
+from app.binance.weight import governed_get
 from app.db import SessionLocal
 from app.models import Symbol
 from sqlalchemy.dialects.postgresql import insert
@@ -13,7 +12,7 @@ BASE_URL = "https://fapi.binance.com/fapi/v1/ticker/24hr"
 ####################
 def get_top_liquid_coins(percent=0.05):
     print("[LIQ] Fetching market tickers...")
-    r = requests.get(BASE_URL, timeout=10)
+    r = governed_get(BASE_URL, timeout=10)
     r.raise_for_status()
 
     parsed = []
@@ -69,8 +68,8 @@ if __name__ == "__main__":
     while True:
         try:
             coins = get_top_liquid_coins()
-            redis_client.set("liquid_coins", json.dumps(coins))
-            print(f"[LIQ] Redis updated with {len(coins)} symbols")
+            added, removed = publish_universe(coins)
+            print(f"[LIQ] Redis updated with {len(coins)} symbols (+{len(added)} -{len(removed)})")
             # update DB
             upsert_symbols(coins)
         except Exception as e:
@@ -0,0 +1,250 @@
+import argparse
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.engine import Connection
+from sqlalchemy.dialects import postgresql
+
+from app.db import engine
+from app.config import TIMEFRAMES
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Coverage index
+# --------------------------------------------------
+# What we hold of a dataset is kept as contiguous ranges of open
+# times per (dataset, tf, symbol) in the `coverage` table:
+#
+#   [start_time, end_time]   both inclusive, every bar in between
+#                            is stored
+#
+# Ranges of a key never overlap or touch (end + step < next start),
+# so "last bar", "is it empty" and "where are the holes" cost
+# O(ranges) instead of a scan over the candle table.
+#
+# Writers call record() inside the transaction that writes the rows,
+# with the (symbol, open_time) keys of the batch. The keys are
+# compressed into runs in Python and merged with one statement:
+#
+#   runs       batch runs (unnest of arrays)
+#   absorbed   DELETE ranges overlapping / adjacent to a run
+#   islands    runs + absorbed ranges, chained by running max(end)
+#   INSERT     one range per island
+#
+# A transaction-scoped advisory lock per (dataset, tf) serializes
+# merges, so concurrent writers can't leave overlapping ranges.
+#
+# Rows that exist without coverage (written before the index, or by
+# a writer that doesn't record) are picked up by rebuild().
+# --------------------------------------------------
+
+DATASET_CANDLES = "candles"
+DATASET_OI = "oi"
+
+logger = get_logger("market_data.binance.coverage")
+
+
+LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext(:lock_key))"
+
+MERGE_SQL = """
+    WITH runs AS (
+        SELECT *
+        FROM unnest(
+            CAST(:symbols AS text[]),
+            CAST(:starts AS bigint[]),
+            CAST(:ends AS bigint[])
+        ) AS r(symbol, start_time, end_time)
+    ),
+    absorbed AS (
+        DELETE FROM coverage c
+        USING runs r
+        WHERE c.dataset = :dataset
+          AND c.tf = :tf
+          AND c.symbol = r.symbol
+          AND c.start_time <= r.end_time + :step
+          AND c.end_time >= r.start_time - :step
+        RETURNING c.symbol, c.start_time, c.end_time
+    ),
+    spans AS (
+        SELECT symbol, start_time, end_time FROM runs
+        UNION ALL
+        SELECT symbol, start_time, end_time FROM absorbed
+    ),
+    marked AS (
+        SELECT
+            symbol,
+            start_time,
+            end_time,
+            CASE WHEN start_time <= MAX(end_time) OVER (
+                PARTITION BY symbol ORDER BY start_time, end_time
+                ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            ) + :step THEN 0 ELSE 1 END AS is_first
+        FROM spans
+    ),
+    islands AS (
+        SELECT
+            symbol,
+            start_time,
+            end_time,
+            SUM(is_first) OVER (PARTITION BY symbol ORDER BY start_time, end_time) AS island
+        FROM marked
+    )
+    INSERT INTO coverage (dataset, tf, symbol, start_time, end_time, updated_at)
+    SELECT :dataset, :tf, symbol, MIN(start_time), MAX(end_time), now()
+    FROM islands
+    GROUP BY symbol, island
+"""
+
+# gaps-and-islands over a whole table (one pass, rebuild only)
+REBUILD_SQL = """
+    INSERT INTO coverage (dataset, tf, symbol, start_time, end_time, updated_at)
+    SELECT :dataset, :tf, symbol, MIN(open_time), MAX(open_time), now()
+    FROM (
+        SELECT
+            symbol,
+            open_time,
+            open_time - ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY open_time) * :step AS island
+        FROM {table}
+    ) t
+    GROUP BY symbol, island
+"""
+
+LAST_SQL = """
+    SELECT symbol, MAX(end_time)
+    FROM coverage
+    WHERE dataset = :dataset AND tf = :tf
+    GROUP BY symbol
+"""
+
+# psycopg2 (pyformat) versions for raw DBAPI cursors (COPY path)
+_DIALECT = postgresql.psycopg2.dialect()
+LOCK_SQL_DBAPI = str(text(LOCK_SQL).compile(dialect=_DIALECT))
+MERGE_SQL_DBAPI = str(text(MERGE_SQL).compile(dialect=_DIALECT))
+
+
+def runs(keys, step):
+    """
+    Contiguous runs [(symbol, start, end)] of (symbol, open_time) keys.
+    """
+    by_symbol = {}
+    for symbol, open_time in keys:
+        by_symbol.setdefault(symbol, set()).add(open_time)
+
+    result = []
+
+    for symbol, times in by_symbol.items():
+        ordered = sorted(times)
+        start = prev = ordered[0]
+
+        for t in ordered[1:]:
+            if t - prev != step:
+                result.append((symbol, start, prev))
+                start = t
+            prev = t
+
+        result.append((symbol, start, prev))
+
+    return result
+
+
+def record(conn, dataset, tf, step, keys):
+    """
+    Merge the (symbol, open_time) keys of a written batch into the
+    coverage of (dataset, tf). `conn` is a Session, Connection or
+    DBAPI cursor inside the writing transaction.
+    """
+    batch = runs(keys, step)
+    if not batch:
+        return 0
+
+    symbols, starts, ends = (list(c) for c in zip(*batch))
+
+    params = {
+        "lock_key": f"coverage:{dataset}:{tf}",
+        "dataset": dataset,
+        "tf": tf,
+        "step": step,
+        "symbols": symbols,
+        "starts": starts,
+        "ends": ends,
+    }
+
+    if isinstance(conn, (Session, Connection)):
+        conn.execute(text(LOCK_SQL), params)
+        conn.execute(text(MERGE_SQL), params)
+    else:
+        conn.execute(LOCK_SQL_DBAPI, params)
+        conn.execute(MERGE_SQL_DBAPI, params)
+
+    return len(batch)
+
+
+# --------------------------------------------------
+# Readers
+# --------------------------------------------------
+def last_times(db, dataset, tf):
+    """
+    {symbol: last open_time} from coverage.
+    """
+    rows = db.execute(text(LAST_SQL), {"dataset": dataset, "tf": tf}).fetchall()
+    return {symbol: int(last) for symbol, last in rows}
+
+
+# --------------------------------------------------
+# Rebuild from the data tables
+# --------------------------------------------------
+def rebuild(dataset, tf, table, step):
+    """
+    Replace the coverage of (dataset, tf) with the ranges found in
+    `table` (full scan).
+    """
+    params = {"lock_key": f"coverage:{dataset}:{tf}", "dataset": dataset, "tf": tf, "step": step}
+
+    with engine.begin() as conn:
+        conn.execute(text(LOCK_SQL), params)
+        conn.execute(
+            text("DELETE FROM coverage WHERE dataset = :dataset AND tf = :tf"),
+            params,
+        )
+        conn.execute(text(REBUILD_SQL.format(table=table)), params)
+
+        ranges = conn.execute(
+            text("SELECT COUNT(*) FROM coverage WHERE dataset = :dataset AND tf = :tf"),
+            params,
+        ).scalar()
+
+    logger.info("Coverage rebuilt %s %s from %s | ranges=%d", dataset, tf, table, ranges)
+    return ranges
+
+
+def sources():
+    """
+    (dataset, tf, table, step) of every table with coverage.
+    """
+    from app.binance.scripts.oi_sync import OI_TABLES, OI_TFS
+
+    result = [
+        (DATASET_CANDLES, tf, config["table"], config["tf_ms"])
+        for tf, config in TIMEFRAMES.items()
+    ]
+    result += [(DATASET_OI, tf, OI_TABLES[tf], step) for tf, step in OI_TFS.items()]
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the coverage index")
+    parser.add_argument("--dataset", choices=[DATASET_CANDLES, DATASET_OI])
+    parser.add_argument("--tf")
+    args = parser.parse_args()
+
+    for dataset, tf, table, step in sources():
+        if args.dataset and dataset != args.dataset:
+            continue
+        if args.tf and tf != args.tf:
+            continue
+        rebuild(dataset, tf, table, step)
+
+
+if __name__ == "__main__":
+    main()
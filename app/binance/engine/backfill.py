@@ -0,0 +1,340 @@
+import os
+import time
+import asyncio
+from collections import deque
+from urllib.parse import urlparse
+
+import aiohttp
+
+from app.binance.payload_builder import build_payloads
+from app.binance.scripts.insert import upsert_candles, COPY_THRESHOLD
+from app.binance.weight import governor, request_cost, kline_weight
+from app.binance.page_cache import PAGE_CACHE_ENABLED, cacheable, kline_close_time, page_cache
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Concurrent REST kline backfill
+# --------------------------------------------------
+# The bar grid of a job (symbol, tf, start, end) is known up front,
+# so plan_pages() cuts it into [startTime, endTime] windows of up to
+# MAX_PAGE_LIMIT bars before anything is fetched. Pages of all
+# symbols and timeframes are independent requests, fetched
+# concurrently by BACKFILL_CONCURRENCY aiohttp workers, and merged
+# out of order by the writer.
+#
+# Page size: the klines weight steps with `limit` (1 / 2 / 5 / 10 at
+# <100 / <500 / ≤1000 / ≤1500), so per bar 499-bar pages are the
+# cheapest (2 per 499 bars vs 10 per 1500). Unless
+# BACKFILL_PAGE_LIMIT fixes it, the planner picks the limit with the
+# least total weight for the range (ties → fewer requests).
+#
+# Jobs starting before FUTURES_EPOCH_MS ("from the beginning") are
+# first resolved to the symbol's first bar with one limit=1 probe.
+#
+# Every request first takes its weight from the shared governor
+# (app.binance.weight), which also handles used-weight headers and
+# 429 / 418 pauses for all workers.
+#
+# Only transient errors are retried (5xx, timeouts, connection
+# errors). Any other 4xx (e.g. 400 for an invalid or delisted
+# symbol) won't succeed on a retry: the page is logged and counted as
+# rejected, not failed, so callers treat it as done and don't plan it
+# again on every run.
+#
+# Closed pages are read from / stored in the on-disk page cache
+# (app.binance.page_cache) and cost no weight on a re-run.
+#
+# Pages go through a queue to one writer that buffers rows per tf
+# and flushes them with upsert_candles in COPY_THRESHOLD batches
+# (COPY + staging merge), in a thread so fetching continues.
+# --------------------------------------------------
+
+URL = "https://fapi.binance.com/fapi/v1/klines"
+
+MAX_PAGE_LIMIT = 1500
+PAGE_LIMITS = (99, 499, 1000, MAX_PAGE_LIMIT)
+BACKFILL_PAGE_LIMIT = int(os.getenv("BACKFILL_PAGE_LIMIT", "0")) or None
+
+# USDⓈ-M futures launch (2019-09); nothing trades before it
+FUTURES_EPOCH_MS = 1_567_296_000_000
+
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "16"))
+
+MAX_RETRIES = 5
+REQUEST_TIMEOUT = 10
+REPORT_INTERVAL = 60
+
+logger = get_logger("market_data.binance.backfill")
+
+
+def choose_page_limit(bars):
+    """
+    Page size with the least total request weight for `bars` bars.
+    """
+    def cost(limit):
+        pages = -(-bars // limit)
+        return pages * kline_weight(min(limit, bars)), pages
+
+    return min(PAGE_LIMITS, key=cost)
+
+
+def plan_pages(symbol, tf, tf_ms, start, end, limit=None):
+    """
+    Pages (symbol, tf, start, end, bars) of at most `limit` bars
+    covering open times start..end (both aligned).
+    """
+    bars = (end - start) // tf_ms + 1
+    if bars <= 0:
+        return []
+
+    limit = min(limit or BACKFILL_PAGE_LIMIT or choose_page_limit(bars), MAX_PAGE_LIMIT)
+    span = limit * tf_ms
+
+    pages = []
+
+    for cursor in range(start, end + 1, span):
+        page_end = min(cursor + span - tf_ms, end)
+        pages.append((symbol, tf, cursor, page_end, (page_end - cursor) // tf_ms + 1))
+
+    return pages
+
+
+class BackfillEngine:
+
+    def __init__(self, concurrency=BACKFILL_CONCURRENCY, governor=governor, limit=None, cache=page_cache):
+        self.concurrency = concurrency
+        self.governor = governor
+        self.limit = limit
+        self.cache = cache
+
+        # stats
+        self.started = None
+        self.pages = 0
+        self.candles = 0
+        self.weight = 0
+        self.failed = 0  # pages given up after MAX_RETRIES
+        self.rejected = 0  # pages the exchange refused (4xx)
+        self.write_failed = 0  # upsert batches not written
+        self.minute_weight = deque()
+
+    # ------------------------------------------
+    # Fetch
+    # ------------------------------------------
+    async def fetch(self, session, page):
+        symbol, tf, start, end, limit = page
+
+        params = {
+            "symbol": symbol,
+            "interval": tf,
+            "startTime": start,
+            "endTime": end,
+            "limit": limit,
+        }
+        if PAGE_CACHE_ENABLED:
+            klines = self.cache.get(URL, params)
+            if klines is not None:
+                return klines
+
+        cost = request_cost(urlparse(URL).path, params)
+        weight = sum(cost.values())
+
+        for retry in range(MAX_RETRIES):
+            await self.governor.acquire_async(cost)
+            self.weight += weight
+            self.minute_weight.append((time.monotonic(), weight))
+
+            try:
+                async with session.get(URL, params=params) as resp:
+                    await self.governor.observe_async(resp.status, resp.headers)
+
+                    # the governor holds every worker until the pause ends
+                    if resp.status in (418, 429):
+                        continue
+
+                    if 400 <= resp.status < 500:
+                        self.rejected += 1
+                        logger.error(
+                            "Rejected %s %s %d..%d | HTTP %d %s",
+                            symbol, tf, start, end, resp.status, (await resp.text())[:200],
+                        )
+                        return None
+
+                    resp.raise_for_status()
+                    klines = await resp.json()
+
+                if PAGE_CACHE_ENABLED and cacheable(params, klines, kline_close_time):
+                    try:
+                        self.cache.put(URL, params, klines)
+                    except OSError:
+                        logger.exception("Could not cache page %s %s", symbol, tf)
+
+                return klines
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("Request failed %s %s (%s); retry %d", symbol, tf, e, retry + 1)
+                await asyncio.sleep(2 ** retry)
+
+        self.failed += 1
+        logger.error("Giving up %s %s %d..%d", symbol, tf, start, end)
+        return None
+
+    async def worker(self, session, pages, results):
+        while pages:
+            page = pages.popleft()
+            klines = await self.fetch(session, page)
+
+            if klines:
+                symbol, tf, start, end, _ = page
+                payloads = [
+                    p for p in build_payloads(symbol, tf, klines)
+                    if start <= p["open_time"] <= end
+                ]
+                self.pages += 1
+                await results.put((tf, payloads))
+
+    # ------------------------------------------
+    # Bulk writes
+    # ------------------------------------------
+    async def writer(self, results):
+        pending = {}
+
+        while True:
+            item = await results.get()
+
+            if item is None:
+                break
+
+            tf, payloads = item
+            rows = pending.setdefault(tf, [])
+            rows.extend(payloads)
+            self.candles += len(payloads)
+
+            if len(rows) >= COPY_THRESHOLD:
+                pending[tf] = []
+                await self.write(tf, rows)
+
+        for tf, rows in pending.items():
+            if rows:
+                await self.write(tf, rows)
+
+    async def write(self, tf, rows):
+        if not await asyncio.to_thread(upsert_candles, tf, rows):
+            self.write_failed += 1
+            logger.error("Backfill write failed | tf=%s rows=%d", tf, len(rows))
+
+    # ------------------------------------------
+    # Reporting
+    # ------------------------------------------
+    def stats(self):
+        now = time.monotonic()
+        elapsed = max(now - self.started, 1e-9) if self.started else 0
+
+        while self.minute_weight and now - self.minute_weight[0][0] >= 60:
+            self.minute_weight.popleft()
+
+        return {
+            "pages": self.pages,
+            "candles": self.candles,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "write_failed": self.write_failed,
+            "candles_per_sec": round(self.candles / elapsed, 1) if elapsed else 0,
+            "weight": self.weight,
+            "cache_hits": self.cache.hits,
+            "weight_last_min": sum(w for _, w in self.minute_weight),
+            "elapsed_sec": round(elapsed, 1),
+        }
+
+    async def reporter(self):
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            logger.info("Backfill | %s", self.stats())
+
+    # ------------------------------------------
+    # Planning
+    # ------------------------------------------
+    async def resolve_start(self, session, job):
+        """
+        Move an open-ended start to the symbol's first bar; None when
+        it has no bars in range.
+        """
+        symbol, tf, tf_ms, start, end = job
+
+        if start >= FUTURES_EPOCH_MS:
+            return job
+
+        klines = await self.fetch(session, (symbol, tf, start, end, 1))
+        if not klines:
+            return None
+
+        return symbol, tf, tf_ms, max(start, int(klines[0][0])), end
+
+    async def plan(self, session, jobs):
+        resolved = await asyncio.gather(*(self.resolve_start(session, job) for job in jobs))
+
+        pages = deque()
+        for job in resolved:
+            if job is not None:
+                pages.extend(plan_pages(*job, limit=self.limit))
+
+        return pages
+
+    async def resolve_async(self, jobs):
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            resolved = await asyncio.gather(*(self.resolve_start(session, job) for job in jobs))
+
+        return [job for job in resolved if job is not None]
+
+    def resolve(self, jobs):
+        """
+        Jobs with open-ended starts moved to the first listed bar
+        (without fetching them); jobs without bars are dropped.
+        """
+        return asyncio.run(self.resolve_async(jobs))
+
+    # ------------------------------------------
+    # Entry
+    # ------------------------------------------
+    async def run_async(self, jobs):
+        """
+        jobs: (symbol, tf, tf_ms, start, end) with aligned open times.
+        """
+        if not jobs:
+            return self.stats()
+
+        self.started = time.monotonic()
+
+        results = asyncio.Queue(maxsize=self.concurrency * 4)
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+
+        writer = asyncio.create_task(self.writer(results))
+        reporter = asyncio.create_task(self.reporter())
+
+        try:
+            async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+                pages = await self.plan(session, jobs)
+                logger.info("Backfill start | jobs=%d pages=%d", len(jobs), len(pages))
+
+                await asyncio.gather(*(
+                    self.worker(session, pages, results)
+                    for _ in range(min(self.concurrency, len(pages)))
+                ))
+        finally:
+            await results.put(None)
+            await writer
+            reporter.cancel()
+
+        stats = self.stats()
+        logger.info("Backfill done | %s", stats)
+        return stats
+
+    def run(self, jobs):
+        return asyncio.run(self.run_async(jobs))
+
+
+def run_backfill(jobs, **kwargs):
+    return BackfillEngine(**kwargs).run(jobs)
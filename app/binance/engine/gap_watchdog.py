@@ -1,13 +1,12 @@
 import time
 from datetime import datetime, timezone
 
-from sqlalchemy import text
 from app.db import SessionLocal
 from app.config import TIMEFRAMES
 from app.binance.engine.time_utils import get_exchange_time_ms, floor_time
-from app.binance.scripts.kline_history import fetch_klines, log
-from app.binance.scripts.insert import insert_candles_batch
-from app.binance.payload_builder import build_payloads
+from app.binance.scripts.kline_history import log
+from app.binance.engine.backfill import run_backfill
+from app.binance.engine.gaps import find_gaps, confirm_empty, get_symbols, repair_queue
 
 
 def ms_to_utc(ms):
@@ -22,6 +21,7 @@ def ms_to_utc(ms):
 def backfill_symbol(symbol, tf, table, tf_ms, start_ms, end_ms):
 
     log(
+        "INFO",
         "[WATCHDOG BACKFILL START]",
         symbol=symbol,
         tf=tf,
@@ -29,35 +29,12 @@ def backfill_symbol(symbol, tf, table, tf_ms, start_ms, end_ms):
         end=ms_to_utc(end_ms),
     )
 
-    cursor_end = end_ms
-    total_inserted = 0
-
-    while True:
-
-        klines = fetch_klines(
-            symbol=symbol,
-            tf=tf,
-            start_time=start_ms,
-            end_time=cursor_end,
-        )
-
-        if not klines:
-            break
-
-        payloads = build_payloads(symbol, tf, klines)
-        insert_candles_batch(tf, payloads)
-
-        total_inserted += len(payloads)
-
-        oldest_open = klines[0][0]
-        cursor_end = oldest_open - 1
-
-        if oldest_open <= start_ms:
-            break
-
-        time.sleep(0.12)
+    # pages are planned up front and fetched concurrently
+    stats = run_backfill([(symbol, tf, tf_ms, start_ms, end_ms)])
+    total_inserted = stats["candles"]
 
     log(
+        "INFO",
         "[WATCHDOG BACKFILL DONE]",
         symbol=symbol,
         tf=tf,
@@ -65,12 +42,33 @@ def backfill_symbol(symbol, tf, table, tf_ms, start_ms, end_ms):
     )
 
 
+def confirm_gaps(jobs, until, now_ms):
+    db = SessionLocal()
+
+    try:
+        for tf, expected_last in until.items():
+            tf_jobs = [job for job in jobs if job[1] == tf]
+            confirmed = confirm_empty(db, tf, tf_jobs, expected_last, now_ms)
+
+            for symbol, start, end in confirmed:
+                log(
+                    "INFO",
+                    "[WATCHDOG GAP CONFIRMED EMPTY]",
+                    symbol=symbol,
+                    tf=tf,
+                    start=ms_to_utc(start),
+                    end=ms_to_utc(end),
+                )
+    finally:
+        db.close()
+
+
 # --------------------------------------------------
 # Multi-Timeframe Watchdog
 # --------------------------------------------------
 def run_gap_watchdog():
 
-    log("[WATCHDOG] Started (Multi-TF Mode)")
+    log("INFO", "[WATCHDOG] Started (Multi-TF Mode)")
 
     while True:
 
@@ -80,63 +78,75 @@ def run_gap_watchdog():
         db = SessionLocal()
 
         try:
-            rows = db.execute(text("""
-                SELECT DISTINCT symbol FROM candles_1m
-            """)).fetchall()
-
-            symbols = [r[0] for r in rows]
+            symbols = get_symbols(db)
 
             if not symbols:
-                log("[WATCHDOG] No symbols in 1m table. Waiting...")
+                log("INFO", "[WATCHDOG] No symbols yet. Waiting...")
                 continue
 
+            jobs = []
+            until = {}
+
             for tf, config in TIMEFRAMES.items():
 
                 # 🔥 SKIP DERIVED TF (like 2m)
                 if not config.get("api", False):
-                    log("[WATCHDOG] Skipping derived TF", tf=tf)
+                    log("INFO", "[WATCHDOG] Skipping derived TF", tf=tf)
                     continue
 
-                table = config["table"]
                 tf_ms = config["tf_ms"]
 
                 grace_ms = tf_ms
                 expected_last = floor_time(exchange_now - grace_ms, tf_ms) - tf_ms
+                until[tf] = expected_last
 
-                log("[CHECK TF]", tf=tf, expected=ms_to_utc(expected_last))
+                # every hole of every symbol in the horizon, one query
+                gaps = find_gaps(db, tf, symbols, expected_last, require_recent=True)
 
-                for symbol in symbols:
+                for symbol, gap_start, gap_end in gaps:
 
-                    last_open = db.execute(text(f"""
-                        SELECT MAX(open_time)
-                        FROM {table}
-                        WHERE symbol = :symbol
-                    """), {"symbol": symbol}).scalar()
+                    log(
+                        "WARN",
+                        "[WATCHDOG GAP DETECTED]",
+                        symbol=symbol,
+                        tf=tf,
+                        start=ms_to_utc(gap_start),
+                        end=ms_to_utc(gap_end),
+                    )
 
-                    if not last_open:
-                        continue
+                    jobs.append((symbol, tf, tf_ms, gap_start, gap_end))
 
-                    if last_open < expected_last:
+        finally:
+            db.close()
 
-                        log(
-                            "[WATCHDOG GAP DETECTED]",
-                            symbol=symbol,
-                            tf=tf,
-                            db_last=ms_to_utc(last_open),
-                            expected=ms_to_utc(expected_last),
-                        )
+        # stored bars known to be wrong (no hole to find)
+        repairs = repair_queue.take()
 
-                        gap_start = last_open + tf_ms
-                        gap_end = expected_last
+        for symbol, tf, start, end in repairs:
 
-                        backfill_symbol(
-                            symbol,
-                            tf,
-                            table,
-                            tf_ms,
-                            gap_start,
-                            gap_end,
-                        )
+            log(
+                "WARN",
+                "[WATCHDOG REPAIR]",
+                symbol=symbol,
+                tf=tf,
+                start=ms_to_utc(start),
+                end=ms_to_utc(end),
+            )
+
+            jobs.append((symbol, tf, TIMEFRAMES[tf]["tf_ms"], start, end))
+
+        if jobs:
+            # one planned batch for all symbols and timeframes
+            stats = run_backfill(jobs)
+            log("INFO", "[WATCHDOG BACKFILL DONE]", gaps=len(jobs), **stats)
+
+            if repairs and (stats["failed"] or stats["write_failed"]):
+                # retried next cycle
+                for symbol, tf, start, end in repairs:
+                    repair_queue.add(tf, [(symbol, start, end)])
+
+            # what a complete backfill didn't fill is missing on the
+            # exchange: stop probing it until the entry expires
+            if not stats["failed"] and not stats["write_failed"]:
+                confirm_gaps(jobs, until, exchange_now)
 
-        finally:
-            db.close()
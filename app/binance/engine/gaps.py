@@ -0,0 +1,324 @@
+import os
+import time
+
+import redis
+from sqlalchemy import text
+
+from app.config import TIMEFRAMES
+from app.redis_client import redis_client
+from app.binance.coverage import DATASET_CANDLES
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Set-based gap detection (from the coverage index)
+# --------------------------------------------------
+# One query per timeframe returns every missing interval of every
+# symbol inside a bounded horizon [since, until]. Coverage holds the
+# stored bars as contiguous ranges (app.binance.coverage), so the
+# holes are what lies between consecutive ranges:
+#
+#   LEAD     next range start per symbol
+#   holes    [end + tf, next_start - tf]
+#   tail     last range ends < until → [end + tf, until]
+#
+# A hole is reported in full when it reaches into the horizon.
+# Symbols without any range never produce a gap (not listed yet /
+# never collected); with require_recent, neither do symbols without
+# a bar inside the horizon (delisted), so the watchdog doesn't
+# re-probe them every minute. Cost is O(ranges), not O(bars).
+#
+# Exchange-side holes (maintenance, halted or delisted symbols) never
+# fill. Once a REST backfill of a gap completed and bars are still
+# missing, confirm_empty() stores those ranges in the Redis hash
+#
+#   gaps:confirmed_empty   "tf:symbol:start:end" → expiry (ms)
+#
+# for EMPTY_RANGE_TTL seconds, and find_gaps leaves them out, so they
+# aren't probed again every cycle. Ranges younger than
+# EMPTY_CONFIRM_AGE_MS are never confirmed (REST may still lag).
+#
+# Bars that are stored but known to be wrong (1m bars built from an
+# aggTrade stream that missed trades) leave no hole. Their producers
+# push them to the Redis set
+#
+#   gaps:repair   "tf:symbol:start:end"
+#
+# and the watchdog re-fetches them from REST on its next cycle.
+# --------------------------------------------------
+
+GAP_HORIZON_BARS = int(os.getenv("GAP_HORIZON_BARS", "1500"))
+
+EMPTY_RANGES_KEY = "gaps:confirmed_empty"
+EMPTY_RANGE_TTL = int(os.getenv("EMPTY_RANGE_TTL", "21600"))  # 6 h
+EMPTY_CONFIRM_AGE_MS = int(os.getenv("EMPTY_CONFIRM_AGE_MS", "900000"))  # 15 min
+
+REPAIR_KEY = "gaps:repair"
+
+logger = get_logger("market_data.binance.gaps")
+
+GAPS_SQL = """
+    WITH ranges AS (
+        SELECT
+            symbol,
+            start_time,
+            end_time,
+            LEAD(start_time) OVER (PARTITION BY symbol ORDER BY start_time) AS next_start
+        FROM coverage
+        WHERE dataset = :dataset
+          AND tf = :tf
+          AND symbol = ANY(CAST(:symbols AS text[]))
+    ),
+    gaps AS (
+        SELECT
+            symbol,
+            end_time + :tf_ms AS gap_start,
+            LEAST(COALESCE(next_start - :tf_ms, :until), :until) AS gap_end
+        FROM ranges
+        WHERE end_time < :until
+    )
+    SELECT symbol, gap_start, gap_end
+    FROM gaps
+    WHERE gap_end >= :since
+      AND gap_end >= gap_start
+    {recent_filter}
+    ORDER BY symbol, gap_start
+"""
+
+RECENT_FILTER = """
+      AND symbol IN (
+          SELECT symbol FROM ranges
+          WHERE end_time >= :since AND start_time <= :until
+      )
+"""
+
+EMPTY_SQL = """
+    SELECT u.symbol
+    FROM unnest(CAST(:symbols AS text[])) AS u(symbol)
+    WHERE NOT EXISTS (
+        SELECT 1 FROM coverage c
+        WHERE c.dataset = :dataset AND c.tf = :tf AND c.symbol = u.symbol
+    )
+"""
+
+
+# --------------------------------------------------
+# Confirmed-empty ranges (Redis)
+# --------------------------------------------------
+class EmptyRanges:
+
+    def __init__(self, client=redis_client, key=EMPTY_RANGES_KEY, ttl=EMPTY_RANGE_TTL):
+        self.client = client
+        self.key = key
+        self.ttl = ttl
+
+    def load(self, tf):
+        """
+        {symbol: [(start, end)]} confirmed empty for tf; prunes
+        expired entries.
+        """
+        try:
+            raw = self.client.hgetall(self.key)
+        except redis.RedisError:
+            logger.warning("Confirmed-empty ranges unavailable; probing every gap")
+            return {}
+
+        now = int(time.time() * 1000)
+        ranges, expired = {}, []
+
+        for field, expires in raw.items():
+            if int(expires) <= now:
+                expired.append(field)
+                continue
+
+            range_tf, symbol, start, end = field.split(":")
+            if range_tf == tf:
+                ranges.setdefault(symbol, []).append((int(start), int(end)))
+
+        if expired:
+            try:
+                self.client.hdel(self.key, *expired)
+            except redis.RedisError:
+                pass
+
+        return ranges
+
+    def add(self, tf, ranges):
+        """
+        Store [(symbol, start, end)] as confirmed empty for ttl.
+        """
+        if not ranges:
+            return
+
+        expires = int(time.time() * 1000) + self.ttl * 1000
+
+        try:
+            self.client.hset(self.key, mapping={
+                f"{tf}:{symbol}:{start}:{end}": expires for symbol, start, end in ranges
+            })
+        except redis.RedisError:
+            logger.warning("Could not store %d confirmed-empty ranges", len(ranges))
+
+
+empty_ranges = EmptyRanges()
+
+
+# --------------------------------------------------
+# Repair queue (Redis)
+# --------------------------------------------------
+class RepairQueue:
+
+    def __init__(self, client=redis_client, key=REPAIR_KEY):
+        self.client = client
+        self.key = key
+
+    def add(self, tf, ranges):
+        """
+        Queue [(symbol, start, end)] of tf for a REST re-fetch.
+        """
+        if not ranges:
+            return
+
+        try:
+            self.client.sadd(self.key, *[f"{tf}:{symbol}:{start}:{end}" for symbol, start, end in ranges])
+        except redis.RedisError:
+            logger.warning("Could not queue %d %s ranges for repair", len(ranges), tf)
+
+    def take(self):
+        """
+        [(symbol, tf, start, end)] queued so far; empties the queue.
+        """
+        try:
+            pipe = self.client.pipeline()
+            pipe.smembers(self.key)
+            pipe.delete(self.key)
+            members, _ = pipe.execute()
+        except redis.RedisError:
+            logger.warning("Repair queue unavailable")
+            return []
+
+        repairs = []
+        for member in sorted(members):
+            tf, symbol, start, end = member.split(":")
+            repairs.append((symbol, tf, int(start), int(end)))
+
+        return repairs
+
+
+repair_queue = RepairQueue()
+
+
+def subtract(start, end, ranges, step):
+    """
+    Pieces of [start, end] not inside any of the inclusive ranges.
+    """
+    pieces = []
+
+    for lo, hi in sorted(ranges):
+        if hi < start or lo > end:
+            continue
+        if lo > start:
+            pieces.append((start, lo - step))
+        start = max(start, hi + step)
+
+    if start <= end:
+        pieces.append((start, end))
+
+    return pieces
+
+
+# --------------------------------------------------
+# Queries
+# --------------------------------------------------
+def find_gaps(db, tf, symbols, until, horizon_bars=GAP_HORIZON_BARS, require_recent=False, empty=empty_ranges):
+    """
+    [(symbol, gap_start, gap_end)] of missing bars up to `until`
+    (inclusive, aligned) for all symbols, in one query. Ranges
+    confirmed empty on the exchange are left out (empty=None keeps
+    them).
+    """
+    if not symbols:
+        return []
+
+    tf_ms = TIMEFRAMES[tf]["tf_ms"]
+
+    recent_filter = RECENT_FILTER if require_recent else ""
+
+    rows = db.execute(
+        text(GAPS_SQL.format(recent_filter=recent_filter)),
+        {
+            "dataset": DATASET_CANDLES,
+            "tf": tf,
+            "symbols": list(symbols),
+            "since": until - (horizon_bars - 1) * tf_ms,
+            "until": until,
+            "tf_ms": tf_ms,
+        },
+    ).fetchall()
+
+    gaps = [(symbol, int(start), int(end)) for symbol, start, end in rows]
+
+    if empty is None or not gaps:
+        return gaps
+
+    confirmed = empty.load(tf)
+
+    return [
+        (symbol, piece_start, piece_end)
+        for symbol, start, end in gaps
+        for piece_start, piece_end in subtract(start, end, confirmed.get(symbol, ()), tf_ms)
+    ]
+
+
+def confirm_empty(db, tf, jobs, until, now_ms, empty=empty_ranges):
+    """
+    After a completed backfill of jobs (symbol, tf, tf_ms, start,
+    end), store what is still missing inside them as confirmed empty.
+    Returns the stored ranges.
+    """
+    if not jobs:
+        return []
+
+    tf_ms = TIMEFRAMES[tf]["tf_ms"]
+    probed = {}
+
+    for symbol, _, _, start, end in jobs:
+        probed.setdefault(symbol, []).append((start, end))
+
+    first = min(start for _, _, _, start, _ in jobs)
+    # only bars old enough that REST should have them by now
+    settled = min(until, (now_ms - EMPTY_CONFIRM_AGE_MS) // tf_ms * tf_ms - tf_ms)
+
+    missing = find_gaps(db, tf, list(probed), until, horizon_bars=(until - first) // tf_ms + 1, empty=None)
+
+    confirmed = []
+
+    for symbol, gap_start, gap_end in missing:
+        for start, end in probed[symbol]:
+            lo, hi = max(gap_start, start), min(gap_end, end, settled)
+            if lo <= hi:
+                confirmed.append((symbol, lo, hi))
+
+    if confirmed:
+        empty.add(tf, confirmed)
+        logger.info("Confirmed empty on the exchange | tf=%s ranges=%d", tf, len(confirmed))
+
+    return confirmed
+
+
+def find_empty(db, tf, symbols):
+    """
+    Symbols without any bar in the timeframe's table.
+    """
+    if not symbols:
+        return []
+
+    rows = db.execute(
+        text(EMPTY_SQL),
+        {"dataset": DATASET_CANDLES, "tf": tf, "symbols": list(symbols)},
+    ).fetchall()
+
+    return [r[0] for r in rows]
+
+
+def get_symbols(db):
+    return [r[0] for r in db.execute(text("SELECT name FROM symbols")).fetchall()]
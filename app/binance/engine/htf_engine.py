@@ -1,83 +1,429 @@
+import os
+import time
+import random
+import argparse
+
 from sqlalchemy import text
-from app.db import SessionLocal
-from app.binance.repo import insert_candle
-from .time_utils import TF_TO_MS, floor_time
-from app.binance.scripts.helpers import open_time_ms_to_ist
 
-HTF_LIST = ["15m", "1h", "4h", "1d"]
+from app.db import SessionLocal, engine
+from app.config import TIMEFRAMES
+from app.binance import coverage
+from app.binance.payload_builder import build_payloads
+from app.binance.scripts.insert import UPSERT_COLUMNS
+from app.binance.weight import governed_get
+from app.binance.engine.gaps import find_gaps, find_empty, confirm_empty, empty_ranges, subtract, get_symbols
+from app.binance.engine.backfill import run_backfill
+from app.binance.engine.time_utils import get_exchange_time_ms, floor_time
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# HTF candles derived from 1m (SQL rollup)
+# --------------------------------------------------
+# 5m … 1d bars are a deterministic rollup of candles_1m, so timeframes
+# with "api": False (config.DERIVE_HTF) are materialized in Postgres
+# instead of fetched from /fapi/v1/klines:
+#
+#   buckets   GROUP BY symbol, open_time / tf_ms * tf_ms over a 1m
+#             range (PK range scan per symbol)
+#   first /   open / close from ARRAY_AGG ordered by open_time,
+#   last      high / low / volumes / trades as MAX / MIN / SUM
+#   complete  only buckets with all tf_ms / 1m bars are written
+#
+# The INSERT ... ON CONFLICT returns the written keys, which go into
+# the coverage index in the same transaction.
+#
+# What to derive comes from HTF coverage: tails and holes
+# (find_gaps, so a repaired 1m hole is re-derived at the next
+# boundary) and empty timeframes from the first 1m bar. History runs
+# in windows of DERIVE_WINDOW_BARS 1m bars × DERIVE_SYMBOL_BATCH
+# symbols per statement.
+#
+# Buckets with real 1m holes (listing-day partial buckets, exchange
+# maintenance) can't be derived, but REST has those bars: after the
+# rollup, what is still missing before each symbol's last stored 1m
+# bucket is fetched from /fapi/v1/klines (HTF_REST_FALLBACK), and
+# whatever REST doesn't have either is confirmed empty (gaps), so it
+# isn't retried at every boundary.
+#
+# Writers: the WS db_worker (process_htf) writes complete buckets
+# live from closed 1m records; this rollup is authoritative for
+# everything else (history, outages, repaired 1m). Both compute the
+# same bar from the same 1m rows and upsert on (symbol, open_time),
+# and neither writes partial buckets — only the REST fallback does.
+#
+# verify() diffs a random sample of derived bars against REST.
+# --------------------------------------------------
+
+DERIVE_WINDOW_BARS = int(os.getenv("DERIVE_WINDOW_BARS", "50000"))
+DERIVE_SYMBOL_BATCH = int(os.getenv("DERIVE_SYMBOL_BATCH", "20"))
+HTF_REST_FALLBACK = os.getenv("HTF_REST_FALLBACK", "1") == "1"
+
+VERIFY_URL = "https://fapi.binance.com/fapi/v1/klines"
+
+# relative tolerance: prices are copied, volumes are float sums
+PRICE_TOLERANCE = 1e-9
+VOLUME_TOLERANCE = 1e-6
+
+ONE_MINUTE = TIMEFRAMES["1m"]["tf_ms"]
+
+logger = get_logger("market_data.binance.htf_engine")
+
+
+ROLLUP_SQL = """
+    WITH buckets AS (
+        SELECT
+            symbol,
+            open_time / :tf_ms * :tf_ms AS bucket,
+            COUNT(*) AS bars,
+            MAX(event_time) AS event_time,
+            MIN(first_trade_id) AS first_trade_id,
+            MAX(last_trade_id) AS last_trade_id,
+            (ARRAY_AGG(open_price ORDER BY open_time))[1] AS open_price,
+            MAX(high_price) AS high_price,
+            MIN(low_price) AS low_price,
+            (ARRAY_AGG(close_price ORDER BY open_time DESC))[1] AS close_price,
+            SUM(base_volume) AS base_volume,
+            SUM(quote_volume) AS quote_volume,
+            SUM(taker_buy_base_volume) AS taker_buy_base_volume,
+            SUM(taker_buy_quote_volume) AS taker_buy_quote_volume,
+            SUM(trade_count) AS trade_count
+        FROM candles_1m
+        WHERE symbol = ANY(CAST(:symbols AS text[]))
+          AND open_time BETWEEN :start AND :end
+        GROUP BY symbol, bucket
+    )
+    INSERT INTO {table} (
+        symbol, interval, event_time, open_time, lk_at, close_time,
+        first_trade_id, last_trade_id,
+        open_price, high_price, low_price, close_price,
+        base_volume, quote_volume,
+        taker_buy_base_volume, taker_buy_quote_volume,
+        trade_count, is_closed
+    )
+    SELECT
+        symbol, :tf, event_time, bucket, to_timestamp(bucket / 1000.0), bucket + :tf_ms - 1,
+        first_trade_id, last_trade_id,
+        open_price, high_price, low_price, close_price,
+        base_volume, quote_volume,
+        taker_buy_base_volume, taker_buy_quote_volume,
+        trade_count, TRUE
+    FROM buckets
+    WHERE bars = :bars
+    ON CONFLICT (symbol, open_time) DO UPDATE SET
+        {updates}
+    RETURNING symbol, open_time
+"""
+
+FIRST_1M_SQL = """
+    SELECT symbol, MIN(start_time)
+    FROM coverage
+    WHERE dataset = 'candles' AND tf = '1m'
+      AND symbol = ANY(CAST(:symbols AS text[]))
+    GROUP BY symbol
+"""
+
+# first stored bar per symbol of a timeframe
+FIRST_SQL = """
+    SELECT symbol, MIN(start_time)
+    FROM coverage
+    WHERE dataset = 'candles' AND tf = :tf
+      AND symbol = ANY(CAST(:symbols AS text[]))
+    GROUP BY symbol
+"""
+
+
+def derived_timeframes():
+    return [tf for tf, config in TIMEFRAMES.items() if tf != "1m" and not config.get("api", False)]
+
+
+def rollup_sql(tf):
+    updates = ",\n        ".join(f"{c} = EXCLUDED.{c}" for c in UPSERT_COLUMNS)
+    return ROLLUP_SQL.format(table=TIMEFRAMES[tf]["table"], updates=updates)
+
+
+# --------------------------------------------------
+# Materialize
+# --------------------------------------------------
+def derive(tf, symbols, start, end):
+    """
+    Roll up complete buckets with open times start..end (aligned to
+    tf) from candles_1m into the tf table. Returns bars written.
+    """
+    tf_ms = TIMEFRAMES[tf]["tf_ms"]
+    sql = text(rollup_sql(tf))
+
+    window = max(DERIVE_WINDOW_BARS * ONE_MINUTE // tf_ms, 1) * tf_ms
+    symbols = list(symbols)
+    written = 0
+
+    for i in range(0, len(symbols), DERIVE_SYMBOL_BATCH):
+        batch = symbols[i:i + DERIVE_SYMBOL_BATCH]
+
+        for window_start in range(start, end + 1, window):
+            window_end = min(window_start + window - tf_ms, end)
+
+            with engine.begin() as conn:
+                keys = conn.execute(sql, {
+                    "tf": tf,
+                    "tf_ms": tf_ms,
+                    "bars": tf_ms // ONE_MINUTE,
+                    "symbols": batch,
+                    "start": window_start,
+                    # last 1m bar of the last bucket
+                    "end": window_end + tf_ms - ONE_MINUTE,
+                }).fetchall()
+
+                coverage.record(conn, coverage.DATASET_CANDLES, tf, tf_ms, keys)
+
+            written += len(keys)
+
+    return written
+
+
+def sync_tf(tf, symbols, until, fallback=HTF_REST_FALLBACK):
+    """
+    Derive every missing bar of tf up to `until` (last closed open
+    time): coverage gaps, and empty symbols from their first 1m bar.
+    Buckets that can't be derived are fetched from REST (fallback).
+    """
+    tf_ms = TIMEFRAMES[tf]["tf_ms"]
+
+    db = SessionLocal()
+
+    try:
+        ranges = {}
+
+        for symbol, start, end in find_gaps(db, tf, symbols, until):
+            ranges.setdefault((start, end), []).append(symbol)
+
+        empty = find_empty(db, tf, symbols)
+
+        if empty:
+            first = db.execute(text(FIRST_1M_SQL), {"symbols": empty}).fetchall()
+
+            for symbol, first_1m in first:
+                ranges.setdefault((floor_time(first_1m, tf_ms), until), []).append(symbol)
+
+    finally:
+        db.close()
+
+    # symbols sharing a range (e.g. the tail at a boundary) go together
+    written = 0
+    for (start, end), batch in ranges.items():
+        written += derive(tf, batch, start, end)
+
+    if written:
+        logger.info("Derived %s | ranges=%d bars=%d", tf, len(ranges), written)
+
+    if fallback and ranges:
+        first = min(start for start, _ in ranges)
+        written += fetch_underived(tf, {s for batch in ranges.values() for s in batch}, first, until)
+
+    return written
+
+
+def leading_ranges(db, tf, symbols, start, until):
+    """
+    [(symbol, start, end)] before each symbol's first stored tf bar
+    but after its first 1m bucket (listing-day partial bucket);
+    find_gaps only sees holes after a stored range.
+    """
+    tf_ms = TIMEFRAMES[tf]["tf_ms"]
+
+    first_tf = dict(db.execute(text(FIRST_SQL), {"tf": tf, "symbols": symbols}).fetchall())
+    leads = []
+
+    for symbol, first_1m in db.execute(text(FIRST_1M_SQL), {"symbols": symbols}).fetchall():
+        lead_start = max(floor_time(first_1m, tf_ms), start)
+        lead_end = min(first_tf.get(symbol, until + tf_ms) - tf_ms, until)
+        if lead_start <= lead_end:
+            leads.append((symbol, lead_start, lead_end))
 
+    return leads
 
-def handle_new_1m(symbol: str, open_time: int):
-    # for tf in HTF_LIST:
-    #     try_build_htf(symbol, tf, open_time)
-    return 
 
-def try_build_htf(symbol: str, tf: str, last_1m_open: int):
-    tf_ms = TF_TO_MS[tf]
+def fetch_underived(tf, symbols, start, until):
+    """
+    REST backfill of bars still missing in start..until that lie
+    before the symbol's last stored 1m bucket (1m holes inside the
+    bucket); what REST lacks too is confirmed empty.
+    """
+    tf_ms = TIMEFRAMES[tf]["tf_ms"]
+    symbols = list(symbols)
+
+    db = SessionLocal()
+
+    try:
+        last_1m = coverage.last_times(db, coverage.DATASET_CANDLES, "1m")
+        confirmed = empty_ranges.load(tf)
+
+        missing = find_gaps(db, tf, symbols, until, horizon_bars=(until - start) // tf_ms + 1)
+        leads = [
+            (symbol, piece_start, piece_end)
+            for symbol, lead_start, lead_end in leading_ranges(db, tf, symbols, start, until)
+            for piece_start, piece_end in subtract(lead_start, lead_end, confirmed.get(symbol, ()), tf_ms)
+        ]
+
+        jobs = []
+        for symbol, gap_start, gap_end in missing + leads:
+            # buckets whose 1m may still arrive are left to the rollup
+            settled = floor_time(last_1m.get(symbol, 0), tf_ms) - tf_ms
+            gap_end = min(gap_end, settled)
+
+            if gap_start <= gap_end:
+                logger.warning("HTF underived %s %s %d..%d; fetching from REST", symbol, tf, gap_start, gap_end)
+                jobs.append((symbol, tf, tf_ms, gap_start, gap_end))
+
+        if not jobs:
+            return 0
+
+        stats = run_backfill(jobs)
+
+        if not stats["failed"] and not stats["write_failed"]:
+            confirm_empty(db, tf, jobs, until, int(time.time() * 1000))
+
+            # leading buckets REST doesn't have either
+            lead_jobs = {job[0] for job in jobs} & {lead[0] for lead in leads}
+            still = leading_ranges(db, tf, sorted(lead_jobs), start, until)
+            empty_ranges.add(tf, [
+                (symbol, lead_start, min(lead_end, floor_time(last_1m[symbol], tf_ms) - tf_ms))
+                for symbol, lead_start, lead_end in still
+            ])
+
+    finally:
+        db.close()
+
+    return stats["candles"]
+
+
+def sync_all(symbols, now_ms):
+    """
+    sync_tf for every derived timeframe up to its last closed bar.
+    """
+    return {
+        tf: sync_tf(tf, symbols, floor_time(now_ms, TIMEFRAMES[tf]["tf_ms"]) - TIMEFRAMES[tf]["tf_ms"])
+        for tf in derived_timeframes()
+    }
+
+
+# --------------------------------------------------
+# Verify against REST
+# --------------------------------------------------
+VERIFY_FIELDS = [
+    ("open_price", PRICE_TOLERANCE),
+    ("high_price", PRICE_TOLERANCE),
+    ("low_price", PRICE_TOLERANCE),
+    ("close_price", PRICE_TOLERANCE),
+    ("base_volume", VOLUME_TOLERANCE),
+    ("quote_volume", VOLUME_TOLERANCE),
+    ("taker_buy_base_volume", VOLUME_TOLERANCE),
+    ("taker_buy_quote_volume", VOLUME_TOLERANCE),
+    ("trade_count", 0),
+]
+
+
+def diff_bar(stored, rest):
+    """
+    [(field, stored, rest)] of fields outside tolerance.
+    """
+    diffs = []
+
+    for field, tolerance in VERIFY_FIELDS:
+        a, b = stored[field], rest[field]
+        if abs(a - b) > tolerance * max(abs(a), abs(b)):
+            diffs.append((field, a, b))
+
+    return diffs
 
-    # boundary check
-    bucket_start = floor_time(last_1m_open, tf_ms)
-    bucket_end = bucket_start + tf_ms - 60_000
 
-    if last_1m_open != bucket_end:
-        return
+def verify(tf, symbols, sample=10, bars=100, until=None):
+    """
+    Compare the last `bars` derived bars of `sample` random symbols
+    with /fapi/v1/klines. Returns counts of checked, missing and
+    mismatched bars.
+    """
+    tf_ms = TIMEFRAMES[tf]["tf_ms"]
+    until = until or floor_time(get_exchange_time_ms(), tf_ms) - tf_ms
+    start = until - (bars - 1) * tf_ms
+
+    columns = ["open_time"] + [field for field, _ in VERIFY_FIELDS]
+    query = text(f"""
+        SELECT {", ".join(columns)}
+        FROM {TIMEFRAMES[tf]["table"]}
+        WHERE symbol = :symbol AND open_time BETWEEN :start AND :end
+    """)
+
+    report = {"checked": 0, "missing": 0, "mismatched": 0}
 
     db = SessionLocal()
+
     try:
-        rows = db.execute(text("""
-            SELECT open_time, open_price, high_price,
-                   low_price, close_price,
-                   base_volume, quote_volume,
-                   taker_buy_base_volume,
-                   taker_buy_quote_volume,
-                   trade_count
-            FROM candles_1m
-            WHERE symbol = :symbol
-            AND open_time BETWEEN :start AND :end
-            ORDER BY open_time ASC
-        """), {
-            "symbol": symbol,
-            "start": bucket_start,
-            "end": bucket_end,
-        }).fetchall()
-
-        expected_count = tf_ms // 60_000
-
-        if len(rows) != expected_count:
-            return
-
-        open_price = rows[0].open_price
-        close_price = rows[-1].close_price
-        high_price = max(r.high_price for r in rows)
-        low_price = min(r.low_price for r in rows)
-
-        base_volume = sum(r.base_volume for r in rows)
-        quote_volume = sum(r.quote_volume for r in rows)
-        taker_buy_base_volume = sum(r.taker_buy_base_volume for r in rows)
-        taker_buy_quote_volume = sum(r.taker_buy_quote_volume for r in rows)
-        trade_count = sum(r.trade_count for r in rows)
-
-        payload = {
-            "event_time": bucket_end,
-            "symbol": symbol,
-            "interval": tf,
-            "open_time": bucket_start,
-            "close_time": bucket_end + 59_999,
-            "first_trade_id": 0,
-            "last_trade_id": 0,
-            "open_price": open_price,
-            "high_price": high_price,
-            "low_price": low_price,
-            "close_price": close_price,
-            "base_volume": base_volume,
-            "quote_volume": quote_volume,
-            "taker_buy_base_volume": taker_buy_base_volume,
-            "taker_buy_quote_volume": taker_buy_quote_volume,
-            "trade_count": trade_count,
-            "is_closed": True,
-        }
-
-        insert_candle(tf, payload)
+        for symbol in random.sample(list(symbols), min(sample, len(symbols))):
+
+            resp = governed_get(VERIFY_URL, params={
+                "symbol": symbol,
+                "interval": tf,
+                "startTime": start,
+                "endTime": until,
+                "limit": bars,
+            })
+            resp.raise_for_status()
+
+            rest = {p["open_time"]: p for p in build_payloads(symbol, tf, resp.json())}
+
+            stored = {
+                row["open_time"]: row
+                for row in db.execute(query, {"symbol": symbol, "start": start, "end": until}).mappings()
+            }
+
+            for open_time, rest_bar in rest.items():
+                report["checked"] += 1
+
+                bar = stored.get(open_time)
+                if bar is None:
+                    report["missing"] += 1
+                    logger.warning("VERIFY MISSING %s %s %d", symbol, tf, open_time)
+                    continue
+
+                diffs = diff_bar(bar, rest_bar)
+                if diffs:
+                    report["mismatched"] += 1
+                    logger.warning("VERIFY MISMATCH %s %s %d %s", symbol, tf, open_time, diffs)
+
+    finally:
+        db.close()
+
+    logger.info("Verify %s | %s", tf, report)
+    return report
+
 
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Derive HTF candles from candles_1m")
+    parser.add_argument("--tf", help="Only this timeframe (default: all derived)")
+    parser.add_argument("--verify", type=int, metavar="SYMBOLS", help="Diff a sample of symbols against REST instead")
+    parser.add_argument("--bars", type=int, default=100, help="Bars per symbol to verify (max 1500)")
+    args = parser.parse_args()
+
+    tfs = [args.tf] if args.tf else derived_timeframes()
+
+    db = SessionLocal()
+    try:
+        symbols = get_symbols(db)
     finally:
         db.close()
+
+    now_ms = get_exchange_time_ms()
+
+    for tf in tfs:
+        if args.verify:
+            verify(tf, symbols, sample=args.verify, bars=args.bars)
+        else:
+            tf_ms = TIMEFRAMES[tf]["tf_ms"]
+            sync_tf(tf, symbols, floor_time(now_ms, tf_ms) - tf_ms)
+
+
+if __name__ == "__main__":
+    main()
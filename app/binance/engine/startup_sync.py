@@ -1,122 +1,272 @@
+import os
+import json
+
+import redis
 from sqlalchemy import text
+
 from app.db import SessionLocal
 from app.config import TIMEFRAMES
+from app.redis_client import redis_client
 from app.binance.engine.time_utils import get_exchange_time_ms, floor_time
-from app.binance.engine.gap_watchdog import backfill_symbol
+from app.binance.engine.backfill import BackfillEngine
+from app.binance.engine.gaps import find_gaps, find_empty
+from app.binance.engine.htf_engine import sync_all
 from app.logging_config import get_logger
 
+# --------------------------------------------------
+# Prioritized, resumable startup sync
+# --------------------------------------------------
+# Boot repairs everything missing up to the last closed bar of each
+# API timeframe:
+#
+#   gaps       holes and tails from the coverage index (find_gaps)
+#   empty      (symbol, tf) without any bar → [first listed bar,
+#              last closed], start resolved with one probe
+#   pending    chunks left over from an interrupted boot
+#
+# Per (symbol, tf) these ranges are merged and cut into chunks of
+# STARTUP_CHUNK_BARS, newest first, and all chunks are ordered by
+# freshness (distance from the live edge), then size (small first):
+# live tails are repaired first, deep history last.
+#
+# The plan is checkpointed in the Redis hash
+#
+#   startup_sync:chunks   "symbol:tf:start:end" → job JSON
+#
+# and runs in waves of STARTUP_WAVE_CHUNKS through the concurrent
+# backfill engine (a bounded worker pool). A wave's chunks leave the
+# hash once it finished without failed pages or DB writes (the
+# writer counts upsert_candles failures), so a restart resumes
+# with what is left — including history the gap horizon doesn't see.
+# --------------------------------------------------
+
+STARTUP_CHUNK_BARS = int(os.getenv("STARTUP_CHUNK_BARS", "5000"))
+STARTUP_WAVE_CHUNKS = int(os.getenv("STARTUP_WAVE_CHUNKS", "32"))
+CHECKPOINT_KEY = "startup_sync:chunks"
+
 logger = get_logger("market_data.binance.startup_sync")
 
 
-def run_startup_sync():
+def chunk_id(job):
+    symbol, tf, _, start, end = job
+    return f"{symbol}:{tf}:{start}:{end}"
 
-    logger.info("STARTUP BACKFILL ENGINE STARTED")
 
-    exchange_now = get_exchange_time_ms()
-    db = SessionLocal()
+def merge_ranges(ranges, step):
+    """
+    Union of inclusive [start, end] ranges; touching ranges join.
+    """
+    merged = []
 
-    try:
-        # -------------------------------------------------
-        # STEP 1 — 1m is the ONLY source of truth
-        # -------------------------------------------------
-        rows = db.execute(text("""
-            SELECT DISTINCT symbol FROM candles_1m
-        """)).fetchall()
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + step:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
 
-        symbols = [r[0] for r in rows]
+    return [tuple(r) for r in merged]
 
-        if not symbols:
-            logger.info("No symbols found in 1m table. Skipping startup backfill.")
-            return
 
-        logger.info("Source symbols from 1m: %d", len(symbols))
+def chunk_range(symbol, tf, tf_ms, start, end, bars=STARTUP_CHUNK_BARS):
+    """
+    Jobs of at most `bars` bars covering start..end, newest first.
+    """
+    chunks = []
+    span = bars * tf_ms
 
-        # -------------------------------------------------
-        # STEP 2 — Fix 1m first
-        # -------------------------------------------------
-        tf_1m = TIMEFRAMES["1m"]
-        tf_ms_1m = tf_1m["tf_ms"]
-        table_1m = tf_1m["table"]
+    while end >= start:
+        chunk_start = max(start, end - span + tf_ms)
+        chunks.append((symbol, tf, tf_ms, chunk_start, end))
+        end = chunk_start - tf_ms
 
-        expected_last_1m = floor_time(exchange_now, tf_ms_1m) - tf_ms_1m
+    return chunks
 
-        logger.info("Checking 1m gaps")
 
-        for symbol in symbols:
+def priority(job, live_edge):
+    """
+    Sort key: ms behind the live edge, then bars.
+    """
+    _, tf, tf_ms, start, end = job
+    return live_edge[tf] - end, (end - start) // tf_ms
 
-            last_open = db.execute(text("""
-                SELECT MAX(open_time)
-                FROM candles_1m
-                WHERE symbol = :symbol
-            """), {"symbol": symbol}).scalar()
 
-            if last_open and last_open < expected_last_1m:
-                logger.warning("1m GAP detected %s", symbol)
+def api_timeframes():
+    return [tf for tf, config in TIMEFRAMES.items() if config.get("api", False)]
 
-                backfill_symbol(
-                    symbol,
-                    "1m",
-                    table_1m,
-                    tf_ms_1m,
-                    last_open + tf_ms_1m,
-                    expected_last_1m,
-                )
 
-        logger.info("1m sync completed")
+# --------------------------------------------------
+# Checkpoint (Redis)
+# --------------------------------------------------
+class Checkpoint:
 
-        # -------------------------------------------------
-        # STEP 3 — Fix Higher TFs
-        # -------------------------------------------------
-        for tf, config in TIMEFRAMES.items():
+    def __init__(self, client=redis_client, key=CHECKPOINT_KEY):
+        self.client = client
+        self.key = key
 
-            if tf == "1m":
-                continue
+    def load(self):
+        """
+        Chunks of an unfinished plan.
+        """
+        try:
+            raw = self.client.hgetall(self.key)
+        except redis.RedisError:
+            logger.warning("Startup checkpoint unavailable; planning from scratch")
+            return []
 
-            # 🔥 SKIP DERIVED TF (like 2m)
-            if not config.get("api", False):
-                logger.debug("Skipping derived TF=%s", tf)
-                continue
+        return [tuple(json.loads(v)) for v in raw.values()]
 
-            table = config["table"]
-            tf_ms = config["tf_ms"]
+    def save(self, jobs):
+        try:
+            pipe = self.client.pipeline()
+            pipe.delete(self.key)
+            if jobs:
+                pipe.hset(self.key, mapping={chunk_id(j): json.dumps(j) for j in jobs})
+            pipe.execute()
+        except redis.RedisError:
+            logger.warning("Could not save startup checkpoint; a restart plans from scratch")
 
-            expected_last = floor_time(exchange_now, tf_ms) - tf_ms
+    def done(self, jobs):
+        try:
+            self.client.hdel(self.key, *[chunk_id(j) for j in jobs])
+        except redis.RedisError:
+            logger.warning("Could not checkpoint %d finished chunks", len(jobs))
 
-            logger.info("Checking TF=%s", tf)
 
-            for symbol in symbols:
+# --------------------------------------------------
+# Planning
+# --------------------------------------------------
+def collect_ranges(db, symbols, live_edge, pending, engine):
+    """
+    {(symbol, tf): [(start, end)]} still to fetch: pending chunks,
+    coverage gaps and empty timeframes.
+    """
+    ranges = {}
 
-                last_open = db.execute(text(f"""
-                    SELECT MAX(open_time)
-                    FROM {table}
-                    WHERE symbol = :symbol
-                """), {"symbol": symbol}).scalar()
+    for symbol, tf, _, start, end in pending:
+        ranges.setdefault((symbol, tf), []).append((start, end))
 
-                if not last_open:
-                    logger.info("INIT BACKFILL %s TF=%s", symbol, tf)
+    init_jobs = []
 
-                    backfill_symbol(
-                        symbol,
-                        tf,
-                        table,
-                        tf_ms,
-                        0,
-                        expected_last,
-                    )
+    for tf, expected_last in live_edge.items():
+        tf_ms = TIMEFRAMES[tf]["tf_ms"]
 
-                elif last_open < expected_last:
-                    logger.warning("GAP BACKFILL %s TF=%s", symbol, tf)
+        logger.info("Checking TF=%s", tf)
 
-                    backfill_symbol(
-                        symbol,
-                        tf,
-                        table,
-                        tf_ms,
-                        last_open + tf_ms,
-                        expected_last,
-                    )
+        for symbol, gap_start, gap_end in find_gaps(db, tf, symbols, expected_last):
+            logger.warning("GAP BACKFILL %s TF=%s", symbol, tf)
+            ranges.setdefault((symbol, tf), []).append((gap_start, gap_end))
 
-        logger.info("BOOT PHASE 1 COMPLETED SUCCESSFULLY")
+        for symbol in find_empty(db, tf, symbols):
+            known = ranges.get((symbol, tf))
+
+            if known:
+                # interrupted init: the first bar is already resolved
+                known.append((min(s for s, _ in known), expected_last))
+            else:
+                logger.info("INIT BACKFILL %s TF=%s", symbol, tf)
+                init_jobs.append((symbol, tf, tf_ms, 0, expected_last))
+
+    for symbol, tf, _, start, end in engine.resolve(init_jobs):
+        ranges.setdefault((symbol, tf), []).append((start, end))
+
+    return ranges
+
+
+def plan_chunks(ranges, live_edge):
+    jobs = []
+
+    for (symbol, tf), spans in ranges.items():
+        tf_ms = TIMEFRAMES[tf]["tf_ms"]
+
+        for start, end in merge_ranges(spans, tf_ms):
+            jobs += chunk_range(symbol, tf, tf_ms, start, min(end, live_edge[tf]))
+
+    jobs.sort(key=lambda job: priority(job, live_edge))
+    return jobs
+
+
+# --------------------------------------------------
+# Run
+# --------------------------------------------------
+def run_waves(jobs, engine, checkpoint, wave_chunks=STARTUP_WAVE_CHUNKS):
+    """
+    Backfill jobs in order, wave by wave; returns failed waves. A
+    wave with failed pages or failed DB writes stays checkpointed.
+    """
+    failed_waves = 0
+
+    for i in range(0, len(jobs), wave_chunks):
+        wave = jobs[i:i + wave_chunks]
+
+        failed_before = engine.failed + engine.write_failed
+        engine.run(wave)
+        failed = engine.failed + engine.write_failed - failed_before
+
+        if failed:
+            failed_waves += 1
+            logger.warning("Startup wave: %d failed pages / writes; its chunks stay checkpointed", failed)
+        else:
+            checkpoint.done(wave)
+
+        logger.info("Startup sync progress | chunks=%d/%d", min(i + wave_chunks, len(jobs)), len(jobs))
+
+    return failed_waves
+
+
+def run_startup_sync(checkpoint=None, engine=None):
+
+    logger.info("STARTUP BACKFILL ENGINE STARTED")
+
+    checkpoint = checkpoint or Checkpoint()
+    engine = engine or BackfillEngine()
+
+    exchange_now = get_exchange_time_ms()
+
+    # last closed bar per API timeframe (1m first)
+    live_edge = {
+        tf: floor_time(exchange_now, TIMEFRAMES[tf]["tf_ms"]) - TIMEFRAMES[tf]["tf_ms"]
+        for tf in api_timeframes()
+    }
+
+    db = SessionLocal()
+
+    try:
+        # 1m is the ONLY source of truth for the symbol list
+        rows = db.execute(text("""
+            SELECT DISTINCT symbol FROM coverage
+            WHERE dataset = 'candles' AND tf = '1m'
+        """)).fetchall()
+
+        symbols = [r[0] for r in rows]
+
+        if not symbols:
+            logger.info("No symbols found in 1m table. Skipping startup backfill.")
+            return
+
+        logger.info("Source symbols from 1m: %d", len(symbols))
+
+        pending = [job for job in checkpoint.load() if job[1] in live_edge]
+        if pending:
+            logger.info("Resuming %d checkpointed chunks", len(pending))
+
+        ranges = collect_ranges(db, symbols, live_edge, pending, engine)
 
     finally:
         db.close()
+
+    jobs = plan_chunks(ranges, live_edge)
+    checkpoint.save(jobs)
+
+    logger.info("Startup plan | chunks=%d", len(jobs))
+
+    failed_waves = run_waves(jobs, engine, checkpoint)
+
+    # HTFs with "api": False are rolled up from the repaired 1m
+    derived = sync_all(symbols, exchange_now)
+    if derived:
+        logger.info("Derived HTF bars | %s", derived)
+
+    if failed_waves:
+        logger.warning("BOOT PHASE 1 INCOMPLETE: %d waves failed, resumed on next start", failed_waves)
+    else:
+        logger.info("BOOT PHASE 1 COMPLETED SUCCESSFULLY")
@@ -1,11 +1,11 @@
-import requests
+from app.binance.weight import governed_get
 from datetime import datetime, timezone
 
 BASE_URL = "https://fapi.binance.com"
 
 
 def get_exchange_time_ms():
-    r = requests.get(f"{BASE_URL}/fapi/v1/time", timeout=5)
+    r = governed_get(f"{BASE_URL}/fapi/v1/time", timeout=5)
     r.raise_for_status()
     return r.json()["serverTime"]
 
@@ -1,12 +1,12 @@
 import time
 import json
-import requests
 
 from datetime import datetime, timezone
 from sqlalchemy import text
 
 from app.db import SessionLocal
 from app.redis_client import redis_client
+from app.binance.weight import governed_get
 
 
 # =====================================================
@@ -104,7 +104,7 @@ def fetch_funding(symbol, start_ts, end_ts):
         "limit": LIMIT
     }
 
-    r = requests.get(FUNDING_URL, params=params, timeout=10)
+    r = governed_get(FUNDING_URL, params=params, timeout=10)
 
     if r.status_code != 200:
         print("API error", symbol)
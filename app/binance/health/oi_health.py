@@ -1,6 +1,5 @@
 import time
 import json
-import requests
 
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
@@ -8,6 +7,7 @@ from zoneinfo import ZoneInfo
 from sqlalchemy import text
 
 from app.db import SessionLocal
+from app.binance.weight import governed_get
 
 
 # ======================================================
@@ -114,7 +114,7 @@ def fetch_oi(symbol, tf, start, end):
         "limit": 500
     }
 
-    r = requests.get(OI_URL, params=params, timeout=10)
+    r = governed_get(OI_URL, params=params, timeout=10)
 
     r.raise_for_status()
 
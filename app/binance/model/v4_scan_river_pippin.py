@@ -10,6 +10,7 @@ from app.models import Candle1H
 from zoneinfo import ZoneInfo
 IST = ZoneInfo("Asia/Kolkata")
 from app.telegram import send_telegram_message, format_timestamp_ist
+from app.binance.ws.candle_stream import wait_for_close
 
 
 class RADX1H:
@@ -354,6 +355,26 @@ def wait_until_next_hour_close(buffer_minutes=2):
     time.sleep(max(wait_seconds, 0))
 
 
+def wait_for_next_scan():
+    """
+    Scan as soon as the WS engine publishes the closed 1h candles;
+    fall back to the clock when the candle stream is unavailable.
+    """
+    try:
+        symbols = wait_for_close("1h", timeout=65 * 60)
+
+        if symbols:
+            print(f"1h close received for {len(symbols)} symbols")
+            return
+
+        # timed out: the stream is silent (WS engine down), don't scan stale data
+        print("No 1h close on the candle stream; waiting for the clock")
+    except Exception as e:
+        print("Candle stream unavailable:", e)
+
+    wait_until_next_hour_close()
+
+
 # -------------------------------------------------------
 # RUN
 # -------------------------------------------------------
@@ -386,4 +407,4 @@ if __name__ == "__main__":
         except Exception as e:
             print("Error:", e)
 
-        wait_until_next_hour_close()
\ No newline at end of file
+        wait_for_next_scan()
\ No newline at end of file
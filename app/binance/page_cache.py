@@ -0,0 +1,218 @@
+import os
+import io
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import urlparse
+
+import numpy as np
+
+from app.binance.weight import governed_get
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# On-disk cache of immutable REST pages
+# --------------------------------------------------
+# Closed klines, settled funding rates and published OI history never
+# change, so a page fetched once is kept on disk, content addressed:
+#
+#   key    sha1 of (endpoint path, sorted request params)
+#   file   <PAGE_CACHE_DIR>/<key[:2]>/<key>.npz
+#          compressed npz holding the response JSON (exact values,
+#          any endpoint shape)
+#
+# A page is cached only when nothing in it can change any more: it
+# is not empty, its last row is older than now - PAGE_CACHE_SAFETY_MS
+# (so a page with the forming candle never is), and either the
+# request had an endTime in the past or the page is full (limit
+# rows), so a later request with the same key can't return more.
+#
+# Hits refresh the file's mtime. Once the directory grows past
+# PAGE_CACHE_MAX_MB, the least recently used files are removed down
+# to PAGE_CACHE_LOW_WATER of the limit.
+# --------------------------------------------------
+
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE", "1") == "1"
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", os.path.join("data", "page_cache"))
+PAGE_CACHE_MAX_MB = int(os.getenv("PAGE_CACHE_MAX_MB", "2048"))
+PAGE_CACHE_SAFETY_MS = int(os.getenv("PAGE_CACHE_SAFETY_MS", "60000"))
+PAGE_CACHE_LOW_WATER = 0.9
+
+logger = get_logger("market_data.binance.page_cache")
+
+
+# last row → its time (ms), per endpoint shape
+def kline_close_time(row):
+    return int(row[6])
+
+
+def oi_time(row):
+    return int(row["timestamp"])
+
+
+def funding_time(row):
+    return int(row["fundingTime"])
+
+
+def page_key(url, params):
+    path = urlparse(url).path
+    canonical = json.dumps([path, sorted((params or {}).items())], default=str)
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def cacheable(params, data, last_time, now_ms=None):
+    """
+    True when the page can't change any more.
+    """
+    if not data:
+        return False
+
+    horizon = (now_ms or int(time.time() * 1000)) - PAGE_CACHE_SAFETY_MS
+
+    if last_time(data[-1]) >= horizon:
+        return False
+
+    end = params.get("endTime")
+    if end is not None and int(end) < horizon:
+        return True
+
+    limit = params.get("limit")
+    return limit is not None and len(data) >= int(limit)
+
+
+class PageCache:
+
+    def __init__(self, root=PAGE_CACHE_DIR, max_bytes=PAGE_CACHE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+
+        self.lock = threading.Lock()
+        self.size = None  # bytes on disk, scanned on first write
+
+        # stats (this process)
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.npz")
+
+    # ------------------------------------------
+    # Read
+    # ------------------------------------------
+    def get(self, url, params):
+        path = self.path(page_key(url, params))
+
+        try:
+            with np.load(path) as npz:
+                data = json.loads(npz["page"].tobytes())
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return data
+
+    # ------------------------------------------
+    # Write
+    # ------------------------------------------
+    def put(self, url, params, data):
+        path = self.path(page_key(url, params))
+
+        buf = io.BytesIO()
+        np.savez_compressed(buf, page=np.frombuffer(json.dumps(data).encode(), dtype=np.uint8))
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # rename is atomic: readers never see half a page
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf.getbuffer())
+        os.replace(tmp, path)
+
+        self.stored += 1
+
+        with self.lock:
+            if self.size is None:
+                self.size = self.disk_usage()
+            else:
+                self.size += buf.getbuffer().nbytes
+
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def files(self):
+        for shard in os.scandir(self.root):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(".npz"):
+                        yield entry
+
+    def disk_usage(self):
+        if not os.path.isdir(self.root):
+            return 0
+        return sum(entry.stat().st_size for entry in self.files())
+
+    def evict(self):
+        """
+        Remove least recently used pages down to the low-water mark.
+        """
+        entries = sorted(
+            ((e.stat().st_mtime, e.stat().st_size, e.path) for e in self.files()),
+        )
+
+        size = sum(s for _, s, _ in entries)
+        target = self.max_bytes * PAGE_CACHE_LOW_WATER
+
+        for _, file_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= file_size
+            self.evicted += 1
+
+        self.size = size
+        logger.info("Page cache evicted to %.1f MB | evicted=%d", size / 1e6, self.evicted)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "evicted": self.evicted,
+        }
+
+
+# Process-wide cache
+page_cache = PageCache()
+
+
+def cached_json(url, params, last_time, timeout=10, session=None, cache=None):
+    """
+    Parsed JSON of a governed GET, read through the page cache.
+    Raises for HTTP errors like resp.raise_for_status().
+    """
+    cache = cache or page_cache
+
+    if PAGE_CACHE_ENABLED:
+        data = cache.get(url, params)
+        if data is not None:
+            return data
+
+    resp = governed_get(url, params=params, timeout=timeout, session=session)
+    resp.raise_for_status()
+    data = resp.json()
+
+    if PAGE_CACHE_ENABLED and cacheable(params, data, last_time):
+        try:
+            cache.put(url, params, data)
+        except OSError:
+            logger.exception("Could not cache page %s", urlparse(url).path)
+
+    return data
@@ -1,5 +1,7 @@
 from sqlalchemy.dialects.postgresql import insert
 from app.db import SessionLocal
+from app.config import TIMEFRAMES
+from app.binance import coverage
 from app.models import Candle1M, Candle2M, Candle15M, Candle1H, Candle4H, Candle1D
 from app.logging_config import get_logger
 
@@ -45,6 +47,13 @@ def insert_candle(tf, payload):
         )
 
         db.execute(stmt)
+
+        if tf in TIMEFRAMES:
+            coverage.record(
+                db, coverage.DATASET_CANDLES, tf, TIMEFRAMES[tf]["tf_ms"],
+                [(payload["symbol"], payload["open_time"])],
+            )
+
         db.commit()
 
     except Exception:
@@ -1,16 +1,19 @@
+import os
 import time
 import json
 import argparse
-import requests
 
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
-from sqlalchemy import func
+import numpy as np
+from sqlalchemy import text
 
-from app.db import SessionLocal
+from app.db import SessionLocal, engine
 from app.config import TIMEFRAMES
 from app.binance.scripts.insert import MODEL_MAP
+from app.binance.weight import governed_get
 
 
 # ==========================================================
@@ -23,12 +26,46 @@ IST = ZoneInfo("Asia/Kolkata")
 
 DEFAULT_INTERVAL = 3600  # 1 hour
 
+LOG_DIR = "logs/health"
+os.makedirs(LOG_DIR, exist_ok=True)
+
+# open_time rows per server-side cursor fetch (one numpy chunk)
+SCAN_CHUNK_ROWS = int(os.getenv("HEALTH_SCAN_CHUNK", "100000"))
+
+# symbols scanned in parallel (one DB connection each)
+HEALTH_WORKERS = int(os.getenv("HEALTH_WORKERS", str(min(os.cpu_count() or 1, 8))))
+
 
 # ==========================================================
 # LOGGER
 # ==========================================================
 
 
+log_fp = None
+
+
+def start_run_log():
+
+    global log_fp
+
+    close_run_log()
+
+    ts = datetime.now(timezone.utc).astimezone(IST)
+
+    path = os.path.join(LOG_DIR, ts.strftime("data_health %Y-%m-%d %H-%M-%S.jsonl"))
+
+    log_fp = open(path, "a")
+
+
+def close_run_log():
+
+    global log_fp
+
+    if log_fp:
+        log_fp.close()
+        log_fp = None
+
+
 def log(level, event, **data):
 
     now_ist = datetime.now(timezone.utc).astimezone(IST)
@@ -44,7 +81,9 @@ def log(level, event, **data):
 
     print(line)
 
-    log_fp.write(line + "\n")
+    if log_fp:
+        log_fp.write(line + "\n")
+        log_fp.flush()
 
 
 # ==========================================================
@@ -53,7 +92,7 @@ def log(level, event, **data):
 
 def get_exchange_time_ms():
 
-    r = requests.get(BINANCE_TIME_URL, timeout=5)
+    r = governed_get(BINANCE_TIME_URL, timeout=5)
 
     r.raise_for_status()
 
@@ -70,7 +109,7 @@ def get_symbols():
 
     try:
 
-        rows = session.execute("SELECT name FROM symbols").fetchall()
+        rows = session.execute(text("SELECT name FROM symbols")).fetchall()
 
         return [r[0] for r in rows]
 
@@ -81,85 +120,132 @@ def get_symbols():
 # ==========================================================
 # GAP CHECK
 # ==========================================================
+#
+# open_time is streamed through a server-side cursor in
+# SCAN_CHUNK_ROWS numpy chunks, so memory stays flat however long
+# the history is. Within a chunk gaps are np.diff != tf_ms; the
+# last timestamp is carried into the next chunk so gaps across
+# chunk borders are found too. Symbols run in a process pool.
+#
+
+def iter_open_times(symbol, table, chunk_rows=SCAN_CHUNK_ROWS):
+
+    with engine.connect() as conn:
+
+        result = conn.execution_options(
+            stream_results=True,
+            max_row_buffer=chunk_rows,
+        ).execute(
+            text(f"SELECT open_time FROM {table} WHERE symbol = :symbol ORDER BY open_time"),
+            {"symbol": symbol},
+        )
 
-def check_symbol_tf(symbol, tf):
+        for rows in result.scalars().partitions(chunk_rows):
+            yield np.fromiter(rows, dtype=np.int64, count=len(rows))
 
-    Model = MODEL_MAP.get(tf)
 
-    if not Model:
-        return []
+def scan_gaps(chunks, tf_ms):
+    """
+    [(start, end)] of missing open times (inclusive) and
+    [open_time] of bars off the tf grid, over ordered chunks.
+    """
+    gaps = []
+    misaligned = []
 
-    tf_ms = int(TIMEFRAMES[tf]["tf_ms"])
+    prev = None
 
-    session = SessionLocal()
+    for chunk in chunks:
 
-    try:
+        if not len(chunk):
+            continue
 
-        rows = (
-            session.query(Model.open_time)
-            .filter(Model.symbol == symbol)
-            .order_by(Model.open_time)
-            .all()
-        )
+        ts = chunk if prev is None else np.concatenate(([prev], chunk))
+        prev = chunk[-1]
 
-        timestamps = [r[0] for r in rows]
+        diff = np.diff(ts)
 
-        gaps = []
+        for i in np.flatnonzero(diff > tf_ms):
+            gaps.append((int(ts[i]) + tf_ms, int(ts[i + 1]) - tf_ms))
 
-        for i in range(1, len(timestamps)):
+        for i in np.flatnonzero(diff < tf_ms):
+            misaligned.append(int(ts[i + 1]))
 
-            prev_ts = timestamps[i - 1]
-            curr_ts = timestamps[i]
+    return gaps, misaligned
 
-            if curr_ts - prev_ts != tf_ms:
 
-                expected = prev_ts + tf_ms
+def check_symbol_tf(symbol, tf):
 
-                gaps.append({
-                    "symbol": symbol,
-                    "tf": tf,
-                    "missing_open_time": expected
-                })
+    Model = MODEL_MAP.get(tf)
 
-        return gaps
+    if not Model:
+        return [], []
+
+    tf_ms = int(TIMEFRAMES[tf]["tf_ms"])
+
+    return scan_gaps(iter_open_times(symbol, Model.__tablename__), tf_ms)
 
-    finally:
-        session.close()
+
+def _init_worker():
+    # forked workers must not reuse the parent's pooled connections
+    engine.dispose(close=False)
 
 
 # ==========================================================
 # RUN TF CHECK
 # ==========================================================
 
-def run_tf_check(tf, symbols):
+def run_tf_check(tf, symbols, pool=None):
+
+    log("INFO", "TF_HEALTH_CHECK_START", tf=tf, symbols=len(symbols))
+
+    started = time.monotonic()
 
-    log("INFO", "TF_HEALTH_CHECK_START", tf=tf)
+    tf_ms = int(TIMEFRAMES[tf]["tf_ms"])
+
+    if pool is None:
+        results = map(check_symbol_tf, symbols, [tf] * len(symbols))
+    else:
+        results = pool.map(check_symbol_tf, symbols, [tf] * len(symbols))
 
     total_gaps = 0
+    total_missing = 0
+
+    for symbol, (gaps, misaligned) in zip(symbols, results):
 
-    for symbol in symbols:
+        for start, end in gaps:
 
-        gaps = check_symbol_tf(symbol, tf)
+            missing = (end - start) // tf_ms + 1
 
-        if gaps:
+            total_gaps += 1
+            total_missing += missing
 
-            total_gaps += len(gaps)
+            log(
+                "WARN",
+                "MISSING_CANDLE",
+                symbol=symbol,
+                tf=tf,
+                open_time=start,
+                end_time=end,
+                missing=missing
+            )
 
-            for g in gaps:
+        for open_time in misaligned:
 
-                log(
-                    "WARN",
-                    "MISSING_CANDLE",
-                    symbol=g["symbol"],
-                    tf=g["tf"],
-                    open_time=g["missing_open_time"]
-                )
+            log(
+                "WARN",
+                "MISALIGNED_CANDLE",
+                symbol=symbol,
+                tf=tf,
+                open_time=open_time
+            )
 
     log(
         "INFO",
         "TF_HEALTH_CHECK_COMPLETE",
         tf=tf,
-        gaps_found=total_gaps
+        gaps_found=total_gaps,
+        candles_missing=total_missing,
+        seconds=round(time.monotonic() - started, 1)
     )
 
 
@@ -167,30 +253,40 @@ def run_tf_check(tf, symbols):
 # HEALTH RUN
 # ==========================================================
 
-def run_health_check(target_tf=None):
+def run_health_check(target_tf=None, workers=HEALTH_WORKERS):
 
-    symbols = get_symbols()
+    start_run_log()
 
-    tfs = [target_tf] if target_tf else list(TIMEFRAMES.keys())
+    try:
 
-    for tf in tfs:
+        symbols = get_symbols()
 
-        if tf not in MODEL_MAP:
-            continue
+        tfs = [target_tf] if target_tf else list(TIMEFRAMES.keys())
+        tfs = [tf for tf in tfs if tf in MODEL_MAP]
+
+        if workers <= 1:
+            for tf in tfs:
+                run_tf_check(tf, symbols)
+            return
 
-        run_tf_check(tf, symbols)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for tf in tfs:
+                run_tf_check(tf, symbols, pool)
+
+    finally:
+        close_run_log()
 
 
 # ==========================================================
 # SCHEDULER
 # ==========================================================
 
-def scheduler(interval, tf):
+def scheduler(interval, tf, workers=HEALTH_WORKERS):
 
-    log("INFO", "DATA_HEALTH_CHECKER_STARTED")
+    log("INFO", "DATA_HEALTH_CHECKER_STARTED", workers=workers)
 
     # FIRST RUN IMMEDIATE
-    run_health_check(tf)
+    run_health_check(tf, workers)
 
     while True:
 
@@ -204,7 +300,7 @@ def scheduler(interval, tf):
 
         time.sleep(sleep_seconds)
 
-        run_health_check(tf)
+        run_health_check(tf, workers)
 
 
 # ==========================================================
@@ -228,9 +324,16 @@ def main():
         help="Run interval in seconds (default 3600)"
     )
 
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=HEALTH_WORKERS,
+        help="Symbols scanned in parallel (default HEALTH_WORKERS)"
+    )
+
     args = parser.parse_args()
 
-    scheduler(args.interval, args.tf)
+    scheduler(args.interval, args.tf, args.workers)
 
 
 # ==========================================================
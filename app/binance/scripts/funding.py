@@ -1,14 +1,17 @@
 import os
+import sys
 import json
 import time
-import requests
 
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
+
+import requests
 from sqlalchemy import text
 
 from app.db import SessionLocal
 from app.redis_client import redis_client
+from app.binance.page_cache import cached_json, funding_time
 
 
 # =====================================================
@@ -23,7 +26,10 @@ BACKFILL_DAYS = 30
 REDIS_KEY = "liquid_coins"
 
 LIMIT = 1000
-API_DELAY = 0.15
+
+# "ws"   → !markPrice@arr@1s consumer, REST only repairs gaps
+# "rest" → hourly per-symbol REST loop
+FUNDING_SOURCE = os.getenv("FUNDING_SOURCE", "ws")
 
 LOG_DIR = "logs/health"
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -216,20 +222,20 @@ def fetch_funding(symbol, start_time, end_time):
 
     log("api_request", symbol=symbol, payload=params)
 
-    resp = requests.get(FUNDING_URL, params=params, timeout=10)
+    try:
+
+        data = cached_json(FUNDING_URL, params, funding_time, timeout=10)
 
-    if resp.status_code != 200:
+    except requests.HTTPError as e:
 
         log(
             "api_failed",
             symbol=symbol,
-            response={"status": resp.status_code}
+            response={"status": e.response.status_code}
         )
 
         return []
 
-    data = resp.json()
-
     log("api_response", symbol=symbol, response={"rows": len(data)})
 
     return data
@@ -316,8 +322,6 @@ def sync_symbol_funding(symbol):
         if len(data) < LIMIT:
             break
 
-        time.sleep(API_DELAY)
-
     log(
         "symbol_complete",
         symbol=symbol,
@@ -329,7 +333,13 @@ def sync_symbol_funding(symbol):
 # ENTRY
 # =====================================================
 
-if __name__ == "__main__":
+if __name__ == "__main__" and FUNDING_SOURCE == "ws":
+
+    # a fresh interpreter: importing mark_price from here would load
+    # this module a second time (as __main__ and as its dependency)
+    os.execv(sys.executable, [sys.executable, "-m", "app.binance.ws.mark_price"])
+
+elif __name__ == "__main__":
 
     try:
 
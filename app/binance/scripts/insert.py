@@ -1,6 +1,11 @@
+import io
+from datetime import datetime
+
 from sqlalchemy.dialects.postgresql import insert
 from app.models import Candle1M, Candle15M, Candle1H, Candle4H, Candle1D, Candle5M
-from app.db import SessionLocal
+from app.db import SessionLocal, engine
+from app.config import TIMEFRAMES
+from app.binance import coverage
 from time import sleep
 MODEL_MAP = {
     "1m": Candle1M,
@@ -10,43 +15,194 @@ MODEL_MAP = {
     "4h": Candle4H,
     "1d": Candle1D,
 }
+
+# Columns refreshed when (symbol, open_time) already exists
+UPSERT_COLUMNS = [
+    "event_time",
+    "close_time",
+    "open_price",
+    "high_price",
+    "low_price",
+    "close_price",
+    "base_volume",
+    "quote_volume",
+    "taker_buy_base_volume",
+    "taker_buy_quote_volume",
+    "trade_count",
+    "is_closed",
+]
+
+# Full payload column order (matches build_payloads)
+CANDLE_COLUMNS = [
+    "symbol",
+    "interval",
+    "event_time",
+    "open_time",
+    "lk_at",
+    "close_time",
+    "first_trade_id",
+    "last_trade_id",
+    "open_price",
+    "high_price",
+    "low_price",
+    "close_price",
+    "base_volume",
+    "quote_volume",
+    "taker_buy_base_volume",
+    "taker_buy_quote_volume",
+    "trade_count",
+    "is_closed",
+]
+
+# Batches at least this large go through COPY + staging table
+COPY_THRESHOLD = 5000
+
+STAGE_TABLE = "candles_stage"
+
+
+def build_candle_upsert(Model, payloads):
+    stmt = insert(Model).values(payloads)
+
+    # ⭐ THIS PREVENTS DUPLICATES
+    return stmt.on_conflict_do_update(
+        index_elements=["symbol", "open_time"],
+        set_={c: stmt.excluded[c] for c in UPSERT_COLUMNS},
+    )
+
+
+def record_coverage(conn, tf, payloads):
+    """
+    Add the written bars to the coverage index (same transaction).
+    """
+    coverage.record(
+        conn,
+        coverage.DATASET_CANDLES,
+        tf,
+        TIMEFRAMES[tf]["tf_ms"],
+        ((p["symbol"], p["open_time"]) for p in payloads),
+    )
+
+
 def insert_candles_batch(tf, payloads):
     Model = MODEL_MAP.get(tf)
     if not Model or not payloads:
-        return
+        return False
 
     db = SessionLocal()
 
     try:
-        stmt = insert(Model).values(payloads)
         # sleep(10)  # to mitigate rare "could not serialize access" errors
-
-        stmt = stmt.on_conflict_do_update(
-            index_elements=["symbol", "open_time"],
-            set_={
-                "event_time": stmt.excluded.event_time,
-                "close_time": stmt.excluded.close_time,
-                "open_price": stmt.excluded.open_price,
-                "high_price": stmt.excluded.high_price,
-                "low_price": stmt.excluded.low_price,
-                "close_price": stmt.excluded.close_price,
-                "base_volume": stmt.excluded.base_volume,
-                "quote_volume": stmt.excluded.quote_volume,
-                "taker_buy_base_volume": stmt.excluded.taker_buy_base_volume,
-                "taker_buy_quote_volume": stmt.excluded.taker_buy_quote_volume,
-                "trade_count": stmt.excluded.trade_count,
-                "is_closed": stmt.excluded.is_closed,
-            },
-        )
+        stmt = build_candle_upsert(Model, payloads)
 
         db.execute(stmt)
+        record_coverage(db, tf, payloads)
         db.commit()
 
         print(f"[DB] Inserted batch size={len(payloads)} tf={tf}")
+        return True
 
     except Exception as e:
         db.rollback()
         print("[DB] BATCH UPSERT ERROR:", e)
+        return False
+
+    finally:
+        db.close()
+
+
+# --------------------------------------------------
+# COPY → staging table → merge
+# --------------------------------------------------
+def _copy_value(v):
+    if v is None:
+        return "\\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return str(v)
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Stream rows (sequences ordered like columns) with COPY FROM STDIN.
+    """
+    buf = io.StringIO()
+
+    for row in rows:
+        buf.write("\t".join(_copy_value(v) for v in row))
+        buf.write("\n")
+
+    buf.seek(0)
+
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+        buf,
+    )
+
+
+def merge_stage_sql(table):
+    cols = ", ".join(CANDLE_COLUMNS)
+    updates = ",\n                ".join(f"{c} = EXCLUDED.{c}" for c in UPSERT_COLUMNS)
+
+    return f"""
+        INSERT INTO {table} ({cols})
+        SELECT DISTINCT ON (symbol, open_time) {cols}
+        FROM {STAGE_TABLE}
+        ORDER BY symbol, open_time
+        ON CONFLICT (symbol, open_time) DO UPDATE SET
+                {updates}
+    """
+
+
+def copy_upsert_candles(tf, payloads):
+    Model = MODEL_MAP.get(tf)
+    if not Model or not payloads:
+        return False
+
+    table = Model.__tablename__
+
+    raw = engine.raw_connection()
+
+    try:
+        cur = raw.cursor()
+
+        # column types copied from the target, no constraints/indexes
+        cur.execute(f"""
+            CREATE TEMP TABLE {STAGE_TABLE} ON COMMIT DROP AS
+            SELECT {", ".join(CANDLE_COLUMNS)} FROM {table} WITH NO DATA
+        """)
+
+        copy_rows(
+            cur,
+            STAGE_TABLE,
+            CANDLE_COLUMNS,
+            ([p.get(c) for c in CANDLE_COLUMNS] for p in payloads),
+        )
+
+        cur.execute(merge_stage_sql(table))
+        record_coverage(cur, tf, payloads)
+
+        raw.commit()
+
+        print(f"[DB] COPY upsert size={len(payloads)} tf={tf}")
+        return True
+
+    except Exception as e:
+        raw.rollback()
+        print("[DB] COPY UPSERT ERROR:", e)
+        return False
 
     finally:
-        db.close()
\ No newline at end of file
+        raw.close()
+
+
+def upsert_candles(tf, payloads):
+    """
+    Pick the write path by batch size: multi-row INSERT for small
+    batches, COPY + staging merge for bulk backfills. Returns True
+    when the batch was written.
+    """
+    if len(payloads) >= COPY_THRESHOLD:
+        return copy_upsert_candles(tf, payloads)
+    return insert_candles_batch(tf, payloads)
@@ -14,7 +14,11 @@ from requests.adapters import HTTPAdapter
 from app.db import SessionLocal
 from app.config import TIMEFRAMES
 from app.binance.payload_builder import build_payloads
-from app.binance.scripts.insert import insert_candles_batch, MODEL_MAP
+from app.binance.scripts.insert import upsert_candles, COPY_THRESHOLD, MODEL_MAP
+from app.binance.engine.backfill import run_backfill
+from app.binance.engine.htf_engine import sync_tf
+from app.binance.page_cache import cached_json, kline_close_time
+from app.binance import coverage
 
 
 # ==========================================================
@@ -25,7 +29,6 @@ URL = "https://fapi.binance.com/fapi/v1/klines"
 
 LIMIT = 500
 MAX_RETRIES = 5
-API_SLEEP = 0.05
 
 CANDLE_BUFFER_MS = 3000
 
@@ -33,6 +36,10 @@ TFS = ["5m", "15m", "1h", "4h", "1d"]
 
 DEFAULT_HISTORY_DAYS = 90
 
+# "1" → concurrent aiohttp engine (engine.backfill), "0" → one
+# symbol at a time with process_symbol
+BACKFILL_ASYNC = os.getenv("BACKFILL_ASYNC", "1") == "1"
+
 # Optional overrides for backfill
 BACKFILL_TFS = None
 BACKFILL_SYMBOLS = None
@@ -200,6 +207,12 @@ def get_last_candles_bulk(tf):
 
     try:
 
+        last = coverage.last_times(session, coverage.DATASET_CANDLES, tf)
+
+        if last:
+            return last
+
+        # coverage not built yet → scan the table once
         rows = (
             session.query(Model.symbol, func.max(Model.open_time))
             .group_by(Model.symbol)
@@ -216,7 +229,7 @@ def get_last_candles_bulk(tf):
 # BINANCE FETCH
 # ==========================================================
 
-def fetch_klines(symbol, tf, start_time):
+def fetch_klines(symbol, tf, start_time, end_time=None):
 
     params = {
         "symbol": symbol,
@@ -225,35 +238,23 @@ def fetch_klines(symbol, tf, start_time):
         "limit": LIMIT
     }
 
+    if end_time is not None:
+        params["endTime"] = end_time
+
     for retry in range(MAX_RETRIES):
 
         try:
 
-            r = session_http.get(
+            # weight, 429 / 418 pauses: app.binance.weight;
+            # closed pages come from the on-disk page cache
+            return cached_json(
                 URL,
-                params=params,
-                timeout=(3, 10)
+                params,
+                kline_close_time,
+                timeout=(3, 10),
+                session=session_http
             )
 
-            if r.status_code == 429:
-
-                sleep = 2 ** retry
-
-                log(
-                    "WARN",
-                    "RATE_LIMIT",
-                    symbol=symbol,
-                    sleep=sleep
-                )
-
-                time.sleep(sleep)
-
-                continue
-
-            r.raise_for_status()
-
-            return r.json()
-
         except Exception:
 
             log(
@@ -272,10 +273,11 @@ def fetch_klines(symbol, tf, start_time):
 # PROCESS SYMBOL
 # ==========================================================
 
-def process_symbol(symbol, tf, safe_now, last_ts_map):
-
-    tf_ms = get_tf_ms(tf)
-
+def get_symbol_range(symbol, tf_ms, safe_now, last_ts_map):
+    """
+    (cursor, end_ts) still missing for a symbol; cursor > end_ts
+    when it is up to date.
+    """
     start_ts, range_end = get_backfill_range()
 
     last_ts = last_ts_map.get(symbol)
@@ -285,13 +287,27 @@ def process_symbol(symbol, tf, safe_now, last_ts_map):
     else:
         cursor = align(start_ts, tf_ms)
 
-    end_ts = align(min(safe_now, range_end), tf_ms)
+    # last bar that has closed
+    end_ts = align(min(safe_now, range_end), tf_ms) - tf_ms
+
+    return cursor, end_ts
+
+
+def process_symbol(symbol, tf, safe_now, last_ts_map):
+
+    tf_ms = get_tf_ms(tf)
+
+    cursor, end_ts = get_symbol_range(symbol, tf_ms, safe_now, last_ts_map)
 
     if cursor > end_ts:
         return 0
 
     total = 0
 
+    # pages accumulate until COPY_THRESHOLD so large backfills
+    # take the COPY path; small catch-ups stay on plain upserts
+    pending = []
+
     while cursor <= end_ts:
 
         klines = fetch_klines(symbol, tf, cursor)
@@ -307,20 +323,11 @@ def process_symbol(symbol, tf, safe_now, last_ts_map):
             if cursor <= p["open_time"] <= end_ts
         ]
 
-        if payloads:
-
-            try:
-                insert_candles_batch(tf, payloads)
-
-            except Exception:
+        pending.extend(payloads)
 
-                log(
-                    "ERROR",
-                    "DB_INSERT_FAILED",
-                    symbol=symbol,
-                    tf=tf,
-                    trace=traceback.format_exc()
-                )
+        if len(pending) >= COPY_THRESHOLD:
+            flush_payloads(symbol, tf, pending)
+            pending = []
 
         total += len(payloads)
 
@@ -340,11 +347,30 @@ def process_symbol(symbol, tf, safe_now, last_ts_map):
 
         cursor = last_open_time + 1
 
-        time.sleep(API_SLEEP)
+    flush_payloads(symbol, tf, pending)
 
     return total
 
 
+def flush_payloads(symbol, tf, payloads):
+
+    if not payloads:
+        return
+
+    try:
+        upsert_candles(tf, payloads)
+
+    except Exception:
+
+        log(
+            "ERROR",
+            "DB_INSERT_FAILED",
+            symbol=symbol,
+            tf=tf,
+            trace=traceback.format_exc()
+        )
+
+
 # ==========================================================
 # RUN TIMEFRAME
 # ==========================================================
@@ -357,8 +383,34 @@ def run_tf(tf, symbols):
 
     log("INFO", "TF_CHECK", tf=tf)
 
+    # derived TF: roll up from candles_1m instead of fetching
+    if not TIMEFRAMES.get(tf, {}).get("api", True):
+
+        tf_ms = get_tf_ms(tf)
+        written = sync_tf(tf, symbols, align(safe_now, tf_ms) - tf_ms)
+
+        log("INFO", "TF_DERIVED", tf=tf, candles=written)
+
+        return
+
     last_ts_map = get_last_candles_bulk(tf)
 
+    if BACKFILL_ASYNC:
+
+        tf_ms = get_tf_ms(tf)
+        jobs = []
+
+        for symbol in symbols:
+            cursor, end_ts = get_symbol_range(symbol, tf_ms, safe_now, last_ts_map)
+            if cursor <= end_ts:
+                jobs.append((symbol, tf, tf_ms, cursor, end_ts))
+
+        if jobs:
+            stats = run_backfill(jobs)
+            log("INFO", "TF_BACKFILLED", tf=tf, symbols=len(jobs), **stats)
+
+        return
+
     for symbol in symbols:
 
         try:
@@ -0,0 +1,313 @@
+import os
+import re
+import zipfile
+import hashlib
+import argparse
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from app.db import engine
+from app.binance.scripts.helpers import IST
+from app.binance.scripts.insert import upsert_candles, MODEL_MAP
+from app.logging_config import get_logger
+
+
+# ==========================================================
+# CONFIG
+# ==========================================================
+#
+# Bulk load of Binance public-data kline archives
+# (data.binance.vision, futures/um/{monthly,daily}/klines):
+#
+#   <SYMBOL>-<tf>-<YYYY-MM>.zip       monthly
+#   <SYMBOL>-<tf>-<YYYY-MM-DD>.zip    daily
+#
+# each holding one CSV with the /fapi/v1/klines columns (newer
+# files start with a header line). The CSV is read straight from the
+# ZIP in LOADER_CHUNK_ROWS chunks with pandas' C parser (floats with
+# round_trip precision, so values equal float() of the REST strings),
+# turned into build_payloads rows and written with upsert_candles
+# (COPY + staging merge, coverage in the same transaction).
+#
+# Files are loaded in a process pool of LOADER_WORKERS; a
+# <file>.CHECKSUM next to a ZIP is verified before loading.
+
+ZIP_NAME = re.compile(r"^(?P<symbol>[A-Z0-9]+)-(?P<tf>\w+)-(?P<period>\d{4}-\d{2}(?:-\d{2})?)\.zip$")
+
+KLINE_COLUMNS = [
+    "open_time",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "close_time",
+    "quote_volume",
+    "count",
+    "taker_buy_volume",
+    "taker_buy_quote_volume",
+    "ignore",
+]
+
+KLINE_DTYPES = {
+    "open_time": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.float64,
+    "close_time": np.int64,
+    "quote_volume": np.float64,
+    "count": np.int64,
+    "taker_buy_volume": np.float64,
+    "taker_buy_quote_volume": np.float64,
+}
+
+# open_time at or above this is in microseconds (spot files since 2025)
+MICROSECOND_TIMES = 10 ** 15
+
+LOADER_CHUNK_ROWS = int(os.getenv("LOADER_CHUNK_ROWS", "50000"))
+LOADER_WORKERS = int(os.getenv("LOADER_WORKERS", str(os.cpu_count() or 1)))
+
+logger = get_logger("market_data.binance.kline_zip_loader")
+
+
+# ==========================================================
+# FILES
+# ==========================================================
+
+def parse_name(path):
+    """
+    (symbol, tf) of an archive file name, None if it isn't one.
+    """
+    match = ZIP_NAME.match(os.path.basename(path))
+    if not match:
+        return None
+    return match["symbol"], match["tf"]
+
+
+def find_archives(root, tfs=None, symbols=None):
+    """
+    [(path, symbol, tf)] of loadable ZIPs under root, sorted.
+    """
+    found = []
+
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            parsed = parse_name(name)
+            if not parsed:
+                continue
+
+            symbol, tf = parsed
+
+            if tf not in MODEL_MAP:
+                logger.warning("Skipping %s: no candles table for tf=%s", name, tf)
+                continue
+            if tfs and tf not in tfs:
+                continue
+            if symbols and symbol not in symbols:
+                continue
+
+            found.append((os.path.join(dirpath, name), symbol, tf))
+
+    return sorted(found)
+
+
+def verify_checksum(path):
+    """
+    False if <path>.CHECKSUM exists and doesn't match.
+    """
+    checksum = f"{path}.CHECKSUM"
+    if not os.path.exists(checksum):
+        return True
+
+    with open(checksum) as f:
+        expected = f.read().split()[0].lower()
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest() == expected
+
+
+# ==========================================================
+# DECODE
+# ==========================================================
+
+def iter_frames(path, chunk_rows=LOADER_CHUNK_ROWS):
+    """
+    DataFrames of the kline CSV inside a ZIP, chunk_rows at a time.
+    """
+    with zipfile.ZipFile(path) as zf:
+        for member in zf.namelist():
+            if not member.endswith(".csv"):
+                continue
+
+            with zf.open(member) as f:
+                has_header = not f.readline()[:1].isdigit()
+
+            with zf.open(member) as f:
+                yield from pd.read_csv(
+                    f,
+                    header=None,
+                    names=KLINE_COLUMNS,
+                    usecols=list(KLINE_DTYPES),
+                    dtype=KLINE_DTYPES,
+                    skiprows=1 if has_header else 0,
+                    float_precision="round_trip",
+                    chunksize=chunk_rows,
+                )
+
+
+def frame_payloads(symbol, tf, frame):
+    """
+    build_payloads() rows of one decoded chunk.
+    """
+    open_time = frame["open_time"].to_numpy()
+    close_time = frame["close_time"].to_numpy()
+
+    if len(open_time) and open_time[0] >= MICROSECOND_TIMES:
+        open_time = open_time // 1000
+        close_time = close_time // 1000
+
+    lk_at = pd.to_datetime(open_time, unit="ms", utc=True).tz_convert(IST).to_pydatetime()
+
+    columns = zip(
+        open_time.tolist(),
+        lk_at,
+        close_time.tolist(),
+        frame["open"].tolist(),
+        frame["high"].tolist(),
+        frame["low"].tolist(),
+        frame["close"].tolist(),
+        frame["volume"].tolist(),
+        frame["quote_volume"].tolist(),
+        frame["taker_buy_volume"].tolist(),
+        frame["taker_buy_quote_volume"].tolist(),
+        frame["count"].tolist(),
+    )
+
+    return [
+        {
+            "symbol": symbol,
+            "interval": tf,
+            "event_time": None,
+
+            "open_time": ot,
+            "lk_at": lk,
+            "close_time": ct,
+
+            "first_trade_id": None,
+            "last_trade_id": None,
+
+            "open_price": o,
+            "high_price": h,
+            "low_price": l,
+            "close_price": c,
+
+            "base_volume": v,
+            "quote_volume": qv,
+            "taker_buy_base_volume": tbv,
+            "taker_buy_quote_volume": tbqv,
+
+            "trade_count": n,
+            "is_closed": True,
+        }
+        for ot, lk, ct, o, h, l, c, v, qv, tbv, tbqv, n in columns
+    ]
+
+
+# ==========================================================
+# LOAD
+# ==========================================================
+
+def load_archive(path, symbol, tf, chunk_rows=LOADER_CHUNK_ROWS):
+    """
+    Decode and upsert one ZIP. Returns (path, rows written, failed chunks).
+    """
+    if not verify_checksum(path):
+        logger.error("CHECKSUM MISMATCH %s", path)
+        return path, 0, 1
+
+    rows = failed = 0
+
+    try:
+        for frame in iter_frames(path, chunk_rows):
+            payloads = frame_payloads(symbol, tf, frame)
+
+            if upsert_candles(tf, payloads):
+                rows += len(payloads)
+            else:
+                failed += 1
+
+    except (zipfile.BadZipFile, ValueError) as e:
+        logger.error("Unreadable archive %s: %s", path, e)
+        failed += 1
+
+    return path, rows, failed
+
+
+def _init_worker():
+    # forked workers must not reuse the parent's pooled connections
+    engine.dispose(close=False)
+
+
+def load_directory(root, tfs=None, symbols=None, workers=LOADER_WORKERS):
+    """
+    Load every matching ZIP under root. Returns totals.
+    """
+    archives = find_archives(root, tfs, symbols)
+    logger.info("Loading %d archives from %s | workers=%d", len(archives), root, workers)
+
+    totals = {"files": 0, "rows": 0, "failed_files": 0}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(load_archive, path, symbol, tf) for path, symbol, tf in archives]
+
+        for future in as_completed(futures):
+            path, rows, failed = future.result()
+
+            totals["files"] += 1
+            totals["rows"] += rows
+
+            if failed:
+                totals["failed_files"] += 1
+                logger.warning("Archive %s: %d failed chunks", os.path.basename(path), failed)
+
+            logger.info("Loaded %s | rows=%d (%d/%d)", os.path.basename(path), rows, totals["files"], len(archives))
+
+    logger.info("Archive load finished | %s", totals)
+    return totals
+
+
+# ==========================================================
+# ENTRY
+# ==========================================================
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Load Binance monthly/daily kline ZIPs into candles_*")
+
+    parser.add_argument("root", help="Directory with <SYMBOL>-<tf>-<period>.zip files (searched recursively)")
+    parser.add_argument("--tf", action="append", help="Only these timeframes")
+    parser.add_argument("--symbol", action="append", help="Only these symbols")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=LOADER_WORKERS,
+        help="Archives loaded in parallel (default LOADER_WORKERS)"
+    )
+
+    args = parser.parse_args()
+
+    load_directory(args.root, args.tf, args.symbol, args.workers)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -1,13 +1,15 @@
 import os
 import json
 import time
-import requests
 
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 from sqlalchemy import text
 
 from app.db import SessionLocal
+from app.binance.weight import governed_get
+from app.binance.page_cache import cached_json, oi_time
+from app.binance import coverage
 
 
 # =========================================================
@@ -19,7 +21,6 @@ TIME_URL = "https://fapi.binance.com/fapi/v1/time"
 
 IST = ZoneInfo("Asia/Kolkata")
 
-API_DELAY = 0.15
 OFFSET_REFRESH = 600
 
 LOG_DIR = "logs/health"
@@ -104,7 +105,7 @@ def log(event, tf=None, symbol=None, payload=None, response=None, **extra):
 
 def get_exchange_offset():
 
-    r = requests.get(TIME_URL, timeout=5)
+    r = governed_get(TIME_URL, timeout=5)
 
     r.raise_for_status()
 
@@ -160,18 +161,20 @@ def get_last_oi_map(tf):
 
     try:
 
-        rows = session.execute(
-            text(f"""
-            SELECT symbol, MAX(open_time) AS last_ts
-            FROM {table}
-            GROUP BY symbol
-            """)
-        ).fetchall()
+        result = coverage.last_times(session, coverage.DATASET_OI, tf)
 
-        result = {}
+        # coverage not built yet → scan the table once
+        if not result:
+            rows = session.execute(
+                text(f"""
+                SELECT symbol, MAX(open_time) AS last_ts
+                FROM {table}
+                GROUP BY symbol
+                """)
+            ).fetchall()
 
-        for r in rows:
-            result[r[0]] = r[1]
+            for r in rows:
+                result[r[0]] = r[1]
 
         return result
 
@@ -207,6 +210,11 @@ def insert_rows(rows, tf, symbol):
             rows
         )
 
+        coverage.record(
+            session, coverage.DATASET_OI, tf, OI_TFS[tf],
+            ((r["symbol"], r["open_time"]) for r in rows),
+        )
+
         session.commit()
 
         log(
@@ -249,11 +257,7 @@ def fetch_oi(symbol, tf, start, end):
             payload=payload
         )
 
-        r = requests.get(OI_URL, params=payload, timeout=(3, 10))
-
-        r.raise_for_status()
-
-        data = r.json()
+        data = cached_json(OI_URL, payload, oi_time, timeout=(3, 10))
 
         if not data:
 
@@ -335,8 +339,6 @@ def process_symbol(symbol, tf, tf_ms, expected, last_map):
 
     insert_rows(rows, tf, symbol)
 
-    time.sleep(API_DELAY)
-
 
 # =========================================================
 # RUN TF
@@ -0,0 +1,103 @@
+import json
+import time
+
+import redis
+
+from app.redis_client import redis_client
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Liquid symbol universe
+# --------------------------------------------------
+# The liquidity worker stores the full list in UNIVERSE_KEY (JSON)
+# and publishes what changed on UNIVERSE_CHANNEL:
+#
+#   {"added": [...], "removed": [...], "count": 120, "ts": <ms>}
+#
+# Pub/sub is fire-and-forget, so consumers still reconcile against
+# the full key now and then.
+# --------------------------------------------------
+
+UNIVERSE_KEY = "liquid_coins"
+UNIVERSE_CHANNEL = "liquid_coins:delta"
+
+logger = get_logger("market_data.binance.universe")
+
+
+def load_universe(client=redis_client):
+    data = client.get(UNIVERSE_KEY)
+    return json.loads(data) if data else []
+
+
+def publish_universe(coins, client=redis_client):
+    """
+    Store the new universe and announce the delta.
+    Returns (added, removed).
+    """
+    previous = set(load_universe(client))
+    current = set(coins)
+
+    added = sorted(current - previous)
+    removed = sorted(previous - current)
+
+    pipe = client.pipeline()
+    pipe.set(UNIVERSE_KEY, json.dumps(coins))
+
+    if added or removed:
+        pipe.publish(UNIVERSE_CHANNEL, json.dumps({
+            "added": added,
+            "removed": removed,
+            "count": len(coins),
+            "ts": int(time.time() * 1000),
+        }))
+
+    pipe.execute()
+
+    return added, removed
+
+
+class UniverseListener:
+    """
+    Blocking reader of universe deltas; reconnects on Redis errors.
+    """
+
+    def __init__(self, client=redis_client):
+        self.client = client
+        self.pubsub = None
+
+    def _connect(self):
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(UNIVERSE_CHANNEL)
+
+    def wait(self, timeout=1.0):
+        """
+        Next delta dict, or None after `timeout` seconds.
+        """
+        try:
+            if self.pubsub is None:
+                self._connect()
+
+            message = self.pubsub.get_message(timeout=timeout)
+
+        except redis.RedisError:
+            logger.exception("Universe channel error; reconnecting")
+            self.close()
+            time.sleep(timeout)
+            return None
+
+        if not message or message["type"] != "message":
+            return None
+
+        try:
+            return json.loads(message["data"])
+        except ValueError:
+            logger.warning("Invalid universe delta: %r", message["data"])
+            return None
+
+    def close(self):
+        if self.pubsub is not None:
+            try:
+                self.pubsub.close()
+            except Exception:
+                pass
+            self.pubsub = None
@@ -0,0 +1,324 @@
+import os
+import time
+import asyncio
+from urllib.parse import urlparse
+
+import redis
+import requests
+
+from app.redis_client import redis_client
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Binance API weight governor (shared by all workers)
+# --------------------------------------------------
+# Every REST call to fapi.binance.com takes its endpoint weight from
+# Redis token buckets first, so all processes on this IP share one
+# budget. Buckets (Binance USDⓈ-M limits per IP):
+#
+#   weight    2400 / 60 s    request weight (klines, time, ticker, ...)
+#   funding    500 / 300 s   /fapi/v1/fundingRate (+ fundingInfo)
+#   data      1000 / 300 s   /futures/data/* (openInterestHist, ...)
+#
+# A bucket refills at HEADROOM × limit per window and holds at most
+# (1 - HEADROOM) × limit, so even a full bucket plus a window of
+# refill stays within the exchange limit. Acquire is one Lua script
+# (refill, check every bucket, take or report the wait).
+#
+# Adaptive pacing: X-MBX-USED-WEIGHT-1M is the exchange's own count
+# for the current minute; the weight bucket is clamped to what is
+# really left. 429 pauses everyone for Retry-After; 418 (IP ban)
+# opens the circuit until the ban ends.
+#
+# Without Redis the governor falls back to pacing each request
+# locally by its weight (418/429 pauses are kept per process). The
+# governor itself never sleeps on a Redis path: acquire() sleeps,
+# acquire_async() awaits and runs the Redis calls in a thread, so
+# one throttled response doesn't stall the backfill event loop.
+# --------------------------------------------------
+
+BINANCE_WEIGHT_LIMIT = int(os.getenv("BINANCE_WEIGHT_LIMIT", "2400"))
+HEADROOM = float(os.getenv("BINANCE_WEIGHT_HEADROOM", "0.9"))
+
+# bucket → (limit, window seconds)
+BUCKETS = {
+    "weight": (BINANCE_WEIGHT_LIMIT, 60),
+    "funding": (500, 300),
+    "data": (1000, 300),
+}
+
+LIMITS_PREFIX = "binance:limits"
+
+MAX_RETRIES = 5
+DEFAULT_RETRY_AFTER = 60  # seconds, 418/429 without Retry-After
+
+logger = get_logger("market_data.binance.weight")
+
+
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local blocked = tonumber(redis.call('GET', KEYS[#KEYS]) or '0')
+if blocked > now then
+    return blocked - now
+end
+
+local wait = 0
+local tokens = {}
+
+for i = 1, #KEYS - 1 do
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local rate = tonumber(ARGV[i * 3])
+    local cost = tonumber(ARGV[i * 3 + 1])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local t = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+
+    t = math.min(capacity, t + math.max(0, now - ts) * rate)
+    tokens[i] = t
+
+    if t < cost then
+        wait = math.max(wait, math.ceil((cost - t) / rate))
+    end
+end
+
+for i = 1, #KEYS - 1 do
+    local t = tokens[i]
+    if wait == 0 then
+        t = t - tonumber(ARGV[i * 3 + 1])
+    end
+    redis.call('HSET', KEYS[i], 'tokens', tostring(t), 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], 900000)
+end
+
+return wait
+"""
+
+# clamp the weight bucket to limit - used (exchange count)
+SYNC_SCRIPT = """
+local now = tonumber(ARGV[1])
+local left = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local rate = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local t = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+
+t = math.min(capacity, t + math.max(0, now - ts) * rate, left)
+redis.call('HSET', KEYS[1], 'tokens', tostring(t), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 900000)
+return 0
+"""
+
+# keeps the later of the current and the new block
+BLOCK_SCRIPT = """
+local until_ms = tonumber(ARGV[1])
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if until_ms > current then
+    redis.call('SET', KEYS[1], until_ms, 'PX', math.max(1, until_ms - tonumber(ARGV[2])))
+end
+return 0
+"""
+
+
+def kline_weight(limit):
+    """
+    Request weight of GET /fapi/v1/klines for a given limit.
+    """
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+def request_cost(path, params=None):
+    """
+    {bucket: weight} of one request to a fapi path.
+    """
+    params = params or {}
+
+    if path == "/fapi/v1/klines":
+        return {"weight": kline_weight(int(params.get("limit", 500)))}
+
+    if path == "/fapi/v1/fundingRate":
+        return {"funding": 1}
+
+    if path.startswith("/futures/data/"):
+        return {"data": 1}
+
+    if path == "/fapi/v1/ticker/24hr":
+        return {"weight": 1 if "symbol" in params else 40}
+
+    return {"weight": 1}
+
+
+def bucket_config(name):
+    limit, window = BUCKETS[name]
+    rate = limit * HEADROOM / (window * 1000)  # tokens per ms
+    capacity = max(limit * (1 - HEADROOM), 1)
+    return capacity, rate
+
+
+class WeightGovernor:
+
+    def __init__(self, client=redis_client, prefix=LIMITS_PREFIX):
+        self.client = client
+        self.prefix = prefix
+
+        self._acquire = client.register_script(ACQUIRE_SCRIPT)
+        self._sync = client.register_script(SYNC_SCRIPT)
+        self._block = client.register_script(BLOCK_SCRIPT)
+
+        self.block_key = f"{prefix}:blocked_until"
+        self.last_redis_error = 0.0
+        self.local_blocked_until = 0.0  # monotonic, without Redis
+
+        # stats (this process)
+        self.requests = 0
+        self.waited = 0.0
+        self.throttled = 0
+
+    # ------------------------------------------
+    # Tokens
+    # ------------------------------------------
+    def try_acquire(self, cost):
+        """
+        Take `cost` ({bucket: weight}) from every bucket at once.
+        Returns (granted, seconds to wait): wait then retry when not
+        granted; when granted without Redis, wait to pace locally.
+        Never sleeps, so the async path can await the wait.
+        """
+        keys, args = [], [int(time.time() * 1000)]
+
+        for name, weight in cost.items():
+            capacity, rate = bucket_config(name)
+            keys.append(f"{self.prefix}:{name}")
+            args += [capacity, rate, weight]
+
+        keys.append(self.block_key)
+
+        try:
+            wait_ms = int(self._acquire(keys=keys, args=args))
+        except redis.RedisError:
+            return self._local_wait(cost)
+
+        return not wait_ms, wait_ms / 1000
+
+    def _local_wait(self, cost):
+        now = time.monotonic()
+        if now - self.last_redis_error >= 60:
+            logger.warning("Weight governor without Redis; pacing locally")
+            self.last_redis_error = now
+
+        # 418/429 pause recorded while Redis was down
+        if self.local_blocked_until > now:
+            return False, self.local_blocked_until - now
+
+        # grant, paced at the bucket rate
+        return True, max(weight / (bucket_config(name)[1] * 1000) for name, weight in cost.items())
+
+    def acquire(self, cost):
+        started = time.monotonic()
+
+        while True:
+            granted, wait = self.try_acquire(cost)
+            if wait:
+                time.sleep(wait)
+            if granted:
+                break
+
+        self.requests += 1
+        self.waited += time.monotonic() - started
+
+    async def acquire_async(self, cost):
+        started = time.monotonic()
+
+        while True:
+            # Redis round-trip off the event loop
+            granted, wait = await asyncio.to_thread(self.try_acquire, cost)
+            if wait:
+                await asyncio.sleep(wait)
+            if granted:
+                break
+
+        self.requests += 1
+        self.waited += time.monotonic() - started
+
+    # ------------------------------------------
+    # Feedback from responses
+    # ------------------------------------------
+    def block(self, seconds):
+        """
+        Pause every worker for `seconds`; acquire waits it out.
+        """
+        now = int(time.time() * 1000)
+        try:
+            self._block(keys=[self.block_key], args=[now + int(seconds * 1000), now])
+        except redis.RedisError:
+            self.local_blocked_until = max(self.local_blocked_until, time.monotonic() + seconds)
+
+    def observe(self, status, headers):
+        """
+        Feed back status and headers of a response.
+        """
+        used = headers.get("X-MBX-USED-WEIGHT-1M")
+
+        if used is not None:
+            capacity, rate = bucket_config("weight")
+            left = BINANCE_WEIGHT_LIMIT * HEADROOM - int(used)
+            try:
+                self._sync(
+                    keys=[f"{self.prefix}:weight"],
+                    args=[int(time.time() * 1000), left, capacity, rate],
+                )
+            except redis.RedisError:
+                pass
+
+        if status not in (418, 429):
+            return
+
+        self.throttled += 1
+        retry_after = int(headers.get("Retry-After") or DEFAULT_RETRY_AFTER)
+        self.block(retry_after)
+
+        if status == 418:
+            logger.error("IP banned by Binance; all workers paused for %ds", retry_after)
+        else:
+            logger.warning("Rate limited (429); all workers paused for %ds", retry_after)
+
+    async def observe_async(self, status, headers):
+        await asyncio.to_thread(self.observe, status, headers)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "waited_sec": round(self.waited, 1),
+            "throttled": self.throttled,
+        }
+
+
+# Process-wide governor
+governor = WeightGovernor()
+
+
+def governed_get(url, params=None, timeout=10, session=None):
+    """
+    requests GET that acquires the endpoint weight first and feeds
+    the response back. 418/429 are retried once the shared pause is
+    over; the last response is returned either way.
+    """
+    http = session or requests
+    cost = request_cost(urlparse(url).path, params)
+
+    for _ in range(MAX_RETRIES):
+        governor.acquire(cost)
+
+        resp = http.get(url, params=params, timeout=timeout)
+        governor.observe(resp.status_code, resp.headers)
+
+        if resp.status_code not in (418, 429):
+            return resp
+
+    return resp
@@ -0,0 +1,227 @@
+import time
+
+from app.db import engine
+from app.config import TIMEFRAMES
+from app.binance import coverage
+from app.binance.scripts.insert import MODEL_MAP, build_candle_upsert
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Micro-batching candle writer
+# --------------------------------------------------
+# CandleRecords are buffered per timeframe (deduplicated on
+# (symbol, open_time), last write wins) and turned into rows only
+# at flush: one multi-row upsert per table, all in a single
+# transaction on a long-lived connection, which also merges the
+# flushed keys into the coverage index.
+#
+# Buffers are nested tf → open_time → symbol → record: a burst shares
+# one open_time, so buffering allocates no per-record key tuple
+# (GC-tracked) on the hot path.
+# --------------------------------------------------
+
+BATCH_MAX_ROWS = 2000
+BATCH_MAX_WAIT = 0.25  # seconds a row may wait before a flush
+MAX_FLUSH_RETRIES = 5  # None → never drop (rows are replayable, e.g. journal)
+MAX_RETRY_BACKOFF = 5.0
+
+logger = get_logger("market_data.binance.ws.batch_writer")
+
+
+class CandleBatchWriter:
+
+    def __init__(self, max_rows=BATCH_MAX_ROWS, max_wait=BATCH_MAX_WAIT, max_retries=MAX_FLUSH_RETRIES, on_commit=None):
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+
+        # on_commit(records) after each committed flush
+        self.on_commit = on_commit
+
+        self.pending = {}
+        self.pending_rows = 0
+        self.oldest_at = None
+
+        self.conn = None
+        self.failed_attempts = 0
+        self.retry_at = 0.0
+
+        # stats
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_rows = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    # ------------------------------------------
+    # Buffering
+    # ------------------------------------------
+    def add(self, record):
+        tf = record.interval
+
+        if tf not in MODEL_MAP:
+            return
+
+        by_time = self.pending.setdefault(tf, {})
+        rows = by_time.get(record.open_time)
+
+        if rows is None:
+            rows = by_time[record.open_time] = {}
+
+        if record.symbol not in rows:
+            self.pending_rows += 1
+
+        rows[record.symbol] = record
+
+        if self.oldest_at is None:
+            self.oldest_at = time.monotonic()
+
+    def time_to_flush(self):
+        """
+        Seconds until the time limit forces a flush (None if empty).
+        """
+        if self.oldest_at is None:
+            return None
+        deadline = max(self.oldest_at + self.max_wait, self.retry_at)
+        return max(0.0, deadline - time.monotonic())
+
+    def due(self):
+        if not self.pending_rows:
+            return False
+        if self.retry_at > time.monotonic():
+            return False
+        return self.pending_rows >= self.max_rows or self.time_to_flush() == 0.0
+
+    # ------------------------------------------
+    # Flush
+    # ------------------------------------------
+    def _connection(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = engine.connect()
+        return self.conn
+
+    def _reset_connection(self):
+        try:
+            if self.conn is not None:
+                self.conn.invalidate()
+                self.conn.close()
+        except Exception:
+            pass
+        self.conn = None
+
+    def flush(self):
+        if not self.pending_rows:
+            return 0
+
+        started = time.perf_counter()
+        rows = self.pending_rows
+
+        try:
+            conn = self._connection()
+
+            with conn.begin():
+                for tf, by_time in self.pending.items():
+                    if by_time:
+                        payloads = [r.to_row() for rows in by_time.values() for r in rows.values()]
+                        conn.execute(build_candle_upsert(MODEL_MAP[tf], payloads))
+
+                # coverage locks in a fixed tf order (no deadlocks between writers)
+                for tf in sorted(self.pending):
+                    if self.pending[tf]:
+                        coverage.record(
+                            conn, coverage.DATASET_CANDLES, tf,
+                            TIMEFRAMES[tf]["tf_ms"], self.keys(tf),
+                        )
+
+        except Exception:
+            self.failures += 1
+            self.failed_attempts += 1
+            self._reset_connection()
+
+            logger.exception(
+                "Flush failed rows=%d attempt=%d/%s",
+                rows, self.failed_attempts, self.max_retries,
+            )
+
+            # exponential backoff between attempts
+            self.retry_at = time.monotonic() + min(
+                0.1 * 2 ** self.failed_attempts, MAX_RETRY_BACKOFF
+            )
+
+            if self.max_retries is not None and self.failed_attempts >= self.max_retries:
+                logger.error("Dropping %d rows after %d failed flushes", rows, self.failed_attempts)
+                self.dropped += rows
+                self._clear()
+
+            return 0
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        self.flushes += 1
+        self.rows_written += rows
+        self.last_flush_rows = rows
+        self.last_flush_ms = elapsed_ms
+        self.total_flush_ms += elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+        logger.info(
+            "Flushed rows=%d tables=%d ms=%.1f",
+            rows, sum(1 for v in self.pending.values() if v), elapsed_ms,
+        )
+
+        if self.on_commit is not None:
+            try:
+                self.on_commit(self.records())
+            except Exception:
+                logger.exception("on_commit callback failed")
+
+        self._clear()
+        return rows
+
+    def keys(self, tf):
+        return [
+            (symbol, open_time)
+            for open_time, rows in self.pending[tf].items()
+            for symbol in rows
+        ]
+
+    def records(self):
+        return [
+            r
+            for by_time in self.pending.values()
+            for rows in by_time.values()
+            for r in rows.values()
+        ]
+
+    def _clear(self):
+        self.pending = {}
+        self.pending_rows = 0
+        self.oldest_at = None
+        self.failed_attempts = 0
+        self.retry_at = 0.0
+
+    def close(self):
+        self.flush()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    # ------------------------------------------
+    # Stats
+    # ------------------------------------------
+    def stats(self):
+        return {
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "pending_rows": self.pending_rows,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_rows": self.last_flush_rows,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_rows": round(self.rows_written / self.flushes, 2) if self.flushes else 0,
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
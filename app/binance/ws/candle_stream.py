@@ -0,0 +1,241 @@
+import os
+import time
+
+import redis
+
+from app.redis_client import redis_client
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Closed-candle fan-out (Redis Streams)
+# --------------------------------------------------
+# One stream per timeframe, "<STREAM_PREFIX>:<tf>" (candles:1m,
+# candles:1h, ...), one entry per closed candle (WS and HTF-derived).
+# The DB worker publishes after the flush that committed the rows, so
+# a consumer that queries Postgres on an event finds the row.
+#
+# Delivery is at-least-once: a restart replays the journal and
+# re-publishes those candles. Consumers dedupe on (symbol, open_time).
+# Streams are trimmed to ~STREAM_MAXLEN entries.
+# --------------------------------------------------
+
+STREAM_ENABLED = os.getenv("CANDLE_STREAMS", "1") == "1"
+STREAM_PREFIX = os.getenv("CANDLE_STREAM_PREFIX", "candles")
+STREAM_MAXLEN = int(os.getenv("CANDLE_STREAM_MAXLEN", "10000"))
+STREAM_MAX_PENDING = 50_000  # entries kept while Redis is unreachable
+
+INT_FIELDS = ("open_time", "close_time", "event_time", "trade_count")
+FLOAT_FIELDS = (
+    "open_price",
+    "high_price",
+    "low_price",
+    "close_price",
+    "base_volume",
+    "quote_volume",
+    "taker_buy_base_volume",
+    "taker_buy_quote_volume",
+)
+
+logger = get_logger("market_data.binance.ws.candle_stream")
+
+
+def stream_key(tf, prefix=STREAM_PREFIX):
+    return f"{prefix}:{tf}"
+
+
+def to_fields(record):
+    fields = {"symbol": record.symbol, "interval": record.interval}
+
+    for name in INT_FIELDS + FLOAT_FIELDS:
+        value = getattr(record, name)
+        if value is not None:
+            fields[name] = value
+
+    return fields
+
+
+def parse_fields(fields):
+    """
+    Stream entry → dict with numeric values.
+    """
+    candle = dict(fields)
+
+    for name in INT_FIELDS:
+        if name in candle:
+            candle[name] = int(candle[name])
+
+    for name in FLOAT_FIELDS:
+        if name in candle:
+            candle[name] = float(candle[name])
+
+    return candle
+
+
+# --------------------------------------------------
+# Publisher (DB worker)
+# --------------------------------------------------
+class CandleStreamPublisher:
+
+    def __init__(self, client=redis_client, prefix=STREAM_PREFIX, maxlen=STREAM_MAXLEN):
+        self.client = client
+        self.prefix = prefix
+        self.maxlen = maxlen
+
+        self.pending = []
+
+        # stats
+        self.published = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_publish_ms = 0.0
+
+    def add(self, record):
+        self.pending.append(record)
+
+    def flush(self):
+        """
+        XADD everything pending in one pipelined round trip.
+        """
+        if not self.pending:
+            return 0
+
+        started = time.perf_counter()
+        records = self.pending
+
+        try:
+            pipe = self.client.pipeline(transaction=False)
+
+            for record in records:
+                pipe.xadd(
+                    stream_key(record.interval, self.prefix),
+                    to_fields(record),
+                    maxlen=self.maxlen,
+                    approximate=True,
+                )
+
+            pipe.execute()
+
+        except redis.RedisError:
+            self.failures += 1
+            logger.exception("Candle stream publish failed entries=%d", len(records))
+
+            # keep for the next flush, but bounded
+            overflow = len(records) - STREAM_MAX_PENDING
+            if overflow > 0:
+                self.dropped += overflow
+                self.pending = records[overflow:]
+            return 0
+
+        self.pending = []
+        self.published += len(records)
+        self.last_publish_ms = (time.perf_counter() - started) * 1000
+
+        return len(records)
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "pending": len(self.pending),
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_publish_ms": round(self.last_publish_ms, 2),
+        }
+
+
+# --------------------------------------------------
+# Consumers (scanners, health checks, alerting)
+# --------------------------------------------------
+class CandleStreamConsumer:
+    """
+    Consumer-group reader over one or more timeframe streams.
+
+        consumer = CandleStreamConsumer("alerts", "alerts-1", ["1h"])
+        for tf, entry_id, candle in consumer.read():
+            ...
+            consumer.ack(tf, entry_id)
+
+    A restarted consumer first re-reads its own unacknowledged
+    entries, then new ones.
+    """
+
+    def __init__(self, group, name, timeframes, client=redis_client, prefix=STREAM_PREFIX, start_id="$"):
+        self.group = group
+        self.name = name
+        self.client = client
+        self.keys = {stream_key(tf, prefix): tf for tf in timeframes}
+
+        for key in self.keys:
+            try:
+                client.xgroup_create(key, group, id=start_id, mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+        # "0" → own pending entries first, ">" afterwards
+        self.cursor = {key: "0" for key in self.keys}
+
+    def read(self, count=500, block_ms=5000):
+        """
+        Next batch of (tf, entry_id, candle). Empty after block_ms
+        without new entries.
+        """
+        backlog = {k: c for k, c in self.cursor.items() if c != ">"}
+
+        if backlog:
+            response = self.client.xreadgroup(self.group, self.name, backlog, count=count)
+
+            for key, entries in response or []:
+                # page through the pending list; empty → caught up
+                self.cursor[key] = entries[-1][0] if entries else ">"
+
+            out = self._entries(response)
+            if out:
+                return out
+
+        response = self.client.xreadgroup(
+            self.group, self.name, self.cursor, count=count, block=block_ms
+        )
+        return self._entries(response)
+
+    def _entries(self, response):
+        return [
+            (self.keys[key], entry_id, parse_fields(fields))
+            for key, entries in response or []
+            for entry_id, fields in entries
+            if fields  # trimmed while pending
+        ]
+
+    def ack(self, tf, *entry_ids):
+        key = next(k for k, v in self.keys.items() if v == tf)
+        self.client.xack(key, self.group, *entry_ids)
+
+
+def wait_for_close(tf, settle=2.0, timeout=None, client=redis_client, prefix=STREAM_PREFIX):
+    """
+    Block until candles of `tf` close (the first new entry, then until
+    `settle` seconds pass without another). Returns the symbols seen,
+    or None after `timeout` seconds without any entry.
+    """
+    key = stream_key(tf, prefix)
+    last_id = "$"
+    symbols = set()
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    while True:
+        if symbols:
+            block = int(settle * 1000)
+        elif deadline is None:
+            block = 0
+        else:
+            block = int(max(deadline - time.monotonic(), 0.001) * 1000)
+
+        response = client.xread({key: last_id}, count=1000, block=block)
+
+        if not response:
+            return symbols or None
+
+        for _, entries in response:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                symbols.add(fields.get("symbol"))
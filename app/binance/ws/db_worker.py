@@ -1,30 +1,67 @@
+import gc
+import os
 import signal
+import time
 from queue import Empty
 from collections import defaultdict
 from datetime import datetime, timezone
 
 from app.binance.ws.queue import candle_queue
-from app.binance.repo import insert_candle
+from app.binance.ws.batch_writer import CandleBatchWriter, MAX_FLUSH_RETRIES
+from app.binance.ws import htf_state
+from app.binance.ws.journal import JOURNAL_ENABLED, get_journal
+from app.binance.ws.live_store import live_store
+from app.binance.ws.shm_candles import SHM_ENABLED, CandleShmPublisher
+from app.binance.ws.candle_stream import STREAM_ENABLED, CandleStreamPublisher
+from app.binance.ws.forming import FORMING_ENABLED, forming_cache
+from app.binance.ws.latency import latency, now_ms
+from app.binance.candle_record import CandleRecord
 from app.config import TIMEFRAMES
+from app.logging_config import get_logger
 
 RUNNING = True
 
+STATS_INTERVAL = 60
+
+# Optional gen0/1/2 thresholds, e.g. WS_GC_THRESHOLD=20000,20,20 to
+# keep gen0 above a minute-boundary burst. Off by default: the hot
+# path allocates one GC-tracked object per candle (the CandleRecord),
+# and the process keeps CPython's defaults.
+GC_THRESHOLD = tuple(int(v) for v in os.getenv("WS_GC_THRESHOLD", "").split(",") if v) or None
+
+# Active batch writer / journal / stream publisher (set by run())
+writer = None
+journal = None
+stream_publisher = None
+
+logger = get_logger("market_data.binance.ws.db_worker")
+
 
 # --------------------------------------------------
-# Aggregation State (IN-MEMORY ONLY)
+# Aggregation State
 # --------------------------------------------------
+# Checkpointed to Redis after every committed flush and
+# rebuilt on boot from checkpoint + candles_1m (htf_state).
+#
 # Structure:
 # {
 #   "15m": {
-#       "BTCUSDT": current_bucket_payload
+#       "BTCUSDT": CandleRecord (current bucket)
 #   },
 #   "1h": {
-#       "BTCUSDT": current_bucket_payload
+#       "BTCUSDT": CandleRecord (current bucket)
 #   }
 # }
 # --------------------------------------------------
 aggregation_state = defaultdict(dict)
 
+# (tf, symbol) buckets changed since the last checkpoint
+dirty_buckets = set()
+
+HTF_CONFIG = [
+    (tf, config["tf_ms"]) for tf, config in TIMEFRAMES.items() if tf != "1m"
+]
+
 
 def shutdown_handler(sig, frame):
     global RUNNING
@@ -45,125 +82,239 @@ def ms_to_utc(ms):
 # --------------------------------------------------
 # HTF Aggregation Logic (Derived FROM 1m ONLY)
 # --------------------------------------------------
-def process_htf(symbol, base_payload):
+def process_htf(symbol, record, emit):
     """
-    Aggregate CLOSED 1m candle into higher timeframes.
+    Aggregate CLOSED 1m record into higher timeframes.
+    Finalized buckets are handed to emit(record); buckets missing
+    1m bars (e.g. started mid-bucket) are dropped, not written.
+    This is the live writer; htf_engine's rollup (same values, same
+    upsert key) is authoritative for history and repairs.
     """
 
-    open_time = base_payload["open_time"]
-
-    print(
-        f"\n[AGG INPUT] symbol={symbol} "
-        f"1m_open_ms={open_time} "
-        f"utc={ms_to_utc(open_time)}"
-    )
-
-    for tf, config in TIMEFRAMES.items():
-
-        if tf == "1m":
-            continue
+    open_time = record.open_time
 
-        tf_ms = config["tf_ms"]
+    for tf, tf_ms in HTF_CONFIG:
 
         # ------------------------------------------
         # Compute bucket start time
         # ------------------------------------------
         bucket_open = (open_time // tf_ms) * tf_ms
 
-        print(
-            f"[AGG CALC] symbol={symbol} "
-            f"tf={tf} "
-            f"tf_ms={tf_ms} "
-            f"bucket_ms={bucket_open} "
-            f"bucket_utc={ms_to_utc(bucket_open)}"
-        )
+        states = aggregation_state[tf]
+        state = states.get(symbol)
 
-        state = aggregation_state[tf].get(symbol)
+        if state is not None:
 
-        # ------------------------------------------
-        # NEW BUCKET → finalize previous
-        # ------------------------------------------
-        if not state or state["open_time"] != bucket_open:
+            # ------------------------------------------
+            # Already folded in (replay / duplicate) or stale
+            # ------------------------------------------
+            if open_time <= state.last_source_open or bucket_open < state.open_time:
+                continue
 
-            if state:
-                print(
-                    f"[AGG FINALIZE] symbol={symbol} "
-                    f"tf={tf} "
-                    f"final_bucket={ms_to_utc(state['open_time'])}"
+            # ------------------------------------------
+            # UPDATE EXISTING BUCKET
+            # ------------------------------------------
+            if state.open_time == bucket_open:
+                state.merge(record)
+                dirty_buckets.add((tf, symbol))
+                continue
+
+            # ------------------------------------------
+            # NEW BUCKET → finalize previous
+            # ------------------------------------------
+            if state.bar_count == tf_ms // 60_000:
+                logger.debug("[AGG FINALIZE] symbol=%s tf=%s bucket_ms=%s", symbol, tf, state.open_time)
+                if record.dequeued_at is not None:  # live, not boot replay
+                    state.dequeued_at = now_ms()
+                emit(state)
+            else:
+                logger.warning(
+                    "[AGG PARTIAL] symbol=%s tf=%s bucket=%s bars=%d/%d — not written",
+                    symbol, tf, ms_to_utc(state.open_time), state.bar_count, tf_ms // 60_000,
                 )
 
-                insert_candle(tf, state)
+        logger.debug("[AGG NEW BUCKET] symbol=%s tf=%s bucket_ms=%s", symbol, tf, bucket_open)
 
-            print(
-                f"[AGG NEW BUCKET] symbol={symbol} "
-                f"tf={tf} "
-                f"bucket={ms_to_utc(bucket_open)}"
-            )
+        states[symbol] = record.start_bucket(tf, bucket_open, tf_ms)
+        dirty_buckets.add((tf, symbol))
 
-            aggregation_state[tf][symbol] = {
-                **base_payload,
-                "open_time": bucket_open,
-                "interval": tf,  # CRITICAL FIX
-            }
 
-            continue
+# --------------------------------------------------
+# DB Worker Loop
+# --------------------------------------------------
+def emit(record):
+    writer.add(record)
+    live_store.add(record)
 
-        # ------------------------------------------
-        # UPDATE EXISTING BUCKET
-        # ------------------------------------------
-        print(
-            f"[AGG UPDATE] symbol={symbol} "
-            f"tf={tf} "
-            f"bucket={ms_to_utc(bucket_open)}"
-        )
+    if stream_publisher is not None:
+        stream_publisher.add(record)
 
-        state["high_price"] = max(
-            state["high_price"], base_payload["high_price"]
-        )
-        state["low_price"] = min(
-            state["low_price"], base_payload["low_price"]
-        )
-        state["close_price"] = base_payload["close_price"]
-        state["base_volume"] += base_payload["base_volume"]
-        state["quote_volume"] += base_payload["quote_volume"]
-        state["taker_buy_base_volume"] += base_payload["taker_buy_base_volume"]
-        state["taker_buy_quote_volume"] += base_payload["taker_buy_quote_volume"]
-        state["trade_count"] += base_payload["trade_count"]
+
+def handle_candle(record):
+    # the handler already stored it; re-adding covers journal replay
+    emit(record)
+
+    # ------------------------------------------
+    # Aggregate ONLY from 1m
+    # ------------------------------------------
+    if record.interval == "1m":
+        process_htf(record.symbol, record, emit)
+
+
+def flush_and_checkpoint():
+    """
+    Checkpoint HTF buckets only once the 1m rows behind them are
+    committed.
+    """
+    writer.flush()
+
+    if writer.pending_rows:
+        return
+
+    try:
+        htf_state.checkpoint(aggregation_state, dirty_buckets)
+    except Exception:
+        logger.exception("HTF checkpoint failed")
+
+    # rows are committed → safe to announce
+    if stream_publisher is not None:
+        stream_publisher.flush()
+
+    # everything read so far is committed → advance durable offset
+    if journal is not None:
+        journal.commit()
+
+
+def get_writer_stats():
+    stats = writer.stats() if writer else {}
+    if journal is not None:
+        stats["journal"] = journal.stats()
+    if stream_publisher is not None:
+        stats["streams"] = stream_publisher.stats()
+    return stats
+
+
+def consume_queue(timeout):
+    record = candle_queue.get(timeout=timeout)
+
+    record.dequeued_at = now_ms()
+    handle_candle(record)
+
+    # ------------------------------------------
+    # Drain whatever is already queued
+    # ------------------------------------------
+    while writer.pending_rows < writer.max_rows:
+        try:
+            record = candle_queue.get_nowait()
+        except Empty:
+            break
+        record.dequeued_at = now_ms()
+        handle_candle(record)
+
+
+def consume_journal(timeout):
+    room = writer.max_rows - writer.pending_rows
+
+    # writer full (e.g. Postgres down) → backlog stays on disk
+    if room <= 0:
+        time.sleep(timeout)
+        return
+
+    batch = journal.read(room, timeout)
+
+    dequeued_at = now_ms()
+
+    for data in batch:
+        record = CandleRecord.from_bytes(data)
+        record.dequeued_at = dequeued_at
+        handle_candle(record)
 
 
-# --------------------------------------------------
-# DB Worker Loop
-# --------------------------------------------------
 def run():
+    global writer, journal, stream_publisher
+
     print("[DB] Worker started")
 
-    while RUNNING:
+    if GC_THRESHOLD:
+        gc.set_threshold(*GC_THRESHOLD)
+
+    if JOURNAL_ENABLED:
+        journal = get_journal()
+
+    # with the journal nothing is dropped: unflushed rows are replayed
+    writer = CandleBatchWriter(
+        max_retries=None if journal is not None else MAX_FLUSH_RETRIES,
+        on_commit=latency.observe_batch,
+    )
+
+    if STREAM_ENABLED:
+        stream_publisher = CandleStreamPublisher()
+    last_stats = time.monotonic()
+
+    try:
+        live_store.warm()
+    except Exception:
+        logger.exception("Live store warm-up failed")
+
+    shm_publisher = None
+    if SHM_ENABLED:
         try:
-            tf, payload = candle_queue.get(timeout=1)
+            shm_publisher = CandleShmPublisher(live_store)
+        except Exception:
+            logger.exception("Shared memory publisher unavailable")
+
+    # ------------------------------------------
+    # Rebuild open HTF buckets (checkpoint + candles_1m)
+    # ------------------------------------------
+    try:
+        htf_state.restore(
+            aggregation_state,
+            lambda record: process_htf(record.symbol, record, emit),
+        )
+        flush_and_checkpoint()
+    except Exception:
+        logger.exception("HTF state restore failed; starting with empty buckets")
 
-            print(
-                f"\n[DB INSERT] symbol={payload['symbol']} "
-                f"tf={tf} "
-                f"open_ms={payload['open_time']} "
-                f"utc={ms_to_utc(payload['open_time'])} "
-                f"interval={payload.get('interval')}"
-            )
+    # warm-up done: move the long-lived heap (modules, ORM, restored
+    # state) out of the collector so collections only walk new objects
+    gc.collect()
+    gc.freeze()
 
-            # ------------------------------------------
-            # Insert original candle
-            # ------------------------------------------
-            insert_candle(tf, payload)
+    consume = consume_journal if journal is not None else consume_queue
 
-            # ------------------------------------------
-            # Aggregate ONLY from 1m
-            # ------------------------------------------
-            if tf == "1m":
-                process_htf(payload["symbol"], payload)
+    while RUNNING:
+        try:
+            wait = writer.time_to_flush()
+            consume(1 if wait is None else max(wait, 0.001))
 
         except Empty:
-            continue
+            pass
 
         except Exception as e:
             print("[DB ERROR]:", e)
 
+        if writer.due():
+            flush_and_checkpoint()
+
+        if shm_publisher is not None:
+            shm_publisher.maybe_publish()
+
+        if FORMING_ENABLED:
+            forming_cache.maybe_flush(aggregation_state)
+
+        if time.monotonic() - last_stats >= STATS_INTERVAL:
+            print("[DB STATS]", get_writer_stats())
+            latency.report()
+            last_stats = time.monotonic()
+
+    flush_and_checkpoint()
+    writer.close()
+
+    # handlers may still append until the WS side stops
+    if journal is not None:
+        journal.sync()
+
+    if shm_publisher is not None:
+        shm_publisher.close()
+
     print("[DB] Worker stopped")
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import threading
+
+import numpy as np
+
+from app.redis_client import redis_client
+from app.binance.candle_record import CandleRecord
+from app.binance.ws.live_store import FIELD_INDEX
+from app.config import TIMEFRAMES
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Forming (not yet closed) candles
+# --------------------------------------------------
+# The kline stream pushes the current bar every ~250 ms. The handler
+# only stores the latest kline per (symbol, interval) (dict
+# assignment + dirty set, O(1)); nothing of it ever reaches Postgres.
+#
+# Every FORMING_FLUSH_INTERVAL the DB worker turns the dirty bars
+# into rows and writes them with one pipelined HSET per timeframe to
+#
+#   candles:forming:<tf>   symbol → JSON list in live_store FIELDS order
+#
+# Forming HTF bars are the open aggregator bucket (closed 1m bars
+# so far) merged with the forming 1m bar; an interval that is
+# subscribed itself uses the exchange's kline instead. A forming bar
+# is current only while its open_time is newer than the latest closed
+# bar; readers ignore it otherwise, so closes need no delete.
+# --------------------------------------------------
+
+FORMING_ENABLED = os.getenv("FORMING_CANDLES", "1") == "1"
+FORMING_FLUSH_INTERVAL = float(os.getenv("FORMING_FLUSH_INTERVAL", "1.0"))
+FORMING_PREFIX = "candles:forming"
+
+HTF_CONFIG = [
+    (tf, config["tf_ms"]) for tf, config in TIMEFRAMES.items() if tf != "1m"
+]
+
+logger = get_logger("market_data.binance.ws.forming")
+
+
+def forming_key(tf, prefix=FORMING_PREFIX):
+    return f"{prefix}:{tf}"
+
+
+def to_values(record):
+    return [
+        record.open_time,
+        record.open_price,
+        record.high_price,
+        record.low_price,
+        record.close_price,
+        record.base_volume,
+        record.quote_volume,
+        record.trade_count,
+    ]
+
+
+class FormingCache:
+
+    def __init__(self, client=redis_client, prefix=FORMING_PREFIX):
+        self.client = client
+        self.prefix = prefix
+
+        self.lock = threading.Lock()
+
+        # (symbol, interval) → (kline dict, event_time) of the latest update
+        self.klines = {}
+        self.dirty = set()
+
+        self.last_flush = 0.0
+
+        # stats
+        self.updates = 0
+        self.written = 0
+
+    # ------------------------------------------
+    # Hot path (WS thread)
+    # ------------------------------------------
+    def update(self, k, event_time):
+        key = (k["s"], k["i"])
+
+        with self.lock:
+            self.klines[key] = (k, event_time)
+            self.dirty.add(key)
+            self.updates += 1
+
+    def get(self, symbol, interval="1m"):
+        """
+        Latest forming bar as a CandleRecord, or None.
+        """
+        with self.lock:
+            entry = self.klines.get((symbol, interval))
+
+        return None if entry is None else CandleRecord.from_kline(*entry)
+
+    # ------------------------------------------
+    # Throttled writes (DB worker thread)
+    # ------------------------------------------
+    def rows(self, states=None):
+        """
+        {tf: {symbol: values}} for the symbols updated since the
+        last call. `states` are the aggregator's open HTF buckets.
+        """
+        with self.lock:
+            entries = [self.klines[key] for key in self.dirty]
+            subscribed = set(self.klines)
+            self.dirty = set()
+
+        rows = {}
+
+        for k, event_time in entries:
+            bar = CandleRecord.from_kline(k, event_time)
+            rows.setdefault(bar.interval, {})[bar.symbol] = to_values(bar)
+
+            if bar.interval != "1m" or states is None:
+                continue
+
+            for tf, tf_ms in HTF_CONFIG:
+                if (bar.symbol, tf) in subscribed:
+                    continue
+
+                bucket_open = bar.open_time // tf_ms * tf_ms
+                state = states.get(tf, {}).get(bar.symbol)
+
+                if state is not None and state.open_time == bucket_open and state.last_source_open < bar.open_time:
+                    htf = CandleRecord.from_state(state.to_state())
+                    htf.merge(bar)
+                else:
+                    htf = bar.start_bucket(tf, bucket_open, tf_ms)
+
+                rows.setdefault(tf, {})[bar.symbol] = to_values(htf)
+
+        return rows
+
+    def flush(self, states=None):
+        rows = self.rows(states)
+        if not rows:
+            return 0
+
+        pipe = self.client.pipeline(transaction=False)
+
+        for tf, bars in rows.items():
+            pipe.hset(forming_key(tf, self.prefix), mapping={
+                symbol: json.dumps(values) for symbol, values in bars.items()
+            })
+
+        pipe.execute()
+
+        written = sum(len(bars) for bars in rows.values())
+        self.written += written
+        return written
+
+    def maybe_flush(self, states=None):
+        now = time.monotonic()
+        if now - self.last_flush < FORMING_FLUSH_INTERVAL:
+            return
+
+        self.last_flush = now
+
+        try:
+            self.flush(states)
+        except Exception:
+            logger.exception("Failed to write forming candles")
+
+    def stats(self):
+        return {
+            "symbols": len({symbol for symbol, _ in self.klines}),
+            "updates": self.updates,
+            "written": self.written,
+        }
+
+
+# Process-wide cache (ingest process)
+forming_cache = FormingCache()
+
+
+# --------------------------------------------------
+# Readers (any process)
+# --------------------------------------------------
+def load_forming(tf, symbols=None, client=redis_client, prefix=FORMING_PREFIX):
+    """
+    {symbol: values} of the forming bars of a timeframe.
+    """
+    key = forming_key(tf, prefix)
+
+    if symbols is not None and not symbols:
+        return {}
+
+    if symbols is None:
+        raw = client.hgetall(key)
+    else:
+        raw = dict(zip(symbols, client.hmget(key, symbols)))
+
+    forming = {}
+
+    for symbol, value in raw.items():
+        if value is None:
+            continue
+        if isinstance(symbol, bytes):
+            symbol = symbol.decode()
+        forming[symbol] = json.loads(value)
+
+    return forming
+
+
+def window_with_forming(reader, field=None, bars=None, client=redis_client):
+    """
+    (symbols, closed history + forming bar) for a CandleShmReader:
+    like reader.read() with one extra bar at the end — the forming
+    bar, or NaN where there is none newer than the last closed bar.
+    """
+    symbols, closed = reader.read(field, bars)
+    forming = load_forming(reader.tf, symbols, client)
+
+    shape = closed.shape[:-1] + (closed.shape[-1] + 1,)
+    block = np.full(shape, np.nan)
+    block[..., :-1] = closed
+
+    head = reader.open_time
+
+    for row, symbol in enumerate(symbols):
+        values = forming.get(symbol)
+        if values is None or (head is not None and values[0] <= head):
+            continue
+
+        if field is None:
+            block[:, row, -1] = values
+        else:
+            block[row, -1] = values[FIELD_INDEX[field]]
+
+    return symbols, block
@@ -0,0 +1,5 @@
+from app.binance.ws.trade_bars import get_builder
+
+
+def handle(data, received_at=None):
+    get_builder().add_trade(data)
@@ -9,13 +9,13 @@ TF_MAP = {
 }
 
 
-def handle(data):
+def handle(data, received_at=None):
     k = data["k"]
     event_time = data["E"]
     tf = k["i"]
 
     handler = TF_MAP.get(tf)
     if handler:
-        handler(k, event_time)
+        handler(k, event_time, received_at)
     else:
         print(f"No handler for TF {tf}")
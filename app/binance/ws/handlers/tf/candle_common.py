@@ -1,40 +1,45 @@
 from queue import Full
 from app.binance.ws.queue import candle_queue, QUEUE_MAXSIZE
-from app.binance.scripts.helpers import open_time_ms_to_ist
+from app.binance.candle_record import CandleRecord
+from app.binance.ws.journal import JOURNAL_ENABLED, get_journal
+from app.binance.ws.live_store import live_store
+from app.binance.ws.forming import FORMING_ENABLED, forming_cache
+from app.binance.ws.latency import now_ms
+from app.logging_config import get_logger
 
+logger = get_logger("market_data.binance.ws.candle")
 
-def handle(k, event_time):
+
+def handle(k, event_time, received_at=None):
     if not k["x"]:
+        # intrabar update: only the latest one per symbol is kept
+        if FORMING_ENABLED:
+            forming_cache.update(k, event_time)
         return
 
-    payload = {
-        "event_time": event_time,
-        "symbol": k["s"],
-        "open_time": k["t"],
-        "lk_at": open_time_ms_to_ist(k["t"]),
-        "interval": k["i"],
-        "close_time": k["T"],
-        "first_trade_id": k["f"],
-        "last_trade_id": k["L"],
-        "open_price": float(k["o"]),
-        "high_price": float(k["h"]),
-        "low_price": float(k["l"]),
-        "close_price": float(k["c"]),
-        "base_volume": float(k["v"]),
-        "quote_volume": float(k["q"]),
-        "taker_buy_base_volume": float(k["V"]),
-        "taker_buy_quote_volume": float(k["Q"]),
-        "trade_count": k["n"],
-        "is_closed": k["x"],
-    }
+    record = CandleRecord.from_kline(k, event_time)
+    record.received_at = received_at
+    record.parsed_at = now_ms()
 
-    try:
-        candle_queue.put_nowait((k["i"], payload))
-        size = candle_queue.qsize()
-        percent = int((size / QUEUE_MAXSIZE) * 100)
-        percent = (size / QUEUE_MAXSIZE) * 100
-        print(f"[QUEUE] Added → {k['s']} {k['i']} | {size}/{QUEUE_MAXSIZE} ({percent:.2f}%)")
+    submit(record)
+
+
+def submit(record):
+    """
+    Hand a closed candle to the live store and the DB worker.
+    """
+    live_store.add(record)
 
+    # durable path: the DB worker consumes the journal
+    record.enqueued_at = now_ms()
+
+    if JOURNAL_ENABLED:
+        get_journal().append(record.to_bytes())
+        return
+
+    try:
+        candle_queue.put_nowait(record)
+        logger.debug("[QUEUE] Added → %s %s | %d/%d", record.symbol, record.interval, candle_queue.qsize(), QUEUE_MAXSIZE)
 
     except Full:
-        print(f"[QUEUE] FULL → Dropping {k['s']} {k['i']}")
+        print(f"[QUEUE] FULL → Dropping {record.symbol} {record.interval}")
@@ -0,0 +1,132 @@
+import json
+import time
+from collections import defaultdict
+
+from sqlalchemy import text
+
+from app.db import engine
+from app.config import TIMEFRAMES
+from app.redis_client import redis_client
+from app.binance.candle_record import CandleRecord, DB_COLUMNS
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# HTF aggregation checkpoint
+# --------------------------------------------------
+# Open buckets are stored in the Redis hash CHECKPOINT_KEY
+# (field "<tf>|<symbol>") right after the batch writer commits,
+# so a checkpoint never contains 1m bars that are not in
+# candles_1m yet. On boot the checkpoint is loaded and the 1m rows
+# committed after it are replayed from candles_1m.
+# --------------------------------------------------
+
+CHECKPOINT_KEY = "htf_agg_state"
+REPLAY_CHUNK = 5000
+
+MAX_TF_MS = max(c["tf_ms"] for c in TIMEFRAMES.values())
+
+logger = get_logger("market_data.binance.ws.htf_state")
+
+
+def checkpoint(state, dirty):
+    """
+    Persist the buckets touched since the last checkpoint.
+    """
+    if not dirty:
+        return
+
+    mapping = {}
+
+    for tf, symbol in dirty:
+        record = state[tf].get(symbol)
+        if record is not None:
+            mapping[f"{tf}|{symbol}"] = json.dumps(record.to_state())
+
+    if mapping:
+        redis_client.hset(CHECKPOINT_KEY, mapping=mapping)
+
+    dirty.clear()
+
+
+def load_checkpoint():
+    state = defaultdict(dict)
+
+    for field, value in redis_client.hgetall(CHECKPOINT_KEY).items():
+        tf, _, symbol = field.partition("|")
+
+        if tf not in TIMEFRAMES:
+            continue
+
+        state[tf][symbol] = CandleRecord.from_state(json.loads(value))
+
+    return state
+
+
+def replay_start(state, now_ms):
+    """
+    Earliest 1m open_time that still has to be replayed.
+    Without a checkpoint every open bucket is rebuilt, i.e. from the
+    start of the current largest-timeframe bucket.
+    """
+    floor = (now_ms // MAX_TF_MS) * MAX_TF_MS
+
+    sources = [
+        record.last_source_open
+        for by_symbol in state.values()
+        for record in by_symbol.values()
+    ]
+
+    if not sources:
+        return floor
+
+    # never replay further back than the previous largest bucket
+    return max(min(sources) + 60_000, floor - MAX_TF_MS)
+
+
+def iter_1m_since(since):
+    with engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True,
+            yield_per=REPLAY_CHUNK,
+        ).execute(
+            text(f"""
+                SELECT {", ".join(DB_COLUMNS)}
+                FROM candles_1m
+                WHERE open_time >= :since
+                ORDER BY open_time, symbol
+            """),
+            {"since": since},
+        )
+
+        for row in result:
+            yield CandleRecord.from_db_row(row)
+
+
+def restore(state, feed):
+    """
+    Load the checkpoint into `state` and pass every committed 1m
+    record after it to feed(record). Returns the replayed count.
+    """
+    started = time.perf_counter()
+
+    loaded = load_checkpoint()
+
+    for tf, by_symbol in loaded.items():
+        state[tf].update(by_symbol)
+
+    since = replay_start(loaded, int(time.time() * 1000))
+
+    replayed = 0
+    for record in iter_1m_since(since):
+        feed(record)
+        replayed += 1
+
+    logger.info(
+        "HTF state restored buckets=%d replayed_1m=%d since=%d ms=%.1f",
+        sum(len(v) for v in loaded.values()),
+        replayed,
+        since,
+        (time.perf_counter() - started) * 1000,
+    )
+
+    return replayed
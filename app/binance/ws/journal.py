@@ -0,0 +1,312 @@
+import os
+import mmap
+import zlib
+import time
+import struct
+import threading
+
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Candle write-ahead journal
+# --------------------------------------------------
+# Append-only, memory-mapped segment files between the WS handler
+# and the DB writer:
+#
+#   <dir>/000000000042.seg   preallocated SEGMENT_SIZE bytes
+#   <dir>/offset             "<segment> <position>" last committed
+#
+# Record = header (length, crc32) + payload. The payload is written
+# before its header, so a reader (or crash recovery) never sees a
+# header without its bytes. length 0 → no data yet, ROLL → continue
+# in the next segment.
+#
+# Writes land in the page cache immediately, so a process crash or
+# SIGKILL loses nothing; FLUSH_INTERVAL bounds what an OS crash can
+# lose. The DB writer commits its offset only after a flush, and
+# segments entirely before the committed offset are deleted.
+# --------------------------------------------------
+
+JOURNAL_DIR = os.getenv("CANDLE_JOURNAL_DIR", os.path.join("data", "journal"))
+JOURNAL_ENABLED = os.getenv("CANDLE_JOURNAL", "1") == "1"
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+FLUSH_INTERVAL = 1.0  # seconds between msync of the active segment
+
+HEADER = struct.Struct("<II")
+ROLL = 0xFFFFFFFF
+
+OFFSET_FILE = "offset"
+
+logger = get_logger("market_data.binance.ws.journal")
+
+
+def segment_name(segment_id):
+    return f"{segment_id:012d}.seg"
+
+
+class CandleJournal:
+
+    def __init__(self, directory=JOURNAL_DIR, segment_size=SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+
+        self.maps = {}
+
+        os.makedirs(directory, exist_ok=True)
+
+        segments = self._segments()
+        if not segments:
+            segments = [0]
+            self._map(0)
+
+        # writer position: end of valid data in the last segment
+        self.write_segment = segments[-1]
+        self.write_pos = self._recover(self.write_segment)
+        self.last_flush = time.monotonic()
+
+        # reader position: last committed offset
+        self.read_segment, self.read_pos = self._load_offset(segments[0])
+        self.committed = (self.read_segment, self.read_pos)
+
+        # stats
+        self.appended = 0
+        self.replayed = 0
+
+        logger.info(
+            "Journal open dir=%s segments=%d write=%d:%d committed=%d:%d",
+            directory, len(segments), self.write_segment, self.write_pos,
+            self.read_segment, self.read_pos,
+        )
+
+    # ------------------------------------------
+    # Segments
+    # ------------------------------------------
+    def _segments(self):
+        return sorted(
+            int(name[:-4])
+            for name in os.listdir(self.directory)
+            if name.endswith(".seg")
+        )
+
+    def _map(self, segment_id):
+        mm = self.maps.get(segment_id)
+        if mm is not None:
+            return mm
+
+        path = os.path.join(self.directory, segment_name(segment_id))
+
+        with open(path, "a+b") as fp:
+            if os.fstat(fp.fileno()).st_size < self.segment_size:
+                fp.truncate(self.segment_size)
+            mm = mmap.mmap(fp.fileno(), self.segment_size)
+
+        self.maps[segment_id] = mm
+        return mm
+
+    def _recover(self, segment_id):
+        """
+        Find the append position of a segment, discarding a torn tail.
+        """
+        mm = self._map(segment_id)
+        pos = 0
+
+        while pos + HEADER.size <= self.segment_size:
+            length, crc = HEADER.unpack_from(mm, pos)
+
+            if length == 0:
+                return pos
+
+            if length == ROLL:
+                # crashed between ROLL marker and next segment creation
+                self.write_segment = segment_id + 1
+                self._map(segment_id + 1)
+                return self._recover(segment_id + 1)
+
+            end = pos + HEADER.size + length
+            if end > self.segment_size or zlib.crc32(mm[pos + HEADER.size:end]) != crc:
+                logger.warning("Torn journal record at %d:%d — truncating", segment_id, pos)
+                mm[pos:] = bytes(self.segment_size - pos)
+                return pos
+
+            pos = end
+
+        return pos
+
+    # ------------------------------------------
+    # Append (handler side)
+    # ------------------------------------------
+    def append(self, payload):
+        n = len(payload)
+
+        with self.lock:
+            mm = self.maps[self.write_segment]
+            pos = self.write_pos
+
+            # keep room for a ROLL header at the end of every segment
+            if pos + 2 * HEADER.size + n > self.segment_size:
+                HEADER.pack_into(mm, pos, ROLL, 0)
+                mm.flush()
+
+                mm = self._map(self.write_segment + 1)
+                self.write_segment += 1
+                pos = 0
+
+            body = pos + HEADER.size
+            mm[body:body + n] = payload
+            HEADER.pack_into(mm, pos, n, zlib.crc32(payload))
+
+            self.write_pos = body + n
+            self.appended += 1
+
+            now = time.monotonic()
+            if now - self.last_flush >= FLUSH_INTERVAL:
+                mm.flush()
+                self.last_flush = now
+
+        self.ready.set()
+
+    # ------------------------------------------
+    # Read / commit (DB writer side)
+    # ------------------------------------------
+    def read(self, max_records, timeout=None):
+        """
+        Up to max_records payloads after the read cursor. Blocks up
+        to `timeout` seconds when nothing is pending.
+        """
+        out = self._read(max_records)
+
+        if not out and timeout:
+            self.ready.wait(timeout)
+            self.ready.clear()
+            out = self._read(max_records)
+
+        return out
+
+    def _read(self, max_records):
+        out = []
+
+        while len(out) < max_records:
+            mm = self._map(self.read_segment)
+
+            if self.read_pos + HEADER.size > self.segment_size:
+                self._advance_segment()
+                continue
+
+            length, _ = HEADER.unpack_from(mm, self.read_pos)
+
+            if length == ROLL:
+                self._advance_segment()
+                continue
+
+            if length == 0:
+                if self.read_segment < self.write_segment:
+                    self._advance_segment()
+                    continue
+                break
+
+            body = self.read_pos + HEADER.size
+            out.append(mm[body:body + length])
+            self.read_pos = body + length
+
+        self.replayed += len(out)
+        return out
+
+    def _advance_segment(self):
+        self.read_segment += 1
+        self.read_pos = 0
+
+    def commit(self):
+        """
+        Durably record everything read so far as consumed.
+        """
+        offset = (self.read_segment, self.read_pos)
+        if offset == self.committed:
+            return
+
+        path = os.path.join(self.directory, OFFSET_FILE)
+        tmp = path + ".tmp"
+
+        with open(tmp, "w") as fp:
+            fp.write(f"{offset[0]} {offset[1]}")
+            fp.flush()
+            os.fsync(fp.fileno())
+
+        os.replace(tmp, path)
+        self.committed = offset
+
+        self._drop_before(offset[0])
+
+    def _load_offset(self, first_segment):
+        path = os.path.join(self.directory, OFFSET_FILE)
+
+        try:
+            with open(path) as fp:
+                segment, pos = (int(x) for x in fp.read().split())
+        except (OSError, ValueError):
+            return first_segment, 0
+
+        if segment < first_segment:
+            return first_segment, 0
+
+        return segment, pos
+
+    def _drop_before(self, segment_id):
+        for sid in [s for s in self._segments() if s < segment_id]:
+            mm = self.maps.pop(sid, None)
+            if mm is not None:
+                mm.close()
+            os.remove(os.path.join(self.directory, segment_name(sid)))
+
+    # ------------------------------------------
+    # Stats / shutdown
+    # ------------------------------------------
+    def backlog_bytes(self):
+        """
+        Bytes appended but not yet committed by the DB writer.
+        """
+        seg, pos = self.committed
+        return (self.write_segment - seg) * self.segment_size + self.write_pos - pos
+
+    def stats(self):
+        return {
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "write": f"{self.write_segment}:{self.write_pos}",
+            "committed": f"{self.committed[0]}:{self.committed[1]}",
+            "backlog_bytes": self.backlog_bytes(),
+        }
+
+    def sync(self):
+        """
+        msync the active segment (e.g. on shutdown).
+        """
+        with self.lock:
+            self.maps[self.write_segment].flush()
+            self.last_flush = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            for mm in self.maps.values():
+                mm.flush()
+                mm.close()
+            self.maps = {}
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """
+    Process-wide journal, opened on first use.
+    """
+    global _journal
+
+    with _journal_lock:
+        if _journal is None:
+            _journal = CandleJournal()
+        return _journal
@@ -0,0 +1,216 @@
+import json
+import time
+import bisect
+
+from app.redis_client import redis_client
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Ingest latency (Binance event → DB commit)
+# --------------------------------------------------
+# Every CandleRecord carries stage timestamps (epoch ms):
+#
+#   close_time + 1   candle closed (exchange)
+#   event_time       Binance emitted the closing event (E)
+#   received_at      WS message received
+#   parsed_at        CandleRecord built
+#   enqueued_at      handed to journal / queue
+#   dequeued_at      picked up by the DB worker
+#   committed        batch flush committed
+#
+# Stages (ms):
+#
+#   exchange   close → event           Binance
+#   network    event → received        network + socket (clock skew!)
+#   parse      received → parsed       handler
+#   enqueue    parsed → enqueued       journal append / queue put
+#   queue      enqueued → dequeued     waiting for the DB worker
+#   aggregate  HTF close → finalized by the aggregator (derived only)
+#   commit     dequeued → committed    batching + DB
+#   total      close → committed
+#
+# Derived HTF candles only carry dequeued_at: the moment the
+# aggregator finalized them. The tracker is fed by the DB worker at
+# commit time, keeps histograms per (tf, stage) and the worst total
+# lag per symbol since the last report, and is published to
+# LATENCY_KEY.
+# --------------------------------------------------
+
+LATENCY_KEY = "ingest:latency"
+
+# histogram upper bounds, ms
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1_000, 2_000, 5_000, 10_000, 30_000, 60_000, 120_000, 300_000)
+
+STAGES = ("exchange", "network", "parse", "enqueue", "queue", "aggregate", "commit", "total")
+
+WORST_SYMBOLS = 10
+
+logger = get_logger("market_data.binance.ws.latency")
+
+
+def now_ms():
+    return time.time() * 1000
+
+
+class LatencyHistogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """
+        Upper bound of the bucket holding the p-th percentile
+        (capped at the observed max).
+        """
+        if not self.count:
+            return None
+
+        rank = p * self.count
+        seen = 0
+
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and i < len(BUCKETS):
+                return round(min(BUCKETS[i], self.max), 1)
+
+        return round(self.max, 1)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 1) if self.count else None,
+            "p50": self.percentile(0.50),
+            "p99": self.percentile(0.99),
+            "max": round(self.max, 1),
+        }
+
+
+class LatencyTracker:
+
+    def __init__(self):
+        self.histograms = {}
+
+        # symbol → (worst total ms, tf, open_time) since last report
+        self.worst = {}
+
+    def _observe(self, tf, stage, value):
+        if value is None:
+            return
+
+        histogram = self.histograms.get((tf, stage))
+        if histogram is None:
+            histogram = self.histograms[(tf, stage)] = LatencyHistogram()
+
+        histogram.observe(max(value, 0.0))
+
+    def observe(self, record, committed):
+        tf = record.interval
+
+        closed = record.close_time + 1
+        event = record.event_time
+        received = record.received_at
+        parsed = record.parsed_at
+        enqueued = record.enqueued_at
+        dequeued = record.dequeued_at
+
+        if parsed is None:
+            # derived by the aggregator
+            if dequeued is not None:
+                self._observe(tf, "aggregate", dequeued - closed)
+        else:
+            if event is not None:
+                self._observe(tf, "exchange", event - closed)
+            if event is not None and received is not None:
+                self._observe(tf, "network", received - event)
+
+        if received is not None and parsed is not None:
+            self._observe(tf, "parse", parsed - received)
+        if parsed is not None and enqueued is not None:
+            self._observe(tf, "enqueue", enqueued - parsed)
+        if enqueued is not None and dequeued is not None:
+            self._observe(tf, "queue", dequeued - enqueued)
+        if dequeued is not None:
+            self._observe(tf, "commit", committed - dequeued)
+
+        total = committed - closed
+        self._observe(tf, "total", total)
+
+        symbol = record.symbol
+        worst = self.worst.get(symbol)
+        if worst is None or total > worst[0]:
+            self.worst[symbol] = (total, tf, record.open_time)
+
+    def observe_batch(self, records, committed=None):
+        """
+        Records of one committed flush. Records rebuilt from the DB on
+        boot (no dequeued_at) are skipped.
+        """
+        committed = now_ms() if committed is None else committed
+
+        for record in records:
+            if record.dequeued_at is not None:
+                self.observe(record, committed)
+
+    # ------------------------------------------
+    # Reporting
+    # ------------------------------------------
+    def snapshot(self):
+        by_tf = {}
+
+        for (tf, stage), histogram in sorted(
+            self.histograms.items(), key=lambda kv: (kv[0][0], STAGES.index(kv[0][1]))
+        ):
+            by_tf.setdefault(tf, {})[stage] = histogram.summary()
+
+        worst = sorted(self.worst.items(), key=lambda kv: kv[1][0], reverse=True)
+
+        return {
+            "stages": by_tf,
+            "worst_symbols": [
+                {"symbol": s, "lag_ms": round(lag, 1), "tf": tf, "open_time": open_time}
+                for s, (lag, tf, open_time) in worst[:WORST_SYMBOLS]
+            ],
+            "updated_at": int(now_ms()),
+        }
+
+    def report(self):
+        """
+        Log + publish the snapshot, then start a new worst-lag window.
+        """
+        snapshot = self.snapshot()
+
+        for tf, stages in snapshot["stages"].items():
+            logger.info(
+                "Latency %s | %s",
+                tf,
+                " ".join(
+                    f"{stage}={s['p50']}/{s['p99']}ms"
+                    for stage, s in stages.items()
+                ),
+            )
+
+        if snapshot["worst_symbols"]:
+            top = snapshot["worst_symbols"][0]
+            logger.info("Latency worst | %s %s lag=%.0fms", top["symbol"], top["tf"], top["lag_ms"])
+
+        try:
+            redis_client.set(LATENCY_KEY, json.dumps(snapshot))
+        except Exception:
+            logger.exception("Failed to publish latency snapshot")
+
+        self.worst = {}
+        return snapshot
+
+
+# Process-wide tracker (DB worker)
+latency = LatencyTracker()
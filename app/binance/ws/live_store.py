@@ -0,0 +1,292 @@
+import os
+import time
+import threading
+
+import numpy as np
+from sqlalchemy import text
+
+from app.db import engine
+from app.config import TIMEFRAMES
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Live candle store
+# --------------------------------------------------
+# Last LIVE_STORE_BARS closed bars per (symbol, tf), kept in
+# preallocated float64 ring buffers of shape
+#
+#   (len(FIELDS), symbols, 2 * bars)
+#
+# The time axis is shared by all symbols of a timeframe
+# (slot = (open_time // tf_ms) % bars) and every bar is written
+# twice (slot and slot + bars), so the latest `bars` bars are always
+# one contiguous slice → window() returns numpy views, no copy.
+# Missing bars are NaN.
+#
+# Views alias the live buffers: they change when the next bar
+# arrives and go stale if the symbol capacity grows. Take a fresh
+# window per scan, or use snapshot() for a stable copy.
+# --------------------------------------------------
+
+FIELDS = (
+    "open_time",
+    "open_price",
+    "high_price",
+    "low_price",
+    "close_price",
+    "base_volume",
+    "quote_volume",
+    "trade_count",
+)
+FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+
+LIVE_STORE_BARS = int(os.getenv("LIVE_STORE_BARS", "200"))
+INITIAL_SYMBOLS = 256
+
+logger = get_logger("market_data.binance.ws.live_store")
+
+
+class TimeframeBuffer:
+
+    def __init__(self, tf, tf_ms, bars, capacity=INITIAL_SYMBOLS):
+        self.tf = tf
+        self.tf_ms = tf_ms
+        self.bars = bars
+
+        self.data = np.full((len(FIELDS), capacity, 2 * bars), np.nan)
+
+        self.index = {}
+        self.symbols = []
+
+        # latest bar number (open_time // tf_ms)
+        self.head = None
+
+        # bumped on every change (shared-memory publisher)
+        self.version = 0
+
+    def _row(self, symbol):
+        row = self.index.get(symbol)
+        if row is not None:
+            return row
+
+        row = len(self.symbols)
+
+        if row == self.data.shape[1]:
+            grown = np.full(
+                (len(FIELDS), row + max(row // 2, 64), 2 * self.bars), np.nan
+            )
+            grown[:, :row] = self.data
+            self.data = grown
+
+        self.index[symbol] = row
+        self.symbols.append(symbol)
+        return row
+
+    def _advance(self, bar):
+        """
+        Move head to `bar`, clearing the slots it skips over.
+        """
+        n = self.bars
+
+        if self.head is not None:
+            for b in range(max(self.head + 1, bar - n + 1), bar + 1):
+                slot = b % n
+                self.data[:, :, slot] = np.nan
+                self.data[:, :, slot + n] = np.nan
+
+        self.head = bar
+
+    def add(self, symbol, open_time, values):
+        bar = open_time // self.tf_ms
+
+        if self.head is None or bar > self.head:
+            self._advance(bar)
+        elif bar <= self.head - self.bars:
+            return False
+
+        row = self._row(symbol)
+        slot = bar % self.bars
+
+        self.data[:, row, slot] = values
+        self.data[:, row, slot + self.bars] = values
+        self.version += 1
+        return True
+
+    def bounds(self, bars):
+        bars = self.bars if bars is None else min(bars, self.bars)
+        stop = self.head % self.bars + self.bars + 1
+        return stop - bars, stop
+
+
+class LiveCandleStore:
+
+    def __init__(self, bars=LIVE_STORE_BARS, timeframes=TIMEFRAMES):
+        self.bars = bars
+        self.lock = threading.RLock()
+
+        self.buffers = {
+            tf: TimeframeBuffer(tf, config["tf_ms"], bars)
+            for tf, config in timeframes.items()
+        }
+
+    def add_timeframe(self, tf, tf_ms):
+        """
+        Extra in-memory timeframe (e.g. sub-minute bars); no-op if known.
+        """
+        with self.lock:
+            if tf not in self.buffers:
+                self.buffers[tf] = TimeframeBuffer(tf, tf_ms, self.bars)
+
+    # ------------------------------------------
+    # Writes (kline handler / HTF aggregator)
+    # ------------------------------------------
+    def add(self, record):
+        """
+        Store a closed CandleRecord. Re-adding a bar overwrites it.
+        """
+        buffer = self.buffers.get(record.interval)
+
+        if buffer is None or not record.is_closed:
+            return False
+
+        values = (
+            record.open_time,
+            record.open_price,
+            record.high_price,
+            record.low_price,
+            record.close_price,
+            record.base_volume,
+            record.quote_volume,
+            record.trade_count,
+        )
+
+        with self.lock:
+            return buffer.add(record.symbol, record.open_time, values)
+
+    def add_bars(self, tf, symbols, open_times, columns):
+        """
+        Bulk add closed bars: `columns` holds one sequence per FIELDS
+        entry, aligned with symbols / open_times.
+        """
+        buffer = self.buffers[tf]
+        values = np.column_stack(columns)
+
+        with self.lock:
+            for symbol, open_time, row in zip(symbols, open_times.tolist(), values):
+                buffer.add(symbol, open_time, row)
+
+    # ------------------------------------------
+    # Reads
+    # ------------------------------------------
+    def window(self, tf, field=None, bars=None):
+        """
+        (symbols, view) for the latest `bars` bars of a timeframe,
+        oldest first. The view is [fields × symbols × bars], or
+        [symbols × bars] when a field is given.
+        """
+        buffer = self.buffers[tf]
+
+        with self.lock:
+            if buffer.head is None:
+                return [], np.empty((0, 0))
+
+            start, stop = buffer.bounds(bars)
+            count = len(buffer.symbols)
+            symbols = list(buffer.symbols)
+
+            if field is None:
+                view = buffer.data[:, :count, start:stop]
+            else:
+                view = buffer.data[FIELD_INDEX[field], :count, start:stop]
+
+        return symbols, view
+
+    def symbol_window(self, tf, symbol, field=None, bars=None):
+        """
+        View of one symbol ([fields × bars] or [bars]); None if unknown.
+        """
+        buffer = self.buffers[tf]
+
+        with self.lock:
+            row = buffer.index.get(symbol)
+            if row is None:
+                return None
+
+            start, stop = buffer.bounds(bars)
+
+            if field is None:
+                return buffer.data[:, row, start:stop]
+            return buffer.data[FIELD_INDEX[field], row, start:stop]
+
+    def snapshot(self, tf, field=None, bars=None):
+        """
+        Like window(), but a copy that later bars don't modify.
+        """
+        with self.lock:
+            symbols, view = self.window(tf, field, bars)
+            return symbols, view.copy()
+
+    def latest_open_time(self, tf):
+        buffer = self.buffers[tf]
+        if buffer.head is None:
+            return None
+        return buffer.head * buffer.tf_ms
+
+    # ------------------------------------------
+    # Warm-up
+    # ------------------------------------------
+    def warm(self):
+        """
+        Fill every timeframe from the DB with one bulk query
+        (closed bars inside each window). Returns rows loaded.
+        """
+        started = time.perf_counter()
+        now_ms = int(time.time() * 1000)
+
+        selects = []
+        params = {}
+
+        for tf, buffer in self.buffers.items():
+            if tf not in TIMEFRAMES:
+                continue
+
+            last_closed = (now_ms // buffer.tf_ms - 1) * buffer.tf_ms
+
+            params[f"since_{tf}"] = last_closed - (self.bars - 1) * buffer.tf_ms
+            params[f"until_{tf}"] = last_closed
+
+            selects.append(f"""
+                SELECT '{tf}' AS tf, symbol, {", ".join(FIELDS)}
+                FROM {TIMEFRAMES[tf]["table"]}
+                WHERE open_time BETWEEN :since_{tf} AND :until_{tf}
+            """)
+
+        sql = " UNION ALL ".join(selects) + " ORDER BY open_time"
+
+        loaded = 0
+
+        with engine.connect() as conn:
+            result = conn.execute(text(sql), params)
+
+            with self.lock:
+                for tf, symbol, *values in result:
+                    values = [np.nan if v is None else v for v in values]
+                    if self.buffers[tf].add(symbol, values[0], values):
+                        loaded += 1
+
+        logger.info(
+            "Live store warmed rows=%d bars=%d ms=%.1f",
+            loaded, self.bars, (time.perf_counter() - started) * 1000,
+        )
+
+        return loaded
+
+    def stats(self):
+        return {
+            tf: {"symbols": len(b.symbols), "head": b.head * b.tf_ms if b.head is not None else None}
+            for tf, b in self.buffers.items()
+        }
+
+
+# Process-wide store (ingest process)
+live_store = LiveCandleStore()
@@ -0,0 +1,290 @@
+import json
+import time
+import signal
+import threading
+from datetime import datetime, timezone
+
+import websocket
+
+from app.redis_client import redis_client
+from app.binance.universe import load_universe
+from app.binance.scripts.funding import (
+    get_symbols_from_db,
+    insert_funding_batch,
+    sync_symbol_funding,
+)
+from app.logging_config import get_logger, setup_logging
+
+# --------------------------------------------------
+# Mark price / funding from !markPrice@arr@1s
+# --------------------------------------------------
+# One WS connection delivers every symbol's mark price, index price,
+# estimated settle price, current funding rate (r) and next funding
+# time (T) once a second. The latest values per symbol live in
+# MarkPriceBook and are mirrored to the MARK_PRICE_KEY Redis hash.
+#
+# Settlement: when a symbol's T moves forward, the funding at the old
+# T has settled at the last r / mark price seen before it. T is the
+# exact settlement time (4h / 1h funding intervals included), so it
+# is stored as is. Those rows are collected and written to
+# funding_rate_8h with one batched upsert SETTLE_WAIT seconds after
+# the first symbol rolled.
+#
+# REST (/fapi/v1/fundingRate via scripts.funding) only repairs gaps:
+# on start, and for tracked symbols that did not settle over WS (the
+# stream was down around the boundary, or the last update before it
+# is older than STALE_MS).
+#
+# Worker entry point: python -m app.binance.ws.mark_price (what
+# app.binance.scripts.funding starts with FUNDING_SOURCE=ws).
+# --------------------------------------------------
+
+STREAM_URL = "wss://fstream.binance.com/ws/!markPrice@arr@1s"
+
+MARK_PRICE_KEY = "mark_price"
+
+SETTLE_WAIT = 10         # seconds after the first roll before writing
+STALE_MS = 5_000         # last pre-boundary update must be this fresh
+PUBLISH_INTERVAL = 5     # seconds between Redis mirror writes
+
+logger = get_logger("market_data.binance.ws.mark_price")
+
+
+class MarkPriceBook:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        # symbol → latest update (dict)
+        self.prices = {}
+
+        # settled rows waiting for the batched upsert
+        self.pending = []
+        self.pending_since = None
+
+        # symbols whose roll could not be settled from the stream
+        self.missed = set()
+
+        # stats
+        self.updates = 0
+        self.settled = 0
+
+    def on_update(self, item):
+        """
+        Apply one markPriceUpdate entry of the array payload.
+        """
+        symbol = item["s"]
+        update = {
+            "mark_price": float(item["p"]),
+            "index_price": float(item["i"]),
+            "settle_price": float(item["P"]),
+            "funding_rate": float(item["r"]),
+            "next_funding_time": int(item["T"]),
+            "event_time": int(item["E"]),
+        }
+
+        with self.lock:
+            self.updates += 1
+            previous = self.prices.get(symbol)
+            self.prices[symbol] = update
+
+            if previous is None or update["next_funding_time"] <= previous["next_funding_time"]:
+                return
+
+            boundary = previous["next_funding_time"]
+
+            if self.pending_since is None:
+                self.pending_since = time.monotonic()
+
+            if boundary - previous["event_time"] > STALE_MS or update["event_time"] < boundary:
+                self.missed.add(symbol)
+                return
+
+            self.pending.append({
+                "symbol": symbol,
+                "funding_time": boundary,
+                "funding_time_utc": datetime.fromtimestamp(boundary / 1000, tz=timezone.utc),
+                "funding_rate": previous["funding_rate"],
+                "mark_price": previous["mark_price"],
+            })
+
+    def take_settled(self):
+        """
+        (rows, missed symbols) once SETTLE_WAIT has passed since the
+        first roll, else ([], set()).
+        """
+        with self.lock:
+            if self.pending_since is None or time.monotonic() - self.pending_since < SETTLE_WAIT:
+                return [], set()
+
+            rows, missed = self.pending, self.missed
+            self.pending, self.missed = [], set()
+            self.pending_since = None
+
+        return rows, missed
+
+    def get(self, symbol):
+        with self.lock:
+            return self.prices.get(symbol)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.prices)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "symbols": len(self.prices),
+                "updates": self.updates,
+                "settled": self.settled,
+                "pending": len(self.pending),
+            }
+
+
+# Process-wide book (funding worker)
+book = MarkPriceBook()
+RUNNING = True
+ws_app = None
+
+
+# --------------------------------------------------
+# Settlement + repair
+# --------------------------------------------------
+def tracked_symbols():
+    return set(load_universe()) | set(get_symbols_from_db())
+
+
+def repair(symbols):
+    """
+    REST backfill for symbols the stream could not settle.
+    """
+    for symbol in sorted(symbols):
+        if not RUNNING:
+            return
+        try:
+            sync_symbol_funding(symbol)
+        except Exception:
+            logger.exception("Funding repair failed for %s", symbol)
+
+
+def settle():
+    rows, missed = book.take_settled()
+    if not rows and not missed:
+        return
+
+    tracked = tracked_symbols()
+    rows = [row for row in rows if row["symbol"] in tracked]
+
+    if rows:
+        insert_funding_batch(rows)
+        book.settled += len(rows)
+        logger.info(
+            "Funding settled | %d symbols at %s",
+            len(rows), rows[0]["funding_time_utc"].isoformat(),
+        )
+
+    missed &= tracked
+    if missed:
+        logger.warning("Funding not settled over WS for %d symbols; repairing via REST", len(missed))
+        repair(missed)
+
+
+def publish():
+    prices = book.snapshot()
+    if not prices:
+        return
+
+    try:
+        redis_client.hset(MARK_PRICE_KEY, mapping={
+            symbol: json.dumps(update) for symbol, update in prices.items()
+        })
+    except Exception:
+        logger.exception("Failed to publish mark prices")
+
+
+def maintain():
+    """
+    Settlement / publish loop; runs next to the WS connection.
+    """
+    logger.info("Funding repair on start")
+    repair(tracked_symbols())
+
+    last_publish = 0.0
+    last_stats = time.monotonic()
+
+    while RUNNING:
+        time.sleep(1)
+
+        try:
+            settle()
+        except Exception:
+            logger.exception("Funding settlement failed")
+
+        if time.monotonic() - last_publish >= PUBLISH_INTERVAL:
+            publish()
+            last_publish = time.monotonic()
+
+        if time.monotonic() - last_stats >= 60:
+            logger.info("Mark price | %s", book.stats())
+            last_stats = time.monotonic()
+
+
+# --------------------------------------------------
+# WS connection
+# --------------------------------------------------
+def on_message(ws, message):
+    try:
+        items = json.loads(message)
+    except Exception:
+        logger.warning("Invalid JSON received")
+        return
+
+    if not isinstance(items, list):
+        return
+
+    for item in items:
+        if item.get("e") == "markPriceUpdate":
+            book.on_update(item)
+
+
+def shutdown_handler(sig, frame):
+    global RUNNING
+    logger.info("Shutdown signal received")
+    RUNNING = False
+
+    if ws_app is not None:
+        ws_app.close()
+
+
+def run():
+    global ws_app
+
+    threading.Thread(target=maintain, daemon=True).start()
+
+    while RUNNING:
+        try:
+            logger.info("Connecting → %s", STREAM_URL)
+
+            ws_app = websocket.WebSocketApp(STREAM_URL, on_message=on_message)
+            ws_app.run_forever(ping_interval=20, ping_timeout=10)
+
+        except Exception:
+            logger.exception("Connection error")
+
+        if RUNNING:
+            time.sleep(5)
+
+    logger.info("Mark price stream stopped | %s", book.stats())
+
+
+def main():
+    setup_logging()
+
+    signal.signal(signal.SIGINT, shutdown_handler)
+    signal.signal(signal.SIGTERM, shutdown_handler)
+
+    run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import zlib
+import signal
+import asyncio
+import threading
+
+import websockets
+
+from app.logging_config import get_logger, setup_logging
+from app.redis_client import redis_client
+from app.binance.universe import UniverseListener, load_universe
+from app.binance.ws.handlers import kline_handler, agg_trade_handler
+from app.binance.ws import db_worker, trade_bars
+from app.binance.ws.latency import now_ms
+
+# --------------------------------------------------
+# Sharded combined-stream engine
+# --------------------------------------------------
+# The universe from the `liquid_coins` Redis key is split across
+# SHARD_COUNT connections to /stream?streams=a/b/c. A symbol always
+# lands on the same shard (crc32 of the name), so a universe change
+# only reconnects the shards whose stream list actually changed.
+# --------------------------------------------------
+
+COMBINED_URL = "wss://fstream.binance.com/stream?streams="
+STATS_KEY = "ws_engine:shards"
+
+SHARD_COUNT = int(os.getenv("WS_SHARDS", "4"))
+MAX_STREAMS_PER_SHARD = 200  # Binance per-connection stream cap
+
+INTERVALS = ["1m"]
+
+WATCH_INTERVAL = 60  # full reconcile; deltas apply immediately
+STATS_INTERVAL = 30
+MAX_BACKOFF = 60
+
+RUNNING = True
+
+setup_logging()
+logger = get_logger("market_data.binance.ws.sharded")
+
+
+class Shard:
+
+    def __init__(self, shard_id):
+        self.shard_id = shard_id
+        self.streams = []
+        self.ws = None
+        self.changed = asyncio.Event()
+
+        # counters
+        self.messages = 0
+        self.candles = 0
+        self.reconnects = 0
+        self.errors = 0
+        self.connected_at = None
+        self.last_message_at = None
+
+        # throughput window
+        self._window_start = time.monotonic()
+        self._window_messages = 0
+
+    def url(self):
+        return COMBINED_URL + "/".join(self.streams)
+
+    def apply(self, streams):
+        """
+        Swap the stream list. A live connection is closed so the
+        shard loop reconnects with the new URL.
+        """
+        if streams == self.streams:
+            return False
+
+        self.streams = streams
+        self.changed.set()
+
+        if self.ws is not None:
+            asyncio.ensure_future(self.ws.close())
+
+        return True
+
+    def stats(self):
+        now = time.monotonic()
+        elapsed = max(now - self._window_start, 1e-9)
+        rate = (self.messages - self._window_messages) / elapsed
+
+        self._window_start = now
+        self._window_messages = self.messages
+
+        return {
+            "shard": self.shard_id,
+            "streams": len(self.streams),
+            "connected": self.ws is not None,
+            "messages": self.messages,
+            "candles": self.candles,
+            "msg_per_sec": round(rate, 2),
+            "reconnects": self.reconnects,
+            "errors": self.errors,
+            "connected_at": self.connected_at,
+            "last_message_at": self.last_message_at,
+        }
+
+
+shards = []
+
+
+# --------------------------------------------------
+# Universe / shard assignment
+# --------------------------------------------------
+def get_symbols():
+    return load_universe()
+
+
+def shard_for(symbol):
+    return zlib.crc32(symbol.lower().encode()) % SHARD_COUNT
+
+
+def assign_streams(symbols):
+    buckets = [[] for _ in range(SHARD_COUNT)]
+
+    for s in sorted(set(symbols)):
+        idx = shard_for(s)
+
+        if trade_bars.TRADE_BARS_ENABLED:
+            buckets[idx].append(f"{s.lower()}@aggTrade")
+            continue
+
+        for tf in INTERVALS:
+            buckets[idx].append(f"{s.lower()}@kline_{tf}")
+
+    for idx, streams in enumerate(buckets):
+        if len(streams) > MAX_STREAMS_PER_SHARD:
+            logger.warning(
+                "Shard %d has %d streams (cap %d) — raise WS_SHARDS",
+                idx, len(streams), MAX_STREAMS_PER_SHARD,
+            )
+
+    return buckets
+
+
+def apply_universe(symbols):
+    changed = 0
+    for shard, streams in zip(shards, assign_streams(symbols)):
+        if shard.apply(streams):
+            changed += 1
+
+    if changed:
+        logger.info("Universe %d symbols → %d shard(s) re-subscribing", len(symbols), changed)
+
+
+# --------------------------------------------------
+# Shard connection loop
+# --------------------------------------------------
+def on_message(shard, message):
+    received_at = now_ms()
+
+    shard.messages += 1
+    shard.last_message_at = received_at / 1000
+
+    try:
+        msg = json.loads(message)
+    except Exception:
+        logger.warning("Invalid JSON on shard %d", shard.shard_id)
+        return
+
+    data = msg.get("data")
+    if not data:
+        return
+
+    event = data.get("e")
+
+    if event == "aggTrade":
+        agg_trade_handler.handle(data, received_at)
+        return
+
+    if event != "kline":
+        return
+
+    if data["k"]["x"]:
+        shard.candles += 1
+
+    kline_handler.handle(data, received_at)
+
+
+async def run_shard(shard):
+    backoff = 1
+
+    while RUNNING:
+
+        if not shard.streams:
+            shard.changed.clear()
+            await shard.changed.wait()
+            continue
+
+        shard.changed.clear()
+
+        try:
+            logger.info("Shard %d connecting (%d streams)", shard.shard_id, len(shard.streams))
+
+            async with websockets.connect(
+                shard.url(),
+                ping_interval=20,
+                ping_timeout=10,
+                max_queue=None,
+            ) as ws:
+                shard.ws = ws
+                shard.connected_at = time.time()
+                backoff = 1
+
+                if trade_bars.TRADE_BARS_ENABLED:
+                    trade_bars.get_builder().mark_connected(
+                        [s.split("@")[0].upper() for s in shard.streams]
+                    )
+
+                async for message in ws:
+                    on_message(shard, message)
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception:
+            shard.errors += 1
+            logger.exception("Shard %d connection error", shard.shard_id)
+
+        finally:
+            shard.ws = None
+
+        if not RUNNING:
+            break
+
+        shard.reconnects += 1
+
+        # stream-list change (or shutdown) cuts the backoff short
+        try:
+            await asyncio.wait_for(shard.changed.wait(), backoff)
+        except asyncio.TimeoutError:
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+
+# --------------------------------------------------
+# Background tasks
+# --------------------------------------------------
+def wait_for_delta(listener, timeout):
+    deadline = time.monotonic() + timeout
+
+    while RUNNING and time.monotonic() < deadline:
+        delta = listener.wait(timeout=1.0)
+        if delta:
+            return delta
+
+    return None
+
+
+async def watch_symbols():
+    logger.info("Symbol watcher started")
+
+    listener = UniverseListener()
+
+    while RUNNING:
+        try:
+            symbols = await asyncio.to_thread(get_symbols)
+            apply_universe(symbols)
+        except Exception:
+            logger.exception("Symbol watcher error")
+
+        # wake on the next universe delta, reconcile at the latest
+        # after WATCH_INTERVAL
+        await asyncio.to_thread(wait_for_delta, listener, WATCH_INTERVAL)
+
+    listener.close()
+
+
+def get_stats():
+    return [shard.stats() for shard in shards]
+
+
+async def report_stats():
+    while RUNNING:
+        await asyncio.sleep(STATS_INTERVAL)
+
+        stats = get_stats()
+
+        for s in stats:
+            logger.info(
+                "Shard %d | streams=%d msg/s=%.2f candles=%d reconnects=%d errors=%d",
+                s["shard"], s["streams"], s["msg_per_sec"],
+                s["candles"], s["reconnects"], s["errors"],
+            )
+
+        logger.info("Writer | %s", db_worker.get_writer_stats())
+
+        try:
+            await asyncio.to_thread(redis_client.set, STATS_KEY, json.dumps(stats))
+        except Exception:
+            logger.warning("Could not publish shard stats")
+
+
+# --------------------------------------------------
+# Entry
+# --------------------------------------------------
+def shutdown():
+    global RUNNING
+    logger.info("Shutdown signal received")
+    RUNNING = False
+    db_worker.RUNNING = False
+    trade_bars.RUNNING = False
+
+    for shard in shards:
+        shard.changed.set()
+        if shard.ws is not None:
+            asyncio.ensure_future(shard.ws.close())
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, shutdown)
+
+    shards.extend(Shard(i) for i in range(SHARD_COUNT))
+
+    tasks = [asyncio.create_task(run_shard(s)) for s in shards]
+    watcher = asyncio.create_task(watch_symbols())
+    reporter = asyncio.create_task(report_stats())
+
+    await asyncio.gather(*tasks)
+
+    watcher.cancel()
+    reporter.cancel()
+
+
+def run():
+    logger.info("Starting DB worker thread")
+    db_thread = threading.Thread(target=db_worker.run, daemon=True)
+    db_thread.start()
+
+    if trade_bars.TRADE_BARS_ENABLED:
+        logger.info("Starting trade bar builder (source=aggtrade)")
+        threading.Thread(target=trade_bars.run, daemon=True).start()
+
+    logger.info("Sharded engine booting with %d shards", SHARD_COUNT)
+    asyncio.run(main())
+
+    db_thread.join(timeout=10)
+    logger.info("Engine stopped")
+
+
+if __name__ == "__main__":
+    run()
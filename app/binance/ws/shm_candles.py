@@ -0,0 +1,271 @@
+import os
+import time
+import struct
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from app.binance.ws.live_store import FIELDS, FIELD_INDEX
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Shared-memory candle windows
+# --------------------------------------------------
+# The ingest process copies each LiveCandleStore window into one
+# shared memory segment per timeframe ("<SHM_PREFIX>_<tf>"); scanner
+# processes map it read-only and copy out the latest bars.
+#
+# Layout (little endian):
+#
+#   0   magic        8s   b"MDCANDL1"
+#   8   fields       u32  len(FIELDS)
+#   12  capacity     u32  max symbols
+#   16  bars         u32
+#   24  seq          i64  seqlock counter (odd while writing)
+#   32  count        i64  symbols published
+#   40  open_time    i64  latest bar open_time (-1 → empty)
+#   48  published_at i64  ms
+#   64  symbols      capacity x SYMBOL_BYTES (NUL padded ascii)
+#   ..  data         float64 [fields × capacity × bars], oldest first
+#
+# Seqlock: the writer makes seq odd, writes, makes it even again.
+# A reader copies between two reads of seq and retries if it was odd
+# or changed. seq is an aligned 8-byte store, and x86-64 keeps stores
+# in program order, so no extra fencing is needed.
+#
+# A publish copies the whole window (several ms for a full segment),
+# so readers back off between attempts (yield, then up to
+# READ_BACKOFF_MAX) and give up after READ_TIMEOUT seconds.
+# --------------------------------------------------
+
+SHM_ENABLED = os.getenv("SHM_CANDLES", "1") == "1"
+SHM_PREFIX = os.getenv("SHM_CANDLES_PREFIX", "md_candles")
+SHM_MAX_SYMBOLS = int(os.getenv("SHM_MAX_SYMBOLS", "512"))
+SHM_PUBLISH_INTERVAL = 0.5  # seconds, min time between publishes
+
+MAGIC = b"MDCANDL1"
+LAYOUT = struct.Struct("<8sIII")
+META_OFFSET = 24
+META_FIELDS = 4  # seq, count, open_time, published_at
+SYMBOLS_OFFSET = 64
+SYMBOL_BYTES = 20
+
+READ_TIMEOUT = float(os.getenv("SHM_READ_TIMEOUT", "0.5"))  # seconds
+READ_BACKOFF_MIN = 0.0005
+READ_BACKOFF_MAX = 0.005
+
+logger = get_logger("market_data.binance.ws.shm_candles")
+
+
+def segment_name(tf):
+    return f"{SHM_PREFIX}_{tf}"
+
+
+def data_offset(capacity):
+    end = SYMBOLS_OFFSET + capacity * SYMBOL_BYTES
+    return (end + 7) // 8 * 8
+
+
+def segment_size(capacity, bars):
+    return data_offset(capacity) + len(FIELDS) * capacity * bars * 8
+
+
+class CandleSegment:
+    """
+    numpy views over one mapped segment.
+    """
+
+    def __init__(self, shm, capacity, bars):
+        self.shm = shm
+        self.capacity = capacity
+        self.bars = bars
+
+        self.meta = np.ndarray(META_FIELDS, dtype=np.int64, buffer=shm.buf, offset=META_OFFSET)
+        self.names = np.ndarray(
+            capacity, dtype=f"S{SYMBOL_BYTES}", buffer=shm.buf, offset=SYMBOLS_OFFSET
+        )
+        self.data = np.ndarray(
+            (len(FIELDS), capacity, bars),
+            dtype=np.float64,
+            buffer=shm.buf,
+            offset=data_offset(capacity),
+        )
+
+    def close(self):
+        # views must go before the mapping can be closed
+        self.meta = self.names = self.data = None
+        self.shm.close()
+
+
+# --------------------------------------------------
+# Publisher (ingest process)
+# --------------------------------------------------
+class CandleShmPublisher:
+
+    def __init__(self, store, capacity=SHM_MAX_SYMBOLS):
+        self.store = store
+        self.capacity = capacity
+
+        self.segments = {}
+        self.published = {}
+        self.last_publish = 0.0
+        self.truncated = set()
+
+        for tf in store.buffers:
+            self.segments[tf] = self._create(tf)
+            self.published[tf] = -1
+
+    def _create(self, tf):
+        name = segment_name(tf)
+        size = segment_size(self.capacity, self.store.bars)
+
+        # left behind by a crashed ingest process
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        LAYOUT.pack_into(shm.buf, 0, MAGIC, len(FIELDS), self.capacity, self.store.bars)
+
+        segment = CandleSegment(shm, self.capacity, self.store.bars)
+        segment.meta[:] = (0, 0, -1, 0)
+
+        logger.info("Shared memory segment %s size=%d", name, size)
+        return segment
+
+    def publish(self, tf):
+        segment = self.segments[tf]
+        meta = segment.meta
+
+        with self.store.lock:
+            buffer = self.store.buffers[tf]
+            symbols, view = self.store.window(tf)
+
+            count = min(len(symbols), self.capacity)
+            if count < len(symbols) and tf not in self.truncated:
+                logger.warning(
+                    "Shared memory %s full: %d symbols, capacity %d",
+                    tf, len(symbols), self.capacity,
+                )
+                self.truncated.add(tf)
+
+            meta[0] += 1  # odd: write in progress
+
+            # symbols are only ever appended
+            published = int(meta[1])
+            if count > published:
+                segment.names[published:count] = [s.encode() for s in symbols[published:count]]
+
+            if count:
+                segment.data[:, :count, :] = view[:, :count, :]
+
+            meta[1] = count
+            meta[2] = -1 if buffer.head is None else buffer.head * buffer.tf_ms
+            meta[3] = int(time.time() * 1000)
+
+            meta[0] += 1  # even: consistent
+
+            self.published[tf] = buffer.version
+
+    def maybe_publish(self):
+        """
+        Publish timeframes that changed since the last call,
+        at most every SHM_PUBLISH_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        if now - self.last_publish < SHM_PUBLISH_INTERVAL:
+            return
+
+        self.last_publish = now
+
+        for tf, buffer in list(self.store.buffers.items()):
+            if tf in self.segments and buffer.version != self.published[tf]:
+                self.publish(tf)
+
+    def close(self):
+        for segment in self.segments.values():
+            shm = segment.shm
+            segment.close()
+            shm.unlink()
+        self.segments = {}
+
+
+# --------------------------------------------------
+# Reader (scanner processes)
+# --------------------------------------------------
+class CandleShmReader:
+
+    def __init__(self, tf):
+        """
+        Attach to a published timeframe. Raises FileNotFoundError
+        when the ingest process is not running.
+        """
+        self.tf = tf
+
+        shm = shared_memory.SharedMemory(name=segment_name(tf))
+
+        # attaching registers the segment with this process' resource
+        # tracker, which would unlink it on exit (Python < 3.13)
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+
+        magic, fields, capacity, bars = LAYOUT.unpack_from(shm.buf, 0)
+
+        if magic != MAGIC or fields != len(FIELDS):
+            shm.close()
+            raise ValueError(f"Incompatible candle segment {segment_name(tf)}")
+
+        self.segment = CandleSegment(shm, capacity, bars)
+        self.bars = bars
+
+        self.symbols = []
+        self.open_time = None
+        self.published_at = None
+
+    def read(self, field=None, bars=None, timeout=READ_TIMEOUT):
+        """
+        (symbols, copy of the latest `bars` bars) — [fields × symbols
+        × bars], or [symbols × bars] for one field. Oldest first,
+        NaN for missing bars. Raises RuntimeError if no consistent
+        copy could be taken within `timeout` seconds.
+        """
+        segment = self.segment
+        meta = segment.meta
+
+        bars = self.bars if bars is None else min(bars, self.bars)
+        source = segment.data if field is None else segment.data[FIELD_INDEX[field]]
+
+        deadline = time.monotonic() + timeout
+        delay = 0
+
+        while True:
+            seq = int(meta[0])
+
+            if not seq & 1:
+                count = int(meta[1])
+                block = source[..., :count, self.bars - bars:].copy()
+                open_time = int(meta[2])
+                published_at = int(meta[3])
+
+                if count > len(self.symbols):
+                    self.symbols += [n.decode() for n in segment.names[len(self.symbols):count]]
+
+                if int(meta[0]) == seq:
+                    self.open_time = None if open_time == -1 else open_time
+                    self.published_at = published_at
+                    return self.symbols[:count], block
+
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"Candle segment {segment_name(self.tf)} busy for {timeout}s")
+
+            # let the publisher finish its copy
+            time.sleep(delay)
+            delay = min(max(delay * 2, READ_BACKOFF_MIN), READ_BACKOFF_MAX)
+
+    def close(self):
+        self.segment.close()
@@ -0,0 +1,179 @@
+import json
+import time
+import threading
+from collections import deque
+
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# SUBSCRIBE / UNSUBSCRIBE control messages
+# --------------------------------------------------
+# Stream changes are split into chunks of MAX_STREAMS_PER_MESSAGE and
+# sent at most MAX_MESSAGES_PER_SEC per connection (Binance closes
+# connections above 10 incoming messages/s). Every request carries
+# an id; the matching {"result": null, "id": ...} confirms it, an
+# error response or a missing ACK after ACK_TIMEOUT is logged and
+# retried up to MAX_ATTEMPTS times. on_confirm(method, params) is
+# called for every confirmed request.
+# --------------------------------------------------
+
+MAX_STREAMS_PER_MESSAGE = 50
+MAX_MESSAGES_PER_SEC = 5
+ACK_TIMEOUT = 5.0
+MAX_ATTEMPTS = 3
+
+logger = get_logger("market_data.binance.ws.subscriptions")
+
+
+class SubscriptionManager:
+
+    def __init__(self, send, on_confirm=None):
+        self.send = send
+        self.on_confirm = on_confirm
+
+        self.lock = threading.Lock()
+        self.outbox = deque()
+        self.pending = {}
+
+        self.next_id = 1
+        self.last_sent = 0.0
+
+        # stats
+        self.confirmed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    # ------------------------------------------
+    # Requests
+    # ------------------------------------------
+    def _enqueue(self, method, params):
+        with self.lock:
+            for i in range(0, len(params), MAX_STREAMS_PER_MESSAGE):
+                self.outbox.append({
+                    "method": method,
+                    "params": params[i:i + MAX_STREAMS_PER_MESSAGE],
+                    "attempts": 0,
+                })
+
+    def subscribe(self, params):
+        self._enqueue("SUBSCRIBE", params)
+
+    def unsubscribe(self, params):
+        self._enqueue("UNSUBSCRIBE", params)
+
+    def reset(self):
+        """
+        Forget queued and unacknowledged requests (new connection).
+        """
+        with self.lock:
+            self.outbox.clear()
+            self.pending.clear()
+
+    def idle(self):
+        return not self.outbox and not self.pending
+
+    # ------------------------------------------
+    # Responses (on_message)
+    # ------------------------------------------
+    def on_response(self, msg):
+        """
+        Handle a control response; False if `msg` is not one.
+        """
+        request_id = msg.get("id")
+
+        if request_id is None or not ("result" in msg or "error" in msg or "code" in msg):
+            return False
+
+        with self.lock:
+            request = self.pending.pop(request_id, None)
+
+            if request is None:
+                logger.warning("Response for unknown request id=%s: %s", request_id, msg)
+                return True
+
+            if "error" in msg or "code" in msg:
+                self.rejected += 1
+                logger.error(
+                    "%s rejected id=%s streams=%d attempt=%d: %s",
+                    request["method"], request_id, len(request["params"]),
+                    request["attempts"], msg.get("error", msg),
+                )
+                self._retry(request)
+                return True
+
+            self.confirmed += 1
+
+        logger.info(
+            "%s confirmed id=%s streams=%d in %.0f ms",
+            request["method"], request_id, len(request["params"]),
+            (time.monotonic() - request["sent_at"]) * 1000,
+        )
+
+        if self.on_confirm is not None:
+            self.on_confirm(request["method"], request["params"])
+
+        return True
+
+    def _retry(self, request):
+        if request["attempts"] >= MAX_ATTEMPTS:
+            logger.error(
+                "Giving up %s after %d attempts: %s",
+                request["method"], request["attempts"], request["params"],
+            )
+            return
+        self.outbox.append(request)
+
+    # ------------------------------------------
+    # Sender (call regularly from one thread)
+    # ------------------------------------------
+    def pump(self):
+        now = time.monotonic()
+
+        with self.lock:
+            for request_id, request in list(self.pending.items()):
+                if now - request["sent_at"] >= ACK_TIMEOUT:
+                    del self.pending[request_id]
+                    self.timeouts += 1
+                    logger.warning(
+                        "No ACK for %s id=%s after %.0fs",
+                        request["method"], request_id, ACK_TIMEOUT,
+                    )
+                    self._retry(request)
+
+            if not self.outbox or now - self.last_sent < 1 / MAX_MESSAGES_PER_SEC:
+                return
+
+            request = self.outbox.popleft()
+            request_id = self.next_id
+
+            # registered before sending: the ACK may arrive first
+            self.next_id += 1
+            self.last_sent = now
+            request["attempts"] += 1
+            request["sent_at"] = now
+            self.pending[request_id] = request
+
+        try:
+            self.send(json.dumps({
+                "method": request["method"],
+                "params": request["params"],
+                "id": request_id,
+            }))
+        except Exception:
+            logger.exception("Failed to send %s", request["method"])
+            with self.lock:
+                self.pending.pop(request_id, None)
+                request["attempts"] -= 1
+                self.outbox.appendleft(request)
+            return
+
+        logger.info("%s → %d streams (id=%s)", request["method"], len(request["params"]), request_id)
+
+    def stats(self):
+        return {
+            "queued": len(self.outbox),
+            "pending": len(self.pending),
+            "confirmed": self.confirmed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
@@ -0,0 +1,578 @@
+import os
+import time
+import threading
+
+import numpy as np
+
+from app.binance.candle_record import CandleRecord
+from app.binance.ws.live_store import live_store
+from app.binance.ws.latency import now_ms
+from app.logging_config import get_logger
+
+# --------------------------------------------------
+# Sub-minute bars from @aggTrade
+# --------------------------------------------------
+# CANDLE_SOURCE=aggtrade subscribes <symbol>@aggTrade instead of
+# @kline_1m. The handler only appends the raw fields to column
+# lists. Every FLUSH_INTERVAL the builder aggregates them with numpy,
+# one vectorized pass per resolution:
+#
+#   trades → 1s → 5s / 15s / 1m
+#
+# A second is aggregated once it is GRACE_MS in the past, so every
+# sub-minute bar is built from all its trades exactly once. Trades
+# arriving later than that are counted as late and left out of the
+# sub-minute bars (live only). Buckets that start before a symbol was
+# (re)connected are incomplete and never emitted: a reconnect costs
+# that symbol its current minute, which the gap watchdog backfills.
+#
+# 1s/5s/15s bars go to the live store (and from there to shared
+# memory). 1m bars are persisted, so they are built from the trades
+# themselves, SETTLE_MS after the minute ended (late trades
+# included), and become CandleRecords in the candles_1m schema
+# (first/last trade id, taker-buy volumes, trade count = sum of
+# l - f + 1) that go down the normal journal → DB worker path.
+# Minutes without any trade produce no bar (the kline stream would
+# send an empty one).
+#
+# A stored 1m bar must be exact, because coverage marks it present
+# and nothing would repair it. Trade ids of a symbol are consecutive
+# (f == previous l + 1), so a minute whose trades skip ids, or that
+# doesn't continue the last emitted one, lost trades: it is not
+# emitted, and it (with the minutes since the last emitted bar) is
+# queued for a REST re-fetch (gaps.repair_queue). So is an emitted
+# minute that a trade arrives for after SETTLE_MS.
+# --------------------------------------------------
+
+CANDLE_SOURCE = os.getenv("CANDLE_SOURCE", "kline")
+TRADE_BARS_ENABLED = CANDLE_SOURCE == "aggtrade"
+
+SUB_MINUTE = {"1s": 1_000, "5s": 5_000, "15s": 15_000}
+ROLLUPS = [("5s", 5_000), ("15s", 15_000)]
+MINUTE_MS = 60_000
+
+FLUSH_INTERVAL = 0.25
+GRACE_MS = 500
+SETTLE_MS = int(os.getenv("TRADE_BAR_SETTLE_MS", "5000"))
+STATS_INTERVAL = 60
+
+# bar columns (trades use the same layout: open = high = low = close)
+COLUMNS = {
+    "symbol": np.int32,
+    "open_time": np.int64,
+    "order": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.float64,
+    "quote_volume": np.float64,
+    "taker_base": np.float64,
+    "taker_quote": np.float64,
+    "first_id": np.int64,
+    "last_id": np.int64,
+    "count": np.int64,
+}
+
+logger = get_logger("market_data.binance.ws.trade_bars")
+
+
+def empty_bars():
+    return {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+
+
+def concat_bars(a, b):
+    return {name: np.concatenate((a[name], b[name])) for name in COLUMNS}
+
+
+def select(bars, mask):
+    return {name: values[mask] for name, values in bars.items()}
+
+
+def rollup(bars, bucket_ms):
+    """
+    Aggregate bars (or trades) into buckets of bucket_ms per symbol.
+    Rows are ordered by `order` (aggregate trade id / open_time)
+    inside a bucket.
+    """
+    n = len(bars["symbol"])
+    if not n:
+        return empty_bars()
+
+    bucket = bars["open_time"] // bucket_ms * bucket_ms
+    order = np.lexsort((bars["order"], bucket, bars["symbol"]))
+
+    symbol = bars["symbol"][order]
+    bucket = bucket[order]
+
+    change = np.empty(n, dtype=bool)
+    change[0] = True
+    change[1:] = (symbol[1:] != symbol[:-1]) | (bucket[1:] != bucket[:-1])
+
+    starts = np.flatnonzero(change)
+    ends = np.append(starts[1:], n) - 1
+
+    def col(name):
+        return bars[name][order]
+
+    return {
+        "symbol": symbol[starts],
+        "open_time": bucket[starts],
+        "order": bucket[starts],
+        "open": col("open")[starts],
+        "high": np.maximum.reduceat(col("high"), starts),
+        "low": np.minimum.reduceat(col("low"), starts),
+        "close": col("close")[ends],
+        "volume": np.add.reduceat(col("volume"), starts),
+        "quote_volume": np.add.reduceat(col("quote_volume"), starts),
+        "taker_base": np.add.reduceat(col("taker_base"), starts),
+        "taker_quote": np.add.reduceat(col("taker_quote"), starts),
+        "first_id": np.minimum.reduceat(col("first_id"), starts),
+        "last_id": np.maximum.reduceat(col("last_id"), starts),
+        "count": np.add.reduceat(col("count"), starts),
+    }
+
+
+def broken_minutes(trades, last_ids):
+    """
+    {(symbol idx, minute)} whose trades don't form one run of
+    consecutive trade ids, continuing last_ids[symbol] (-1: unknown),
+    and {symbol idx: (last trade id, its minute)} after them.
+    """
+    broken = set()
+    ends = {}
+
+    n = len(trades["symbol"])
+    if not n:
+        return broken, ends
+
+    order = np.lexsort((trades["order"], trades["symbol"]))
+
+    symbol = trades["symbol"][order]
+    minute = trades["open_time"][order] // MINUTE_MS * MINUTE_MS
+    first = trades["first_id"][order]
+    last = trades["last_id"][order]
+
+    new_symbol = np.empty(n, dtype=bool)
+    new_symbol[0] = True
+    new_symbol[1:] = symbol[1:] != symbol[:-1]
+
+    previous = np.empty(n, dtype=np.int64)
+    previous[1:] = last[:-1]
+
+    known = np.array([last_ids[i][0] for i in symbol[new_symbol]], dtype=np.int64)
+    previous[new_symbol] = known
+
+    skipped = (first != previous + 1) & (previous >= 0)
+
+    for i in np.flatnonzero(skipped).tolist():
+        idx = int(symbol[i])
+        broken.add((idx, int(minute[i])))
+
+        # the lost trades may belong to any minute since the last one
+        since = int(minute[i - 1]) if not new_symbol[i] else last_ids[idx][1]
+        for m in range(since, int(minute[i]), MINUTE_MS):
+            broken.add((idx, m))
+
+    for i in (np.append(np.flatnonzero(new_symbol)[1:], n) - 1).tolist():
+        ends[int(symbol[i])] = (int(last[i]), int(minute[i]))
+
+    return broken, ends
+
+
+class TradeBarBuilder:
+
+    def __init__(self, store=live_store, submit=None, repair=None):
+        self.store = store
+        self.submit = submit
+        self.repair = repair
+
+        self.lock = threading.Lock()
+
+        self.index = {}
+        self.symbols = []
+
+        # symbol idx → first open_time whose bars are complete
+        self.valid_from = []
+
+        # symbol idx → (last trade id, minute) of the emitted 1m bars
+        self.last_ids = []
+
+        self._reset_columns()
+
+        # trades of seconds not yet closed, 1s bars of open buckets
+        self.carry = empty_bars()
+        self.seconds = empty_bars()
+
+        # trades of minutes not yet emitted, one chunk per flush
+        self.minute_trades = []
+
+        # everything before this has been aggregated
+        self.cutoff = None
+        self.emitted_until = {tf: None for tf, _ in ROLLUPS}
+        self.minutes_until = None
+
+        for tf, tf_ms in SUB_MINUTE.items():
+            store.add_timeframe(tf, tf_ms)
+
+        # stats
+        self.trades = 0
+        self.late_trades = 0
+        self.repairs = 0
+        self.bars = {tf: 0 for tf in ("1s", *[tf for tf, _ in ROLLUPS], "1m")}
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def _reset_columns(self):
+        self.c_symbol = []
+        self.c_time = []
+        self.c_id = []
+        self.c_price = []
+        self.c_qty = []
+        self.c_first = []
+        self.c_last = []
+        self.c_maker = []
+
+    # ------------------------------------------
+    # Hot path (WS thread)
+    # ------------------------------------------
+    def add_trade(self, data):
+        """
+        Append one aggTrade event (the `data` object).
+        """
+        symbol = data["s"]
+
+        with self.lock:
+            idx = self.index.get(symbol)
+            if idx is None:
+                idx = self._register(symbol, data["T"])
+
+            self.c_symbol.append(idx)
+            self.c_time.append(data["T"])
+            self.c_id.append(data["a"])
+            self.c_price.append(float(data["p"]))
+            self.c_qty.append(float(data["q"]))
+            self.c_first.append(data["f"])
+            self.c_last.append(data["l"])
+            self.c_maker.append(data["m"])
+
+    def _register(self, symbol, seen_ms):
+        idx = self.index[symbol] = len(self.symbols)
+        self.symbols.append(symbol)
+        self.valid_from.append((seen_ms // 1000 + 1) * 1000)
+        self.last_ids.append((-1, None))
+        return idx
+
+    def mark_connected(self, symbols, at_ms=None):
+        """
+        The stream of these symbols (re)started at at_ms: trades
+        before it may be missing.
+        """
+        at_ms = now_ms() if at_ms is None else at_ms
+        start = (int(at_ms) // 1000 + 1) * 1000
+
+        with self.lock:
+            for symbol in symbols:
+                idx = self.index.get(symbol)
+                if idx is None:
+                    self._register(symbol, at_ms)
+                else:
+                    self.valid_from[idx] = start
+                    self.last_ids[idx] = (-1, None)
+
+    def _complete(self, bars, valid):
+        if not len(bars["symbol"]):
+            return bars
+        return select(bars, bars["open_time"] >= valid[bars["symbol"]])
+
+    # ------------------------------------------
+    # Aggregation (builder thread)
+    # ------------------------------------------
+    def _take_trades(self):
+        with self.lock:
+            columns = (
+                self.c_symbol, self.c_time, self.c_id, self.c_price,
+                self.c_qty, self.c_first, self.c_last, self.c_maker,
+            )
+            self._reset_columns()
+
+        symbol, t, agg_id, price, qty, first, last, maker = columns
+
+        price = np.array(price, dtype=np.float64)
+        qty = np.array(qty, dtype=np.float64)
+        quote = price * qty
+        taker = ~np.array(maker, dtype=bool)
+        first = np.array(first, dtype=np.int64)
+        last = np.array(last, dtype=np.int64)
+
+        return {
+            "symbol": np.array(symbol, dtype=np.int32),
+            "open_time": np.array(t, dtype=np.int64),
+            "order": np.array(agg_id, dtype=np.int64),
+            "open": price,
+            "high": price,
+            "low": price,
+            "close": price,
+            "volume": qty,
+            "quote_volume": quote,
+            "taker_base": np.where(taker, qty, 0.0),
+            "taker_quote": np.where(taker, quote, 0.0),
+            "first_id": first,
+            "last_id": last,
+            "count": last - first + 1,
+        }
+
+    def flush(self, now=None):
+        started = time.perf_counter()
+        now = now_ms() if now is None else now
+
+        cutoff = int(now - GRACE_MS) // 1000 * 1000
+
+        trades = self._take_trades()
+        self.trades += len(trades["symbol"])
+
+        with self.lock:
+            valid = np.array(self.valid_from, dtype=np.int64)
+
+        self._keep_for_minutes(trades, valid)
+
+        trades = concat_bars(self.carry, trades)
+
+        if self.cutoff is not None:
+            late = trades["open_time"] < self.cutoff
+            if late.any():
+                self.late_trades += int(late.sum())
+                trades = select(trades, ~late)
+
+        ready = trades["open_time"] < cutoff
+        self.carry = select(trades, ~ready)
+
+        # ------------------------------------------
+        # trades → 1s
+        # ------------------------------------------
+        seconds = self._complete(rollup(select(trades, ready), 1_000), valid)
+        self._emit("1s", seconds)
+        self.seconds = concat_bars(self.seconds, seconds)
+
+        # ------------------------------------------
+        # 1s → 5s / 15s (complete buckets only)
+        # ------------------------------------------
+        for tf, tf_ms in ROLLUPS:
+            complete_before = cutoff // tf_ms * tf_ms
+            since = self.emitted_until[tf]
+
+            mask = self.seconds["open_time"] < complete_before
+            if since is not None:
+                mask &= self.seconds["open_time"] >= since
+
+            self._emit(tf, self._complete(rollup(select(self.seconds, mask), tf_ms), valid))
+            self.emitted_until[tf] = complete_before if since is None else max(since, complete_before)
+
+        # 1s bars are kept until their largest bucket is emitted
+        self.seconds = select(self.seconds, self.seconds["open_time"] >= self.emitted_until[ROLLUPS[-1][0]])
+        self.cutoff = cutoff
+
+        # ------------------------------------------
+        # trades → 1m (settled minutes only)
+        # ------------------------------------------
+        self._emit_minutes(int(now - SETTLE_MS) // MINUTE_MS * MINUTE_MS, valid)
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+
+    def _keep_for_minutes(self, trades, valid):
+        """
+        Hold trades for their 1m bar; a trade of a minute that was
+        already emitted queues that minute for repair.
+        """
+        if not len(trades["symbol"]):
+            return
+
+        if self.minutes_until is not None:
+            late = trades["open_time"] < self.minutes_until
+
+            if late.any():
+                stale = select(trades, late)
+                minutes = stale["open_time"] // MINUTE_MS * MINUTE_MS
+                emitted = minutes >= valid[stale["symbol"]]
+
+                self._queue_repairs(set(zip(stale["symbol"][emitted].tolist(), minutes[emitted].tolist())))
+                trades = select(trades, ~late)
+
+                # the next minute continues after them
+                with self.lock:
+                    for idx, last in zip(stale["symbol"].tolist(), stale["last_id"].tolist()):
+                        last_id, minute = self.last_ids[idx]
+                        if 0 <= last_id < last:
+                            self.last_ids[idx] = (last, minute)
+
+        self.minute_trades.append(trades)
+
+    def _emit_minutes(self, before, valid):
+        if self.minutes_until is not None and before <= self.minutes_until:
+            return
+
+        trades = {
+            name: np.concatenate([chunk[name] for chunk in self.minute_trades] + [np.empty(0, dtype)])
+            for name, dtype in COLUMNS.items()
+        }
+
+        ready = trades["open_time"] < before
+        self.minute_trades = [select(trades, ~ready)]
+        self.minutes_until = before
+
+        trades = select(trades, ready)
+        if not len(trades["symbol"]):
+            return
+
+        with self.lock:
+            last_ids = list(self.last_ids)
+
+        broken, ends = broken_minutes(trades, last_ids)
+
+        with self.lock:
+            for idx, end in ends.items():
+                self.last_ids[idx] = end
+
+        bars = self._complete(rollup(trades, MINUTE_MS), valid)
+
+        if broken:
+            keep = np.array([
+                (idx, minute) not in broken
+                for idx, minute in zip(bars["symbol"].tolist(), bars["open_time"].tolist())
+            ], dtype=bool)
+            bars = select(bars, keep)
+
+            # only minutes the symbol was connected for
+            self._queue_repairs({(idx, m) for idx, m in broken if m >= valid[idx]})
+
+        self._emit("1m", bars)
+
+    def _queue_repairs(self, minutes):
+        if not minutes:
+            return
+
+        self.repairs += len(minutes)
+
+        # consecutive minutes of a symbol → one range
+        ranges = []
+        for idx, minute in sorted(minutes):
+            symbol = self.symbols[idx]
+            if ranges and ranges[-1][0] == symbol and ranges[-1][2] + MINUTE_MS == minute:
+                ranges[-1] = (symbol, ranges[-1][1], minute)
+            else:
+                ranges.append((symbol, minute, minute))
+
+        logger.warning("Queueing %d 1m bars with missing trades for repair", len(minutes))
+
+        if self.repair is not None:
+            self.repair("1m", ranges)
+
+    def _emit(self, tf, bars):
+        n = len(bars["symbol"])
+        if not n:
+            return
+
+        self.bars[tf] += n
+        names = [self.symbols[i] for i in bars["symbol"]]
+
+        if tf != "1m":
+            self.store.add_bars(tf, names, bars["open_time"], (
+                bars["open_time"],
+                bars["open"],
+                bars["high"],
+                bars["low"],
+                bars["close"],
+                bars["volume"],
+                bars["quote_volume"],
+                bars["count"],
+            ))
+            return
+
+        emitted_at = now_ms()
+
+        for i, symbol in enumerate(names):
+            open_time = int(bars["open_time"][i])
+
+            record = CandleRecord(
+                symbol,
+                "1m",
+                open_time,
+                open_time + 59_999,
+                int(emitted_at),
+                int(bars["first_id"][i]),
+                int(bars["last_id"][i]),
+                float(bars["open"][i]),
+                float(bars["high"][i]),
+                float(bars["low"][i]),
+                float(bars["close"][i]),
+                float(bars["volume"][i]),
+                float(bars["quote_volume"][i]),
+                float(bars["taker_base"][i]),
+                float(bars["taker_quote"][i]),
+                int(bars["count"][i]),
+                True,
+            )
+            record.received_at = emitted_at
+            record.parsed_at = emitted_at
+
+            if self.submit is not None:
+                self.submit(record)
+
+    def stats(self):
+        return {
+            "trades": self.trades,
+            "late_trades": self.late_trades,
+            "repairs": self.repairs,
+            "symbols": len(self.symbols),
+            "bars": dict(self.bars),
+            "carry": len(self.carry["symbol"]),
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+
+# --------------------------------------------------
+# Process-wide builder + flush loop
+# --------------------------------------------------
+builder = None
+RUNNING = True
+
+# registered at import so the shared-memory publisher sees them
+if TRADE_BARS_ENABLED:
+    for _tf, _tf_ms in SUB_MINUTE.items():
+        live_store.add_timeframe(_tf, _tf_ms)
+
+
+def get_builder():
+    global builder
+
+    if builder is None:
+        from app.binance.ws.handlers.tf.candle_common import submit
+        from app.binance.engine.gaps import repair_queue
+        builder = TradeBarBuilder(submit=submit, repair=repair_queue.add)
+
+    return builder
+
+
+def run():
+    """
+    Flush loop; run in its own thread next to the WS engine.
+    """
+    b = get_builder()
+    last_stats = time.monotonic()
+
+    logger.info("Trade bar builder started")
+
+    while RUNNING:
+        time.sleep(FLUSH_INTERVAL)
+
+        try:
+            b.flush()
+        except Exception:
+            logger.exception("Trade bar flush failed")
+
+        if time.monotonic() - last_stats >= STATS_INTERVAL:
+            logger.info("Trade bars | %s", b.stats())
+            last_stats = time.monotonic()
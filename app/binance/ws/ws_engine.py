@@ -1,3 +1,4 @@
+import os
 import websocket
 import json
 import time
@@ -5,22 +6,31 @@ import threading
 import signal
 
 from app.logging_config import get_logger, setup_logging
-from app.redis_client import redis_client
-from app.binance.ws.handlers import kline_handler
+from app.binance.universe import UniverseListener, load_universe
+from app.binance.ws.handlers import kline_handler, agg_trade_handler
+from app.binance.ws.subscriptions import SubscriptionManager
+from app.binance.ws.latency import now_ms
 from app.binance.ws.db_worker import run as db_run
+from app.binance.ws import trade_bars
 
 BASE_URL = "wss://fstream.binance.com/ws"
-REDIS_KEY = "liquid_coins"
+
+# full re-read of the universe key (pub/sub deltas can be missed)
+RECONCILE_INTERVAL = 60
+
+# "single" → one WebSocketApp with SUBSCRIBE messages (this module)
+# "sharded" → asyncio combined-stream shards (sharded_engine)
+WS_MODE = os.getenv("WS_MODE", "single")
 
 ws_app = None
 RUNNING = True
 
 current_symbols_list = []
 current_symbols_set = set()
+symbols_lock = threading.Lock()
 
 # INTERVALS = ["1m", "15m", "1h", "4h", "1d"]
 INTERVALS = ["1m"]
-request_id = 1
 setup_logging()
 logger = get_logger("market_data.binance.ws")
 
@@ -29,6 +39,7 @@ def shutdown_handler(sig, frame):
     global RUNNING, ws_app
     logger.info("Shutdown signal received", extra={"signal": sig})
     RUNNING = False
+    trade_bars.RUNNING = False
     if ws_app:
         ws_app.close()
 
@@ -38,68 +49,67 @@ signal.signal(signal.SIGTERM, shutdown_handler)
 
 
 def get_symbols():
-    data = redis_client.get(REDIS_KEY)
-    if not data:
+    coins = load_universe()
+    if not coins:
         logger.debug("Redis has no symbols yet")
         return []
 
-    coins = json.loads(data)
     logger.info("Loaded symbols from Redis: %d", len(coins))
     return coins
 
 
-def subscribe(ws, symbols):
-    global request_id
+def send_control(text):
+    if ws_app is None or ws_app.sock is None or not ws_app.sock.connected:
+        raise ConnectionError("WS not connected")
+    ws_app.send(text)
 
-    if not symbols:
-        logger.debug("No symbols to subscribe")
-        return
 
-    params = [f"{s.lower()}@kline_{tf}" for s in symbols for tf in INTERVALS]
+def on_confirm(method, params):
+    # trade bars of a symbol are complete from its confirmed SUBSCRIBE on
+    if method == "SUBSCRIBE" and trade_bars.TRADE_BARS_ENABLED:
+        trade_bars.get_builder().mark_connected([p.split("@")[0].upper() for p in params])
 
-    logger.info("SUBSCRIBE → %d streams", len(params))
 
-    ws.send(json.dumps({
-        "method": "SUBSCRIBE",
-        "params": params,
-        "id": request_id
-    }))
+subscriptions = SubscriptionManager(send_control, on_confirm)
 
-    request_id += 1
 
+def stream_params(symbols):
+    if trade_bars.TRADE_BARS_ENABLED:
+        return [f"{s.lower()}@aggTrade" for s in symbols]
+    return [f"{s.lower()}@kline_{tf}" for s in symbols for tf in INTERVALS]
 
-def unsubscribe(ws, symbols):
-    global request_id
 
-    params = [f"{s.lower()}@kline_{tf}" for s in symbols for tf in INTERVALS]
+def subscribe(symbols):
+    if not symbols:
+        logger.debug("No symbols to subscribe")
+        return
 
-    logger.info("UNSUBSCRIBE → %d streams", len(params))
+    subscriptions.subscribe(stream_params(symbols))
 
-    ws.send(json.dumps({
-        "method": "UNSUBSCRIBE",
-        "params": params,
-        "id": request_id
-    }))
 
-    request_id += 1
+def unsubscribe(symbols):
+    if symbols:
+        subscriptions.unsubscribe(stream_params(symbols))
 
 
 def on_message(ws, message):
+    received_at = now_ms()
+
     try:
         msg = json.loads(message)
     except Exception:
         logger.warning("Invalid JSON received")
         return
 
-    if "result" in msg:
-        print("[WS] Subscription ACK received")
+    if subscriptions.on_response(msg):
         return
 
-    if "e" not in msg:
-        return
+    event = msg.get("e")
 
-    # candle event received
-    kline_handler.handle(msg)
+    if event == "kline":
+        kline_handler.handle(msg, received_at)
+    elif event == "aggTrade":
+        agg_trade_handler.handle(msg, received_at)
 
 
 def on_open(ws):
@@ -107,39 +117,91 @@ def on_open(ws):
 
     logger.info("Connected to Binance")
 
-    current_symbols_list = get_symbols()
-    current_symbols_set = set(current_symbols_list)
+    with symbols_lock:
+        subscriptions.reset()
 
-    subscribe(ws, current_symbols_list)
+        current_symbols_list = get_symbols()
+        current_symbols_set = set(current_symbols_list)
+
+        subscribe(current_symbols_list)
 
 
 def on_close(ws, a, b):
     logger.info("Connection closed: %s %s", a, b)
 
 
-def watch_symbols():
+def apply_delta(added, removed):
     global current_symbols_list, current_symbols_set
-    logger.info("Symbol watcher started")
-
-    while RUNNING:
-        time.sleep(15)
 
-        new_list = get_symbols()
-        new_set = set(new_list)
-
-        to_add = new_set - current_symbols_set
-        to_remove = current_symbols_set - new_set
+    with symbols_lock:
+        to_add = [s for s in added if s not in current_symbols_set]
+        to_remove = [s for s in removed if s in current_symbols_set]
 
         if to_add:
             logger.info("Adding %d symbols", len(to_add))
-            subscribe(ws_app, list(to_add))
+            subscribe(to_add)
 
         if to_remove:
             logger.info("Removing %d symbols", len(to_remove))
-            unsubscribe(ws_app, list(to_remove))
+            unsubscribe(to_remove)
+
+        current_symbols_set = (current_symbols_set | set(to_add)) - set(to_remove)
+        current_symbols_list = sorted(current_symbols_set)
+
+
+def reconcile():
+    new_set = set(get_symbols())
+
+    with symbols_lock:
+        current = set(current_symbols_set)
 
-        current_symbols_list = new_list
-        current_symbols_set = new_set
+    apply_delta(sorted(new_set - current), sorted(current - new_set))
+
+
+def watch_symbols():
+    """
+    Apply universe deltas from Redis pub/sub as they arrive; the full
+    list is re-read every RECONCILE_INTERVAL seconds.
+    """
+    logger.info("Symbol watcher started")
+
+    listener = UniverseListener()
+    last_reconcile = time.monotonic()
+
+    while RUNNING:
+        delta = listener.wait(timeout=1.0)
+
+        try:
+            if delta:
+                logger.info(
+                    "Universe delta +%d -%d",
+                    len(delta.get("added", [])), len(delta.get("removed", [])),
+                )
+                apply_delta(delta.get("added", []), delta.get("removed", []))
+
+            if time.monotonic() - last_reconcile >= RECONCILE_INTERVAL:
+                reconcile()
+                last_reconcile = time.monotonic()
+
+        except Exception:
+            logger.exception("Symbol watcher error")
+
+    listener.close()
+
+
+def send_subscriptions():
+    """
+    Paced sender for SUBSCRIBE / UNSUBSCRIBE chunks.
+    """
+    last_stats = time.monotonic()
+
+    while RUNNING:
+        subscriptions.pump()
+        time.sleep(0.05)
+
+        if time.monotonic() - last_stats >= 60:
+            logger.info("Subscriptions | %s", subscriptions.stats())
+            last_stats = time.monotonic()
 
 
 def run():
@@ -150,6 +212,11 @@ def run():
 
     logger.info("Starting symbol watcher thread")
     threading.Thread(target=watch_symbols, daemon=True).start()
+    threading.Thread(target=send_subscriptions, daemon=True).start()
+
+    if trade_bars.TRADE_BARS_ENABLED:
+        logger.info("Starting trade bar builder (source=aggtrade)")
+        threading.Thread(target=trade_bars.run, daemon=True).start()
 
     while RUNNING:
         try:
@@ -172,5 +239,10 @@ def run():
 
 
 if __name__ == "__main__":
-    logger.info("WS Engine booting...")
-    run()
+    logger.info("WS Engine booting (mode=%s)...", WS_MODE)
+
+    if WS_MODE == "sharded":
+        from app.binance.ws import sharded_engine
+        sharded_engine.run()
+    else:
+        run()
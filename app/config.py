@@ -25,14 +25,18 @@ class Settings:
 
 settings = Settings()
 
+# "api": False → derived from candles_1m (engine/htf_engine.py) instead
+# of fetched from /fapi/v1/klines. DERIVE_HTF=0 fetches every TF again.
+DERIVE_HTF = os.getenv("DERIVE_HTF", "1") == "1"
+
 TIMEFRAMES = {
     "1m":  {"tf_ms": 60_000,        "table": "candles_1m",  "api": True},
     # "2m":  {"tf_ms": 120_000,       "table": "candles_2m",  "api": False},
-    "5m":  {"tf_ms": 300_000,       "table": "candles_5m",  "api": True},  # derived
-    "15m": {"tf_ms": 900_000,       "table": "candles_15m", "api": True},
-    "1h":  {"tf_ms": 3_600_000,     "table": "candles_1h",  "api": True},
-    "4h":  {"tf_ms": 14_400_000,    "table": "candles_4h",  "api": True},
-    "1d":  {"tf_ms": 86_400_000,    "table": "candles_1d",  "api": True},
+    "5m":  {"tf_ms": 300_000,       "table": "candles_5m",  "api": not DERIVE_HTF},
+    "15m": {"tf_ms": 900_000,       "table": "candles_15m", "api": not DERIVE_HTF},
+    "1h":  {"tf_ms": 3_600_000,     "table": "candles_1h",  "api": not DERIVE_HTF},
+    "4h":  {"tf_ms": 14_400_000,    "table": "candles_4h",  "api": not DERIVE_HTF},
+    "1d":  {"tf_ms": 86_400_000,    "table": "candles_1d",  "api": not DERIVE_HTF},
 }
 
 
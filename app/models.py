@@ -199,4 +199,24 @@ class Symbol(Base):
         server_default=func.now(),
         onupdate=func.now(),
         nullable=False
-    )
\ No newline at end of file
+    )
+
+# -------------------------------------------------
+# Coverage index: contiguous stored ranges per
+# (dataset, tf, symbol), see app.binance.coverage
+# -------------------------------------------------
+class Coverage(Base):
+    __tablename__ = "coverage"
+
+    dataset = Column(String(20), primary_key=True)
+    tf = Column(String(10), primary_key=True)
+    symbol = Column(String(20), primary_key=True)
+    start_time = Column(BigInteger, primary_key=True)
+
+    end_time = Column(BigInteger, nullable=False)
+
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
@@ -0,0 +1,204 @@
+"""
+Microbenchmark: per-message dict payloads vs CandleRecord on the
+WS hot path (handler → HTF aggregation → rows at flush).
+
+Each minute boundary is one burst of closed klines (all symbols),
+followed by a flush that builds DB rows and drops them.
+
+    python -m bench.candle_record [symbols] [minutes]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+from app.config import TIMEFRAMES
+from app.binance.candle_record import CandleRecord
+from app.binance.ws.batch_writer import CandleBatchWriter
+from app.binance.scripts.helpers import open_time_ms_to_ist
+
+HTF = [(tf, c["tf_ms"]) for tf, c in TIMEFRAMES.items() if tf != "1m"]
+
+# opt-in WS_GC_THRESHOLD compared with CPython's default
+RAISED_THRESHOLD = (20_000, 20, 20)
+
+
+def make_bursts(symbols, minutes):
+    base = 1_700_000_040_000 - (1_700_000_040_000 % 86_400_000)
+    bursts = []
+    for m in range(minutes):
+        t = base + m * 60_000
+        bursts.append([
+            {
+                "s": f"SYM{i}USDT", "i": "1m", "t": t, "T": t + 59_999,
+                "f": 1, "L": 2, "o": "1.0", "h": "1.2", "l": "0.9", "c": "1.1",
+                "v": "10", "q": "11", "V": "5", "Q": "5.5", "n": 7, "x": True,
+            }
+            for i in range(symbols)
+        ])
+    return bursts
+
+
+# --------------------------------------------------
+# Previous dict path
+# --------------------------------------------------
+def dict_minute(burst, state):
+    out = []
+
+    for k in burst:
+        p = {
+            "event_time": k["T"], "symbol": k["s"], "open_time": k["t"],
+            "lk_at": open_time_ms_to_ist(k["t"]), "interval": k["i"],
+            "close_time": k["T"], "first_trade_id": k["f"], "last_trade_id": k["L"],
+            "open_price": float(k["o"]), "high_price": float(k["h"]),
+            "low_price": float(k["l"]), "close_price": float(k["c"]),
+            "base_volume": float(k["v"]), "quote_volume": float(k["q"]),
+            "taker_buy_base_volume": float(k["V"]), "taker_buy_quote_volume": float(k["Q"]),
+            "trade_count": k["n"], "is_closed": k["x"],
+        }
+        out.append(p)
+
+        for tf, tf_ms in HTF:
+            bucket = (p["open_time"] // tf_ms) * tf_ms
+            s = state[tf].get(p["symbol"])
+            if not s or s["open_time"] != bucket:
+                if s:
+                    out.append(s)
+                state[tf][p["symbol"]] = {**p, "open_time": bucket, "interval": tf}
+                continue
+            s["high_price"] = max(s["high_price"], p["high_price"])
+            s["low_price"] = min(s["low_price"], p["low_price"])
+            s["close_price"] = p["close_price"]
+            s["base_volume"] += p["base_volume"]
+            s["quote_volume"] += p["quote_volume"]
+            s["taker_buy_base_volume"] += p["taker_buy_base_volume"]
+            s["taker_buy_quote_volume"] += p["taker_buy_quote_volume"]
+            s["trade_count"] += p["trade_count"]
+
+    # flush: payloads are already rows
+    return len(out)
+
+
+# --------------------------------------------------
+# CandleRecord path
+# --------------------------------------------------
+def record_minute(burst, state):
+    out = []
+
+    for k in burst:
+        r = CandleRecord.from_kline(k, k["T"])
+        out.append(r)
+
+        for tf, tf_ms in HTF:
+            bucket = (r.open_time // tf_ms) * tf_ms
+            s = state[tf].get(r.symbol)
+            if s is not None and s.open_time == bucket:
+                s.merge(r)
+                continue
+            if s is not None:
+                out.append(s)
+            state[tf][r.symbol] = r.start_bucket(tf, bucket, tf_ms)
+
+    # flush: rows built here and dropped with the batch
+    rows = [r.to_row() for r in out]
+    return len(rows)
+
+
+def run(fn, bursts):
+    state = {tf: {} for tf, _ in HTF}
+    for burst in bursts:
+        fn(burst, state)
+    return state
+
+
+gc_time = [0.0, 0, 0.0]  # total seconds, collections, start
+
+
+def on_gc(phase, info):
+    if phase == "start":
+        gc_time[2] = time.perf_counter()
+    else:
+        gc_time[0] += time.perf_counter() - gc_time[2]
+        gc_time[1] += 1
+
+
+def measure(name, fn, bursts):
+    messages = sum(len(b) for b in bursts)
+
+    gc.collect()
+    gc_time[0] = 0.0
+    gc_time[1] = 0
+    gc.callbacks.append(on_gc)
+
+    started = time.perf_counter()
+    state = run(fn, bursts)
+    elapsed = time.perf_counter() - started
+
+    gc.callbacks.remove(on_gc)
+    del state
+
+    # allocation volume per burst (peak) and steady-state retention
+    gc.collect()
+    tracemalloc.start()
+    state = {tf: {} for tf, _ in HTF}
+    peak_burst = 0
+    for burst in bursts:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn(burst, state)
+        peak_burst = max(peak_burst, tracemalloc.get_traced_memory()[1] - before)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(
+        f"{name:8s} {elapsed * 1e6 / messages:7.2f} us/msg  "
+        f"GCs={gc_time[1]:4d} ({gc_time[0] * 1e3:6.2f} ms)  "
+        f"burst peak={peak_burst / 1e3:8.1f} KB  "
+        f"agg state={retained / 1e3:8.1f} KB"
+    )
+
+
+def tracked_per_record(bursts):
+    """
+    Net GC-tracked allocations per record: build + buffer in the batch
+    writer (what drives gen0 collections on the hot path).
+    """
+    writer = CandleBatchWriter()
+    messages = sum(len(b) for b in bursts)
+
+    gc.collect()
+    gc.disable()
+    before = gc.get_count()[0]
+
+    records = [CandleRecord.from_kline(k, k["T"]) for burst in bursts for k in burst]
+    built = gc.get_count()[0]
+    for r in records:
+        writer.add(r)
+    buffered = gc.get_count()[0]
+
+    gc.enable()
+    print(f"tracked allocations/record: build {(built - before) / messages:.2f}  buffer {(buffered - built) / messages:.2f}")
+
+
+def main():
+    symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    minutes = int(sys.argv[2]) if len(sys.argv) > 2 else 240
+
+    bursts = make_bursts(symbols, minutes)
+    print(f"{symbols} symbols x {minutes} minute boundaries")
+
+    default = gc.get_threshold()
+
+    for threshold in (default, RAISED_THRESHOLD):
+        gc.set_threshold(*threshold)
+        print(f"gc threshold {threshold}")
+        measure("dict", dict_minute, bursts)
+        measure("record", record_minute, bursts)
+
+    gc.set_threshold(*default)
+
+    tracked_per_record(bursts[:10])
+
+
+if __name__ == "__main__":
+    main()
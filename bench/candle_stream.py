@@ -0,0 +1,86 @@
+"""
+Benchmark: candle stream publisher throughput against the configured
+Redis — one XADD round trip per candle vs pipelined flushes of
+minute-boundary sized batches. Uses "bench:candles:*" keys and
+deletes them afterwards.
+
+    python -m bench.candle_stream [candles] [batch]
+"""
+import sys
+import time
+
+from app.redis_client import redis_client
+from app.binance.candle_record import CandleRecord
+from app.binance.ws.candle_stream import (
+    STREAM_MAXLEN,
+    CandleStreamPublisher,
+    stream_key,
+    to_fields,
+)
+
+PREFIX = "bench:candles"
+TIMEFRAMES = ("1m", "5m", "15m", "1h")
+
+
+def make_records(count):
+    base = 1_700_000_040_000
+    return [
+        CandleRecord(
+            f"SYM{i % 300}USDT", TIMEFRAMES[i % len(TIMEFRAMES)],
+            base, base + 59_999, base + 60_000, 1, 2,
+            1.0, 1.2, 0.9, 1.1, 10.0, 11.0, 5.0, 5.5, 7, True,
+        )
+        for i in range(count)
+    ]
+
+
+def cleanup():
+    redis_client.delete(*(stream_key(tf, PREFIX) for tf in TIMEFRAMES))
+
+
+def single(records):
+    for record in records:
+        redis_client.xadd(
+            stream_key(record.interval, PREFIX),
+            to_fields(record),
+            maxlen=STREAM_MAXLEN,
+            approximate=True,
+        )
+
+
+def pipelined(records, batch):
+    publisher = CandleStreamPublisher(prefix=PREFIX)
+
+    for i in range(0, len(records), batch):
+        for record in records[i:i + batch]:
+            publisher.add(record)
+        publisher.flush()
+
+    return publisher
+
+
+def measure(name, fn, count):
+    cleanup()
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{name:22s} {count / elapsed:12,.0f} candles/s  ({elapsed * 1e3:8.1f} ms)")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    batch = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    records = make_records(count)
+    print(f"{count} candles, MAXLEN~{STREAM_MAXLEN}")
+
+    try:
+        measure("XADD per candle", lambda: single(records), count)
+        measure(f"pipelined batch={batch}", lambda: pipelined(records, batch), count)
+        measure(f"pipelined batch={count}", lambda: pipelined(records, count), count)
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
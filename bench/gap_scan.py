@@ -0,0 +1,63 @@
+"""
+Benchmark: data_health gap scan over one symbol's open_time history.
+Compares the former per-row Python loop with scan_gaps() over numpy
+chunks (as streamed from the server-side cursor) and checks both find
+the same gaps. Synthetic data; nothing is read from the DB.
+
+    python -m bench.gap_scan [days] [holes]
+"""
+import sys
+import time
+
+import numpy as np
+
+from app.binance.scripts.data_health import SCAN_CHUNK_ROWS, scan_gaps
+
+TF_MS = 60_000
+BASE = 1_700_000_040_000  # minute aligned
+
+
+def make_history(days, holes):
+    rng = np.random.default_rng(7)
+
+    times = BASE + np.arange(days * 1440, dtype=np.int64) * TF_MS
+    drop = rng.choice(len(times) - 2, holes, replace=False) + 1
+    return np.delete(times, drop)
+
+
+def loop_gaps(timestamps):
+    gaps = []
+
+    for i in range(1, len(timestamps)):
+        if timestamps[i] - timestamps[i - 1] != TF_MS:
+            gaps.append(timestamps[i - 1] + TF_MS)
+
+    return gaps
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    holes = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    times = make_history(days, holes)
+    print(f"rows={len(times):,} holes={holes}")
+
+    as_rows = times.tolist()
+    started = time.perf_counter()
+    expected = loop_gaps(as_rows)
+    loop_sec = time.perf_counter() - started
+
+    chunks = [times[i:i + SCAN_CHUNK_ROWS] for i in range(0, len(times), SCAN_CHUNK_ROWS)]
+    started = time.perf_counter()
+    gaps, misaligned = scan_gaps(chunks, TF_MS)
+    numpy_sec = time.perf_counter() - started
+
+    assert [start for start, _ in gaps] == expected and not misaligned
+
+    print(f"python loop : {loop_sec * 1000:8.1f} ms")
+    print(f"numpy chunks: {numpy_sec * 1000:8.1f} ms  ({loop_sec / numpy_sec:.0f}x)")
+    print(f"gaps={len(gaps)} missing={sum((e - s) // TF_MS + 1 for s, e in gaps)}")
+
+
+if __name__ == "__main__":
+    main()
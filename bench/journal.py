@@ -0,0 +1,90 @@
+"""
+Benchmark: candle journal append latency (WS handler side) and
+replay throughput (DB writer side, incl. CandleRecord decode).
+
+Runs in a temporary directory with the production segment size.
+
+    python -m bench.journal [records]
+"""
+import sys
+import time
+import tempfile
+
+from app.binance.candle_record import CandleRecord
+from app.binance.ws.journal import CandleJournal
+
+
+def make_record(i):
+    t = 1_700_000_040_000 + (i // 300) * 60_000
+    return CandleRecord(
+        f"SYM{i % 300}USDT", "1m", t, t + 59_999, t + 60_000,
+        1, 2, 1.0, 1.2, 0.9, 1.1, 10.0, 11.0, 5.0, 5.5, 7, True,
+    )
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    payloads = [make_record(i).to_bytes() for i in range(records)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = CandleJournal(directory)
+
+        # ------------------------------------------
+        # Append
+        # ------------------------------------------
+        latencies = []
+        started = time.perf_counter()
+
+        for payload in payloads:
+            t0 = time.perf_counter_ns()
+            journal.append(payload)
+            latencies.append(time.perf_counter_ns() - t0)
+
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+
+        print(f"{records} records x {len(payloads[0])} bytes")
+        print(
+            f"append   {records / elapsed:12,.0f} rec/s  "
+            f"p50={percentile(latencies, 0.50) / 1e3:6.2f} us  "
+            f"p99={percentile(latencies, 0.99) / 1e3:6.2f} us  "
+            f"max={latencies[-1] / 1e3:8.2f} us"
+        )
+
+        journal.sync()
+        journal.close()
+
+        # ------------------------------------------
+        # Replay (fresh open → recovery scan + read + decode)
+        # ------------------------------------------
+        started = time.perf_counter()
+        journal = CandleJournal(directory)
+        opened = time.perf_counter() - started
+
+        replayed = 0
+        started = time.perf_counter()
+
+        while True:
+            batch = journal.read(2000)
+            if not batch:
+                break
+            for data in batch:
+                CandleRecord.from_bytes(data)
+            replayed += len(batch)
+            journal.commit()
+
+        elapsed = time.perf_counter() - started
+
+        print(f"open     {opened * 1e3:10.1f} ms (recovery scan)")
+        print(f"replay   {replayed / elapsed:12,.0f} rec/s  ({replayed} records, commit per 2000)")
+
+        journal.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: shared-memory candle reader vs a plain numpy copy of the
+same block, plus publish cost. The reader runs in a separate
+interpreter, as a scanner would.
+
+    python -m bench.shm_candles [symbols] [bars]
+"""
+import sys
+import time
+import subprocess
+
+import numpy as np
+
+from app.binance.candle_record import CandleRecord
+from app.binance.ws.live_store import LiveCandleStore
+from app.binance.ws.shm_candles import CandleShmPublisher, CandleShmReader
+
+TF = "1m"
+ROUNDS = 200
+
+
+def fill(store, symbols, bars):
+    base = 1_700_000_040_000
+    for b in range(bars):
+        t = base + b * 60_000
+        for i in range(symbols):
+            store.add(CandleRecord(
+                f"SYM{i}USDT", TF, t, t + 59_999, t, 1, 2,
+                1.0, 1.2, 0.9, 1.1, 10.0, 11.0, 5.0, 5.5, 7, True,
+            ))
+
+
+def timed(fn):
+    samples = []
+    for _ in range(ROUNDS):
+        t0 = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - t0)
+    samples.sort()
+    return samples[len(samples) // 2] / 1e3, samples[int(len(samples) * 0.99)] / 1e3
+
+
+def report(name, nbytes, p50, p99):
+    size = f"{nbytes / 1e6:7.2f} MB" if nbytes else ""
+    print(f"{name:18s} {size:>10s}  p50={p50:8.1f} us  p99={p99:8.1f} us", flush=True)
+
+
+def reader():
+    r = CandleShmReader(TF)
+
+    report("read all fields", r.read()[1].nbytes, *timed(r.read))
+    report("read close_price", r.read("close_price")[1].nbytes, *timed(lambda: r.read("close_price")))
+
+    r.close()
+
+
+def main():
+    symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    bars = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    store = LiveCandleStore(bars=bars, timeframes={TF: {"tf_ms": 60_000}})
+    fill(store, symbols, bars)
+
+    publisher = CandleShmPublisher(store, capacity=max(symbols, 1))
+    publisher.publish(TF)
+
+    print(f"{symbols} symbols x {bars} bars")
+
+    report("publish", 0, *timed(lambda: publisher.publish(TF)))
+
+    # baseline: in-process copy of an equally sized block
+    _, view = store.window(TF)
+    baseline = np.ascontiguousarray(view)
+    report("np.copy baseline", baseline.nbytes, *timed(baseline.copy))
+
+    subprocess.run([sys.executable, "-m", "bench.shm_candles", "--read"], check=True)
+
+    publisher.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--read"]:
+        reader()
+    else:
+        main()
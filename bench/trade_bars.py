@@ -0,0 +1,141 @@
+"""
+Benchmark: aggTrade → 1s/5s/15s/1m bar builder on a synthetic
+firehose. Measures the handler append rate and the vectorized flush
+rate, and checks the 1m bars against a direct per-minute aggregation
+of the same trades (none may be queued for repair: trade ids are
+consecutive per symbol). Runs against a private LiveCandleStore; nothing is
+written to the DB.
+
+    python -m bench.trade_bars [trades] [symbols]
+"""
+import sys
+import time
+
+import numpy as np
+
+from app.binance.ws.live_store import LiveCandleStore
+from app.binance.ws.trade_bars import FLUSH_INTERVAL, GRACE_MS, SETTLE_MS, TradeBarBuilder
+
+BASE = 1_700_000_040_000  # minute aligned
+MINUTES = 3
+
+
+def make_trades(count, symbols):
+    rng = np.random.default_rng(7)
+
+    times = np.sort(rng.integers(BASE, BASE + MINUTES * 60_000, count))
+    symbol = rng.integers(0, symbols, count)
+    price = np.round(100 + rng.standard_normal(count).cumsum() * 0.01, 4)
+    qty = np.round(rng.random(count) * 3, 3) + 0.001
+    maker = rng.random(count) < 0.5
+    trades_per_agg = rng.integers(1, 4, count)
+
+    # trade ids run per symbol
+    last = np.empty(count, dtype=np.int64)
+    for sym in range(symbols):
+        mask = symbol == sym
+        last[mask] = trades_per_agg[mask].cumsum()
+    first = last - trades_per_agg + 1
+
+    return [
+        {
+            "e": "aggTrade",
+            "s": f"SYM{symbol[i]}USDT",
+            "a": i,
+            "p": str(price[i]),
+            "q": str(qty[i]),
+            "f": int(first[i]),
+            "l": int(last[i]),
+            "T": int(times[i]),
+            "m": bool(maker[i]),
+        }
+        for i in range(count)
+    ]
+
+
+def expected_minutes(trades):
+    bars = {}
+
+    for t in trades:
+        key = (t["s"], t["T"] // 60_000 * 60_000)
+        p, q = float(t["p"]), float(t["q"])
+        bar = bars.get(key)
+
+        if bar is None:
+            bars[key] = bar = {"open": p, "high": p, "low": p, "volume": 0.0, "count": 0}
+
+        bar["high"] = max(bar["high"], p)
+        bar["low"] = min(bar["low"], p)
+        bar["close"] = p
+        bar["volume"] += q
+        bar["count"] += t["l"] - t["f"] + 1
+
+    return bars
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    symbols = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    trades = make_trades(count, symbols)
+    minutes = []
+    repairs = []
+
+    builder = TradeBarBuilder(
+        store=LiveCandleStore(),
+        submit=minutes.append,
+        repair=lambda tf, ranges: repairs.extend(ranges),
+    )
+    builder.mark_connected([f"SYM{i}USDT" for i in range(symbols)], BASE - 1_000)
+
+    print(f"{count:,} trades, {symbols} symbols, {MINUTES} minutes")
+
+    # replay in FLUSH_INTERVAL slices of exchange time
+    step = int(FLUSH_INTERVAL * 1000)
+    times = np.array([t["T"] for t in trades])
+    add_time = flush_time = 0.0
+    flushes = 0
+    start = 0
+
+    for now in range(BASE + step, BASE + MINUTES * 60_000 + SETTLE_MS + 2 * step, step):
+        end = int(np.searchsorted(times, now))
+
+        started = time.perf_counter()
+        for t in trades[start:end]:
+            builder.add_trade(t)
+        add_time += time.perf_counter() - started
+        start = end
+
+        started = time.perf_counter()
+        builder.flush(now + GRACE_MS)
+        flush_time += time.perf_counter() - started
+        flushes += 1
+
+    print(f"add_trade      {count / add_time:12,.0f} trades/s")
+    print(f"flush          {count / flush_time:12,.0f} trades/s  "
+          f"({flushes} flushes, avg {flush_time / flushes * 1e3:.2f} ms, "
+          f"max {builder.max_flush_ms:.2f} ms)")
+    print(f"bars           {builder.stats()['bars']}")
+
+    expected = expected_minutes(trades)
+    mismatches = 0
+
+    for record in minutes:
+        bar = expected.pop((record.symbol, record.open_time), None)
+        if (
+            bar is None
+            or record.open_price != bar["open"]
+            or record.close_price != bar["close"]
+            or record.high_price != bar["high"]
+            or record.low_price != bar["low"]
+            or record.trade_count != bar["count"]
+            or abs(record.base_volume - bar["volume"]) > 1e-6
+        ):
+            mismatches += 1
+
+    print(f"1m check       {len(minutes)} bars, {mismatches} mismatched, {len(expected)} missing, "
+          f"{len(repairs)} queued for repair")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
+import time
 import numpy as np
+from collections import namedtuple
 from sqlalchemy import text
 from app.db import SessionLocal
+from app.config import TIMEFRAMES
+from app.binance.ws.live_store import FIELD_INDEX
+from app.binance.ws.shm_candles import CandleShmReader
 
 
 # ------------------------------------------------
@@ -11,10 +16,14 @@ PRICE_MOVE_THRESHOLD = 1.5     # %
 ATR_PERIOD = 14
 VOLUME_SPIKE = 1.2
 CANDLE_LIMIT = 50
+MIN_CANDLES = 30
 MOMENTUM_LOOKBACK = 6
 DISPLACEMENT_MULT = 1.2
 MIN_SCORE = 2
 
+# shared memory lagging the last closed bar by more than this → DB
+SHARED_TOLERANCE_MS = 120_000
+
 
 # ------------------------------------------------
 # Fetch candles
@@ -33,6 +42,80 @@ def fetch_candles(db, table, symbol):
     return rows[::-1]
 
 
+# ------------------------------------------------
+# Shared memory (ingest process)
+# ------------------------------------------------
+
+Candle = namedtuple("Candle", "close_price high_price low_price base_volume")
+
+
+def load_shared(tf):
+    """
+    {symbol: rows} of the last CANDLE_LIMIT bars published by the
+    WS engine, or None when it is not running, busy, or stale (a
+    crashed ingest process leaves its segment behind, frozen).
+    """
+    try:
+        reader = CandleShmReader(tf)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    try:
+        symbols, block = reader.read(bars=CANDLE_LIMIT)
+    except RuntimeError as e:
+        print(f"[SCAN] shared memory {tf}: {e}")
+        return None
+    finally:
+        reader.close()
+
+    if not is_fresh(tf, reader.open_time, reader.published_at):
+        print(f"[SCAN] shared memory {tf} is stale (last bar {reader.open_time})")
+        return None
+
+    block = block[[FIELD_INDEX[f] for f in Candle._fields]]
+    candles = {}
+
+    for i, symbol in enumerate(symbols):
+        values = block[:, i, :]
+        values = values[:, ~np.isnan(values[0])]
+        candles[symbol] = [Candle(*bar) for bar in values.T.tolist()]
+
+    return candles
+
+
+def is_fresh(tf, open_time, published_at, now_ms=None):
+    """
+    True if the segment holds the last closed bar, or the one before
+    it within SHARED_TOLERANCE_MS of its close (publish lag), and was
+    published since.
+    """
+    if open_time is None or published_at is None:
+        return False
+
+    tf_ms = TIMEFRAMES[tf]["tf_ms"]
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+
+    last_closed = now_ms // tf_ms * tf_ms - tf_ms
+
+    if open_time < last_closed and now_ms - (last_closed + tf_ms) > SHARED_TOLERANCE_MS:
+        return False
+
+    # the publisher writes at least once per closed bar
+    return now_ms - published_at <= tf_ms + SHARED_TOLERANCE_MS
+
+
+def candles_for(shared, db, table, symbol):
+    """
+    Shared rows if there are enough of them, else the DB.
+    """
+    rows = shared.get(symbol)
+
+    if rows is None or len(rows) < MIN_CANDLES:
+        rows = fetch_candles(db, table, symbol)
+
+    return rows
+
+
 # ------------------------------------------------
 # Price momentum
 # ------------------------------------------------
@@ -131,16 +214,21 @@ def run_scanner():
 
         print(f"[SCAN] scanning {len(symbols)} symbols")
 
+        shared_1h = load_shared("1h") or {}
+        shared_15m = load_shared("15m") or {}
+
+        print(f"[SCAN] shared memory: 1h={len(shared_1h)} 15m={len(shared_15m)} symbols")
+
         watchlist = []
 
         for symbol in symbols:
 
             try:
 
-                candles_1h = fetch_candles(db, "candles_1h", symbol)
-                candles_15m = fetch_candles(db, "candles_15m", symbol)
+                candles_1h = candles_for(shared_1h, db, "candles_1h", symbol)
+                candles_15m = candles_for(shared_15m, db, "candles_15m", symbol)
 
-                if len(candles_1h) < 30 or len(candles_15m) < 30:
+                if len(candles_1h) < MIN_CANDLES or len(candles_15m) < MIN_CANDLES:
                     continue
 
                 move = price_move(candles_1h)
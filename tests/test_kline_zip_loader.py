@@ -0,0 +1,91 @@
+"""
+kline_zip_loader decoding against build_payloads, on fixture ZIPs in
+the Binance public-data layout (no database needed).
+
+    python -m pytest tests
+"""
+import csv
+import io
+import os
+import zipfile
+
+import pytest
+
+from app.binance.payload_builder import build_payloads
+from app.binance.scripts import kline_zip_loader as loader
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "klines")
+
+
+def rest_klines(path):
+    """
+    The ZIP's CSV rows as /fapi/v1/klines returns them: times and
+    trade count as ints, prices and volumes as strings.
+    """
+    with zipfile.ZipFile(path) as zf:
+        text = zf.read(zf.namelist()[0]).decode()
+
+    klines = []
+    for row in csv.reader(io.StringIO(text)):
+        if not row[0].isdigit():
+            continue  # header
+        klines.append([
+            int(row[0]), *row[1:6], int(row[6]), row[7], int(row[8]), *row[9:]
+        ])
+
+    return klines
+
+
+def load(path, chunk_rows=loader.LOADER_CHUNK_ROWS):
+    symbol, tf = loader.parse_name(path)
+    return [
+        payload
+        for frame in loader.iter_frames(path, chunk_rows)
+        for payload in loader.frame_payloads(symbol, tf, frame)
+    ]
+
+
+@pytest.mark.parametrize("name", ["BTCUSDT-1m-2024-01.zip", "ETHUSDT-1m-2024-02-01.zip"])
+@pytest.mark.parametrize("chunk_rows", [7, loader.LOADER_CHUNK_ROWS])
+def test_payloads_match_build_payloads(name, chunk_rows):
+    path = os.path.join(FIXTURES, name)
+    symbol, tf = loader.parse_name(path)
+
+    expected = build_payloads(symbol, tf, rest_klines(path))
+    payloads = load(path, chunk_rows)
+
+    assert len(payloads) == 30
+    assert payloads == expected
+
+    for payload, reference in zip(payloads, expected):
+        assert {k: type(v) for k, v in payload.items()} == {k: type(v) for k, v in reference.items()}
+        assert payload["lk_at"].utcoffset() == reference["lk_at"].utcoffset()
+
+
+def test_microsecond_timestamps(tmp_path):
+    source = os.path.join(FIXTURES, "BTCUSDT-1m-2024-01.zip")
+    klines = rest_klines(source)
+
+    lines = []
+    for k in klines:
+        k = list(k)
+        k[0] = k[0] * 1000
+        k[6] = k[6] * 1000 + 999
+        lines.append(",".join(map(str, k)))
+
+    path = tmp_path / "BTCUSDT-1m-2025-01.zip"
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("BTCUSDT-1m-2025-01.csv", "\n".join(lines) + "\n")
+
+    assert load(str(path)) == build_payloads("BTCUSDT", "1m", klines)
+
+
+def test_find_archives(tmp_path):
+    for name in ("BTCUSDT-1m-2024-01.zip", "BTCUSDT-7x-2024-01.zip", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+
+    found = loader.find_archives(str(tmp_path))
+
+    assert [(os.path.basename(p), s, tf) for p, s, tf in found] == [
+        ("BTCUSDT-1m-2024-01.zip", "BTCUSDT", "1m"),
+    ]
@@ -0,0 +1,83 @@
+"""
+1m bars of the aggTrade builder: exact when trades arrive late,
+withheld and queued for repair when trades are missing (no database
+or Redis needed).
+
+    python -m pytest tests
+"""
+from app.binance.ws.live_store import LiveCandleStore
+from app.binance.ws.trade_bars import GRACE_MS, SETTLE_MS, TradeBarBuilder
+
+BASE = 1_700_000_040_000  # minute aligned
+
+
+def trade(agg_id, t, price, symbol="BTCUSDT"):
+    return {"s": symbol, "a": agg_id, "p": str(price), "q": "1", "f": agg_id, "l": agg_id, "T": t, "m": False}
+
+
+def builder():
+    minutes, repairs = [], []
+
+    b = TradeBarBuilder(
+        store=LiveCandleStore(timeframes={}),
+        submit=minutes.append,
+        repair=lambda tf, ranges: repairs.extend((tf, *r) for r in ranges),
+    )
+    b.mark_connected(["BTCUSDT"], BASE - 1_000)
+
+    return b, minutes, repairs
+
+
+def settle(b, minute):
+    b.flush(minute + 60_000 + SETTLE_MS)
+
+
+def test_late_trade_inside_settle_window():
+    b, minutes, repairs = builder()
+
+    b.add_trade(trade(1, BASE + 1_000, 100))
+    b.add_trade(trade(3, BASE + 59_000, 103))
+    b.flush(BASE + 60_000 + GRACE_MS)
+
+    # after its second was aggregated, before the minute settled
+    b.add_trade(trade(2, BASE + 59_500, 105))
+    settle(b, BASE)
+
+    assert b.late_trades == 1
+    assert repairs == []
+    [bar] = minutes
+    assert (bar.open_price, bar.high_price, bar.close_price) == (100, 105, 103)
+    assert (bar.trade_count, bar.first_trade_id, bar.last_trade_id) == (3, 1, 3)
+
+
+def test_missing_trade_ids_withhold_the_minute():
+    b, minutes, repairs = builder()
+
+    b.add_trade(trade(1, BASE + 1_000, 100))
+    b.add_trade(trade(2, BASE + 2_000, 101))
+    settle(b, BASE)
+
+    b.add_trade(trade(5, BASE + 60_000 + 1_000, 102))
+    b.add_trade(trade(6, BASE + 60_000 + 2_000, 103))
+    b.add_trade(trade(8, BASE + 60_000 + 3_000, 104))
+    settle(b, BASE + 60_000)
+
+    assert [bar.open_time for bar in minutes] == [BASE]
+    # ids 3-4 may belong to either minute
+    assert repairs == [("1m", "BTCUSDT", BASE, BASE + 60_000)]
+
+
+def test_trade_after_settle_queues_emitted_minute():
+    b, minutes, repairs = builder()
+
+    b.add_trade(trade(1, BASE + 1_000, 100))
+    b.add_trade(trade(3, BASE + 2_000, 101))
+    b.add_trade(trade(2, BASE + 1_500, 101))
+    settle(b, BASE)
+
+    b.add_trade(trade(4, BASE + 3_000, 99))
+    b.add_trade(trade(5, BASE + 60_000 + 1_000, 100))
+    settle(b, BASE + 60_000)
+
+    assert [bar.open_time for bar in minutes] == [BASE, BASE + 60_000]
+    assert repairs == [("1m", "BTCUSDT", BASE, BASE)]